@@ -3,26 +3,40 @@ Stroke Prediction Web Application
 Flask backend with Authentication, History, Food Recommendations, and Medication Reminders
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_file
+from flask import (Flask, Response, render_template, request, jsonify, redirect, url_for, session, send_file,
+                   stream_with_context)
 import joblib
-import pandas as pd
 import numpy as np
 import os
 import json
 import io
 from datetime import datetime
 from functools import wraps
-import re
-from fpdf import FPDF
+from itertools import islice
+import inspect
+from fpdf import FPDF_VERSION
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import credentials, auth as firebase_auth
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 import atexit
+import threading
+import secrets
+from tree_ensemble import load_fused_ensemble
+from storage import new_counters
+from prediction_cache import KEY_FIELDS, PredictionCache, normalize_patient, directory_fingerprint
+from report_cache import ReportCache, content_key
+import reports
+import sanitizer
+from report_export import member_name, safe_name, stream_zip
+from report_jobs import ReportJobs
+import services
+from services import (DATA_PATH, REMINDER_MODES, outbox, reminder_engine, reminder_mode, scheduler_lease,
+                      send_login_notification, storage)
+from reminders import AlertFeed, medication_alerts
+from recommendations import (get_food_recommendations, get_doctor_recommendations,
+                             get_indian_food_recommendations, recommend_batch)
+from features import (FEATURE_NAMES, INPUT_FIELDS, NUMERIC_FIELDS, FLAG_FIELDS, CATEGORICAL_MAPPINGS,
+                      build_features, columns_from_records)
 
 # Load environment variables
 load_dotenv()
@@ -47,18 +61,6 @@ print(f"  API Key: {'✓ Present' if FIREBASE_CONFIG['api_key'] else '✗ Missin
 print(f"  Auth Domain: {FIREBASE_CONFIG['auth_domain']}")
 print(f"  Project ID: {FIREBASE_CONFIG['project_id']}")
 
-# Email configuration from environment variables
-EMAIL_CONFIG = {
-    'sender': os.getenv('EMAIL_SENDER', '').strip(),
-    'password': os.getenv('EMAIL_PASSWORD', '').strip(),
-    'smtp_server': os.getenv('SMTP_SERVER', 'smtp.gmail.com').strip(),
-    'smtp_port': int(os.getenv('SMTP_PORT', '587'))
-}
-
-print("\nEmail Config loaded:")
-print(f"  Sender: {'✓ Present' if EMAIL_CONFIG['sender'] else '✗ Missing'}")
-print(f"  SMTP Server: {EMAIL_CONFIG['smtp_server']}:{EMAIL_CONFIG['smtp_port']}")
-
 # Initialize Firebase Admin SDK (for server-side verification)
 try:
     # Using default credentials or application default
@@ -73,310 +75,116 @@ except Exception as e:
     print(f"Firebase Admin initialization skipped: {e}")
     print("Using client-side Firebase authentication only")
 
-# File paths for JSON storage
-DATA_PATH = 'data'
-USERS_FILE = os.path.join(DATA_PATH, 'users.json')
-RESULTS_FILE = os.path.join(DATA_PATH, 'results.json')
-MEDICATIONS_FILE = os.path.join(DATA_PATH, 'medications.json')
-
-# Create data directory if not exists
-if not os.path.exists(DATA_PATH):
-    os.makedirs(DATA_PATH)
-
-# Initialize JSON files if they don't exist
-def init_json_files():
-    # Initialize users file as empty (all auth is Firebase-only)
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'w') as f:
-            json.dump({}, f, indent=4)
-    
-    if not os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE, 'w') as f:
-            json.dump({}, f)
-    
-    if not os.path.exists(MEDICATIONS_FILE):
-        with open(MEDICATIONS_FILE, 'w') as f:
-            json.dump({}, f)
-
-init_json_files()
-
-# Helper function to remove emojis and special Unicode characters for PDF
-def remove_emojis(text):
-    """Remove emojis and non-latin characters from text for PDF compatibility"""
-    # Remove emojis and other unicode symbols
-    emoji_pattern = re.compile("["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        u"\U00002702-\U000027B0"
-        u"\U000024C2-\U0001F251"
-        u"\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-        u"\U0001FA00-\U0001FA6F"  # Chess Symbols
-        u"\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-        u"\U00002600-\U000026FF"  # Miscellaneous Symbols
-        u"\U00002B50"  # star
-        u"\U0001F004"  # mahjong
-        "]+", flags=re.UNICODE)
-    text = emoji_pattern.sub('', text)
-    # Remove any remaining non-ASCII characters except common punctuation
-    text = text.encode('ascii', 'ignore').decode('ascii')
-    # Clean up extra spaces
-    text = ' '.join(text.split())
-    return text.strip()
+# History reports are cached by content; the key includes a hash of the code that
+# draws them, so editing the report layout (or upgrading fpdf) invalidates them all
+REPORT_TEMPLATE_VERSION = content_key(FPDF_VERSION, inspect.getsource(reports), inspect.getsource(sanitizer))
+report_cache = ReportCache(os.path.abspath(os.getenv('REPORT_CACHE_DIR', os.path.join(DATA_PATH, 'report_cache'))),
+                           disk_max_bytes=int(os.getenv('REPORT_CACHE_MAX_MB', '200')) * 1024 * 1024,
+                           memory_max_bytes=int(os.getenv('REPORT_CACHE_MEMORY_MB', '32')) * 1024 * 1024)
+
+# PDF reports are drawn in a process pool, off the request threads.  Jobs in
+# flight are capped in total and per user; beyond that requests get a 429.
+# The pool forks here, before the models are loaded and any thread is started.
+report_jobs = ReportJobs(report_cache, workers=int(os.getenv('REPORT_WORKERS', '2')),
+                         max_pending=int(os.getenv('REPORT_MAX_PENDING', '8')),
+                         max_per_user=int(os.getenv('REPORT_MAX_PER_USER', '2')))
+report_jobs.start()
+atexit.register(report_jobs.stop)
+# Seconds a classic download link waits for its PDF before redirecting to a page that polls
+REPORT_LINK_WAIT_SECONDS = float(os.getenv('REPORT_LINK_WAIT_SECONDS', '2'))
+# Bulk exports (admin): reports per archive, and archives streaming at once
+MAX_EXPORT_REPORTS = int(os.getenv('MAX_EXPORT_REPORTS', '5000'))
+export_slots = threading.BoundedSemaphore(int(os.getenv('MAX_CONCURRENT_EXPORTS', '1')))
 
 # Load models at startup
 MODEL_PATH = 'saved_models'
 
-try:
-    model_A = joblib.load(os.path.join(MODEL_PATH, 'stroke_model_A_original.pkl'))
-    model_B = joblib.load(os.path.join(MODEL_PATH, 'stroke_model_B_synthetic.pkl'))
-    feature_info = joblib.load(os.path.join(MODEL_PATH, 'feature_info.pkl'))
-    print("✅ Models loaded successfully!")
-except Exception as e:
-    print(f"❌ Error loading models: {e}")
-    model_A = None
-    model_B = None
-    feature_info = None
-
-# Helper functions for JSON operations
-def load_users():
-    with open(USERS_FILE, 'r') as f:
-        return json.load(f)
-
-def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
-
-def load_results():
-    with open(RESULTS_FILE, 'r') as f:
-        return json.load(f)
-
-def save_results(results):
-    with open(RESULTS_FILE, 'w') as f:
-        json.dump(results, f, indent=4)
-
-def load_medications():
-    with open(MEDICATIONS_FILE, 'r') as f:
-        return json.load(f)
-
-def save_medications(medications):
-    with open(MEDICATIONS_FILE, 'w') as f:
-        json.dump(medications, f, indent=4)
-
-# Email notification functions
-def send_email(recipient_email, subject, body):
-    """Send email notification"""
+# Members of the prediction ensemble (add an entry to score another model in the same pass)
+ENSEMBLE_MODELS = {
+    'model_A': os.path.join(MODEL_PATH, 'stroke_model_A_original.pkl'),
+    'model_B': os.path.join(MODEL_PATH, 'stroke_model_B_synthetic.pkl')
+}
+
+
+def parse_ensemble_weights(spec, members=ENSEMBLE_MODELS):
+    """
+    Parse ENSEMBLE_WEIGHTS, e.g. 'model_A=2,model_B=1' (unlisted members weigh 1).
+    A malformed entry, an unknown member or a weight that isn't a positive number
+    is reported and the ensemble falls back to equal weights.
+    """
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, sep, value = (part.strip() for part in item.partition('='))
+        try:
+            if not sep or name not in members:
+                raise ValueError
+            weight = float(value)
+            if not weight > 0 or weight == float('inf'):
+                raise ValueError
+        except ValueError:
+            print(f"⚠️ Ignoring ENSEMBLE_WEIGHTS={spec!r}: bad entry {item!r} (expected <member>=<positive number>, "
+                  f"members: {', '.join(members)}); using equal weights")
+            return {}
+        weights[name] = weight
+    return weights
+
+
+ENSEMBLE_WEIGHTS = parse_ensemble_weights(os.getenv('ENSEMBLE_WEIGHTS', ''))
+
+models = {}       # ensemble member name -> sklearn model
+ensemble = None
+feature_info = None
+# Column order expected by the models
+FEATURE_ORDER = FEATURE_NAMES
+
+
+def load_models():
+    """Load (or reload) the ensemble and feature metadata; keeps the current models on failure"""
+    global models, ensemble, feature_info, FEATURE_ORDER
     try:
-        if not EMAIL_CONFIG['sender'] or not EMAIL_CONFIG['password']:
-            print("⚠️ Email not configured. Skipping email notification.")
-            print(f"   Sender: {EMAIL_CONFIG['sender']}")
-            print(f"   Password: {'***' if EMAIL_CONFIG['password'] else 'Not set'}")
-            return False
-        
-        print(f"\n📧 Attempting to send email:")
-        print(f"   From: {EMAIL_CONFIG['sender']}")
-        print(f"   To: {recipient_email}")
-        print(f"   Subject: {subject}")
-        
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = EMAIL_CONFIG['sender']
-        msg['To'] = recipient_email
-        
-        # Add HTML and plain text versions
-        html_body = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px;">
-                <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                    <h2 style="color: #0EA5E9; border-bottom: 2px solid #0EA5E9; padding-bottom: 10px;">
-                        🏥 Stroke Risk Prediction System
-                    </h2>
-                    {body}
-                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #eee;">
-                    <p style="color: #666; font-size: 12px; text-align: center;">
-                        This is an automated notification from the Stroke Risk Prediction System.
-                    </p>
-                </div>
-            </body>
-        </html>
-        """
-        
-        # Attach both versions
-        msg.attach(MIMEText(body, 'plain'))
-        msg.attach(MIMEText(html_body, 'html'))
-        
-        print(f"   Connecting to {EMAIL_CONFIG['smtp_server']}:{EMAIL_CONFIG['smtp_port']}...")
-        
-        # Send email
-        with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'], timeout=10) as server:
-            server.starttls()
-            print(f"   Logging in as {EMAIL_CONFIG['sender']}...")
-            server.login(EMAIL_CONFIG['sender'], EMAIL_CONFIG['password'])
-            print(f"   Sending message...")
-            server.send_message(msg)
-        
-        print(f"✅ Email sent successfully to {recipient_email}\n")
-        return True
-    
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"❌ SMTP Authentication failed: {e}")
-        print(f"   Check your email and password in .env file")
-        print(f"   Gmail users: Use an App Password, not your regular password")
-        print(f"   Get one at: https://myaccount.google.com/apppasswords")
-        return False
+        loaded, fused = load_fused_ensemble(ENSEMBLE_MODELS, ENSEMBLE_WEIGHTS)
+        info = joblib.load(os.path.join(MODEL_PATH, 'feature_info.pkl'))
     except Exception as e:
-        print(f"❌ Failed to send email to {recipient_email}: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"❌ Error loading models: {e}")
         return False
 
-def send_login_notification(user_email, user_name):
-    """Send email when user logs in"""
-    subject = "🔐 Login Alert - Stroke Risk Prediction System"
-    body = f"""
-    <p style="font-size: 16px;">Hello <strong>{user_name}</strong>,</p>
-    <p>We detected a login to your account on the <strong>Stroke Risk Prediction System</strong>.</p>
-    <div style="background-color: #f0f9ff; padding: 15px; border-left: 4px solid #0EA5E9; margin: 20px 0;">
-        <p style="margin: 5px 0;"><strong>Login Time:</strong> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-        <p style="margin: 5px 0;"><strong>Account:</strong> {user_email}</p>
-    </div>
-    <p>If this wasn't you, please secure your account immediately.</p>
-    <p style="margin-top: 20px;">Stay healthy! 💙</p>
+    models = loaded
+    ensemble = fused
+    feature_info = info
+    FEATURE_ORDER = info['feature_names'] if info else FEATURE_NAMES
+    print("✅ Models loaded successfully!")
+    return True
+
+
+# Cache of scored predictions, keyed on normalized patient inputs
+prediction_cache = PredictionCache(
+    max_size=int(os.getenv('PREDICTION_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+)
+# Recent predictions' history entries by (user, result id): the result id is the
+# report token the dashboard downloads its PDF with, instead of sending the whole
+# result back in the URL.  On a miss (another worker, or expired) the entry is
+# read from the user's history.
+report_payloads = PredictionCache(
+    max_size=int(os.getenv('REPORT_PAYLOAD_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('REPORT_PAYLOAD_TTL', '3600'))
+)
+model_reload_lock = threading.Lock()
+
+
+def refresh_models():
     """
-    return send_email(user_email, subject, body)
-
-def send_medication_reminder(user_email, user_name, medication_name, time_slot):
-    """Send medication reminder email"""
-    subject = "💊 Medication Reminder - Take Your Medicine!"
-    body = f"""
-    <p style="font-size: 16px;">Hello <strong>{user_name}</strong>,</p>
-    <div style="background-color: #fef3c7; padding: 20px; border-left: 4px solid #f59e0b; margin: 20px 0; border-radius: 5px;">
-        <h3 style="color: #f59e0b; margin-top: 0;">⏰ Medication Alert</h3>
-        <p style="font-size: 18px; margin: 10px 0;">
-            <strong>Medication:</strong> {medication_name}
-        </p>
-        <p style="font-size: 16px; margin: 10px 0;">
-            <strong>Scheduled Time:</strong> {time_slot.capitalize()}
-        </p>
-        <p style="font-size: 16px; margin: 10px 0;">
-            <strong>Current Time:</strong> {datetime.now().strftime('%I:%M %p')}
-        </p>
-    </div>
-    <p style="font-size: 16px;">⚠️ You haven't marked this medication as taken yet.</p>
-    <p style="font-size: 14px; color: #666;">Please take your medication as prescribed and mark it as completed in the system.</p>
-    <p style="margin-top: 20px;">Your health is important! 💙</p>
+    Reload the models and drop cached predictions whenever a file in saved_models
+    changes.  Returns the fingerprint of the models now loaded.
     """
-    return send_email(user_email, subject, body)
+    with model_reload_lock:
+        fingerprint = directory_fingerprint(MODEL_PATH)
+        if prediction_cache.check_fingerprint(fingerprint):
+            load_models()
+        return fingerprint
 
-def check_medication_reminders():
-    """Check for overdue medications and send reminders"""
-    try:
-        medications = load_medications()
-        users = load_users()
-        current_time = datetime.now()
-        current_hour = current_time.hour
-        current_minute = current_time.minute
-        
-        print(f"\n⏰ [SCHEDULER] Checking medications at {current_time.strftime('%H:%M:%S')}")
-        
-        for username, user_meds in medications.items():
-            # Get user's email
-            if username not in users:
-                print(f"   ⚠️ User {username} not found in users.json")
-                continue
-            
-            user = users[username]
-            user_email = user.get('email')
-            user_name = user.get('name', username)
-            
-            if not user_email:
-                print(f"   ⚠️ No email for user {username}")
-                continue
-            
-            print(f"   👤 Checking {len(user_meds)} medications for {user_name} ({user_email})")
-            
-            # Check each medication
-            for med in user_meds:
-                medication_name = med.get('tablet_name', 'Medication')
-                schedule = med.get('schedule', [])
-                
-                for slot in schedule:
-                    # Skip if already taken
-                    if slot.get('taken', False):
-                        continue
-                    
-                    # Get scheduled time
-                    slot_time = slot.get('time', '')
-                    slot_name = slot.get('slot', 'unknown')
-                    
-                    if not slot_time:
-                        continue
-                    
-                    try:
-                        # Parse scheduled time (format: "HH:MM")
-                        scheduled_hour, scheduled_minute = map(int, slot_time.split(':'))
-                        
-                        # Calculate time difference in minutes
-                        time_diff = (current_hour * 60 + current_minute) - (scheduled_hour * 60 + scheduled_minute)
-                        
-                        print(f"      💊 {medication_name} ({slot_name}) - Scheduled: {slot_time}, Time diff: {time_diff} min")
-                        
-                        # Get last alert time (if any)
-                        last_alert = slot.get('last_alert_sent')
-                        alert_count = slot.get('alert_count', 0)
-                        needs_save = False
-                        
-                        # Send immediate alert when overdue (0-15 minutes after scheduled time)
-                        if 0 <= time_diff <= 15 and alert_count == 0:
-                            print(f"         📧 [IMMEDIATE] Sending to {user_email}")
-                            result = send_medication_reminder(user_email, user_name, medication_name, slot_name)
-                            if result:
-                                slot['last_alert_sent'] = current_time.isoformat()
-                                slot['alert_count'] = 1
-                                needs_save = True
-                        
-                        # Send 2-hour overdue alert (120+ minutes late)
-                        elif time_diff >= 120 and alert_count < 2:
-                            print(f"         📧 [2 HOURS OVERDUE] Sending urgent reminder to {user_email}")
-                            subject = "⚠️ URGENT: Medication 2+ Hours Overdue!"
-                            body = f"""
-                                <p style="font-size: 16px;">Hello <strong>{user_name}</strong>,</p>
-                                <div style="background-color: #fee2e2; padding: 20px; border-left: 4px solid #ef4444; margin: 20px 0; border-radius: 5px;">
-                                    <h3 style="color: #dc2626; margin-top: 0;">🚨 URGENT MEDICATION ALERT</h3>
-                                    <p style="font-size: 18px; margin: 10px 0;">
-                                        <strong>Medication:</strong> {medication_name}
-                                    </p>
-                                    <p style="font-size: 16px; margin: 10px 0;">
-                                        <strong>Scheduled Time:</strong> {slot_time} ({slot_name.capitalize()})
-                                    </p>
-                                    <p style="font-size: 16px; margin: 10px 0;">
-                                        <strong>Time Overdue:</strong> {time_diff // 60} hours {time_diff % 60} minutes
-                                    </p>
-                                </div>
-                                <p style="font-size: 16px; color: #dc2626; font-weight: bold;">⚠️ This medication is MORE THAN 2 HOURS OVERDUE!</p>
-                                <p style="font-size: 14px; color: #666;">Please take your medication immediately and consult your doctor if you have concerns.</p>
-                                <p style="margin-top: 20px;">Your health is critical! 🏥</p>
-                                """
-                            result = send_email(user_email, subject, body)
-                            if result:
-                                slot['last_alert_sent'] = current_time.isoformat()
-                                slot['alert_count'] = 2
-                                needs_save = True
-                        
-                        # Save if alerts were sent
-                        if needs_save:
-                            save_medications(medications)
-                    
-                    except ValueError as e:
-                        print(f"      ⚠️ Invalid time format for medication: {slot_time}")
-                        continue
-    
-    except Exception as e:
-        print(f"❌ Error checking medication reminders: {e}")
-        import traceback
-        traceback.print_exc()
+
+refresh_models()
 
 # Login required decorator
 def login_required(f):
@@ -398,471 +206,164 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Food recommendations based on risk factors
-def get_food_recommendations(data, risk_level):
-    recommendations = {
-        'foods_to_eat': [],
-        'foods_to_avoid': [],
-        'general_advice': [],
-        'urgent_message': None
-    }
-    
-    glucose = float(data.get('avg_glucose_level', 100))
-    bmi = float(data.get('bmi', 25))
-    hypertension = int(data.get('hypertension', 0))
-    heart_disease = int(data.get('heart_disease', 0))
-    
-    # High Risk - Urgent
-    if risk_level == 'HIGH':
-        recommendations['urgent_message'] = "⚠️ URGENT: Please consult a doctor immediately! Your stroke risk is high."
-    
-    # Glucose-based recommendations
-    if glucose > 126:  # High glucose (diabetic range)
-        recommendations['foods_to_eat'].extend([
-            "🥬 Leafy greens (spinach, kale, broccoli)",
-            "🫘 Legumes (lentils, chickpeas, beans)",
-            "🥜 Nuts (almonds, walnuts)",
-            "🐟 Fatty fish (salmon, mackerel)",
-            "🫐 Berries (blueberries, strawberries)",
-            "🥑 Avocados",
-            "🍳 Eggs"
-        ])
-        recommendations['foods_to_avoid'].extend([
-            "🍬 Sugary drinks and sodas",
-            "🍰 Processed desserts and sweets",
-            "🍞 White bread and refined carbs",
-            "🍟 Fried foods",
-            "🥤 Fruit juices with added sugar"
-        ])
-        recommendations['general_advice'].append("Monitor blood sugar levels regularly. Consider a low-glycemic diet.")
-    elif glucose > 100:  # Pre-diabetic
-        recommendations['foods_to_eat'].extend([
-            "🥗 Fresh salads with olive oil",
-            "🍠 Sweet potatoes",
-            "🌾 Whole grains (quinoa, brown rice)",
-            "🍎 Apples and citrus fruits"
-        ])
-        recommendations['foods_to_avoid'].extend([
-            "🍭 High-sugar snacks",
-            "🥐 Pastries and baked goods"
-        ])
-        recommendations['general_advice'].append("Your glucose is slightly elevated. Focus on fiber-rich foods.")
-    
-    # BMI-based recommendations
-    if bmi > 30:  # Obese
-        recommendations['foods_to_eat'].extend([
-            "🥒 Low-calorie vegetables (cucumber, celery)",
-            "🍗 Lean protein (chicken breast, turkey)",
-            "🥚 Protein-rich breakfast",
-            "🍵 Green tea"
-        ])
-        recommendations['foods_to_avoid'].extend([
-            "🍔 Fast food",
-            "🍕 High-calorie processed foods",
-            "🍿 Buttery snacks",
-            "🥓 Fatty meats"
-        ])
-        recommendations['general_advice'].append("Weight management is crucial. Consider portion control and regular exercise.")
-    elif bmi > 25:  # Overweight
-        recommendations['foods_to_eat'].extend([
-            "🍲 Vegetable soups",
-            "🥙 Lean wraps"
-        ])
-        recommendations['general_advice'].append("Moderate weight loss can significantly reduce stroke risk.")
-    elif bmi < 18.5:  # Underweight
-        recommendations['foods_to_eat'].extend([
-            "🥜 Nut butters",
-            "🥛 Full-fat dairy",
-            "🍌 Bananas and dates"
-        ])
-        recommendations['general_advice'].append("Focus on nutrient-dense foods to gain healthy weight.")
-    
-    # Hypertension-based recommendations
-    if hypertension:
-        recommendations['foods_to_eat'].extend([
-            "🍌 Potassium-rich foods (bananas, potatoes)",
-            "🧄 Garlic and onions",
-            "🥛 Low-fat dairy",
-            "🫒 Olive oil"
-        ])
-        recommendations['foods_to_avoid'].extend([
-            "🧂 High-sodium foods",
-            "🥫 Canned soups and processed foods",
-            "🥓 Processed meats (bacon, sausages)",
-            "🧀 High-sodium cheeses"
-        ])
-        recommendations['general_advice'].append("Follow a DASH diet. Limit sodium to less than 2,300mg/day.")
-    
-    # Heart disease-based recommendations
-    if heart_disease:
-        recommendations['foods_to_eat'].extend([
-            "🐟 Omega-3 rich fish (2-3 times/week)",
-            "🫒 Extra virgin olive oil",
-            "🍷 Red wine (moderate, if approved by doctor)",
-            "🥜 Unsalted nuts"
-        ])
-        recommendations['foods_to_avoid'].extend([
-            "🥩 Red meat (limit consumption)",
-            "🧈 Trans fats and saturated fats",
-            "🍳 Excessive egg yolks"
-        ])
-        recommendations['general_advice'].append("Follow a Mediterranean-style diet. Regular cardiac check-ups are essential.")
-    
-    # Remove duplicates
-    recommendations['foods_to_eat'] = list(set(recommendations['foods_to_eat']))
-    recommendations['foods_to_avoid'] = list(set(recommendations['foods_to_avoid']))
-    recommendations['general_advice'] = list(set(recommendations['general_advice']))
-    
-    # Add default healthy foods if lists are small
-    if len(recommendations['foods_to_eat']) < 5:
-        defaults = [
-            "🥗 Fresh vegetables",
-            "🍎 Fresh fruits",
-            "💧 Plenty of water (8 glasses/day)",
-            "🌾 Whole grains"
-        ]
-        recommendations['foods_to_eat'].extend(defaults)
-    
-    return recommendations
+# Upper bound on the number of patients accepted by /api/predict/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '1000'))
 
 
-def get_doctor_recommendations(data):
+def validate_patient(data):
     """
-    Generate doctor recommendations based on actual blood pressure and glucose levels.
-    
-    Blood Pressure (mmHg): < 100 = Low, 120-160 = Medium, 180-200 = High
-    Glucose (mg/dL):       < 100 = Low, 170-180 = Medium, 250-300 = High
-    Combined risk = worst of the two
+    Check that a patient record can be turned into features.
+    Returns an error message, or None if the record is usable.
     """
-    glucose = float(data.get('avg_glucose_level', 100))
-    # Support both numeric blood_pressure and boolean hypertension flag
-    blood_pressure = float(data.get('blood_pressure', 0))
-    hypertension_flag = int(data.get('hypertension', 0))
-    # If no numeric BP provided, estimate from flag
-    # Diagnosed hypertension (flag=1) maps to stage-2 range (>=180) for conservative risk assessment
-    if blood_pressure == 0:
-        blood_pressure = 180 if hypertension_flag == 1 else 90
-
-    # Determine BP risk
-    if blood_pressure < 100:
-        bp_risk = 'low'
-    elif 120 <= blood_pressure <= 160:
-        bp_risk = 'medium'
-    elif blood_pressure >= 180:
-        bp_risk = 'high'
-    else:
-        bp_risk = 'medium'  # 100-119 borderline
-
-    # Determine Glucose risk (WHO clinical thresholds)
-    # Normal: <100, Pre-diabetic/elevated: 100-139, Diabetic/high: >=140
-    if glucose < 100:
-        glucose_risk = 'low'
-    elif glucose < 140:
-        glucose_risk = 'medium'
-    else:
-        glucose_risk = 'high'
-
-    # Combined = worst of the two
-    risk_order = {'low': 0, 'medium': 1, 'high': 2}
-    combined_risk = bp_risk if risk_order[bp_risk] >= risk_order[glucose_risk] else glucose_risk
-
-    # Factor in smoking status — active smoking is a major stroke risk factor
-    smoking_status = str(data.get('smoking_status', ''))
-    risk_keys = ['low', 'medium', 'high']
-    if smoking_status == 'smokes':
-        # Active smoking upgrades risk by one level (low→medium, medium→high)
-        current_idx = risk_order.get(combined_risk, 0)
-        combined_risk = risk_keys[min(current_idx + 1, 2)]
-    elif smoking_status == 'formerly smoked' and combined_risk == 'low':
-        # Former smokers have elevated baseline risk
-        combined_risk = 'medium'
-
-    doctor_recommendations = {
-        'risk_category': '',
-        'risk_level': '',
-        'medical_advice': [],
-        'indian_foods_to_eat': [],
-        'indian_foods_to_avoid': [],
-        'lifestyle_changes': []
-    }
-
-    if combined_risk == 'low':
-        doctor_recommendations['risk_category'] = 'Low Risk'
-        doctor_recommendations['risk_level'] = 'LOW'
-        doctor_recommendations['medical_advice'] = [
-            "Your glucose and blood pressure levels are within normal range",
-            "Continue maintaining a healthy lifestyle",
-            "Annual health check-ups are recommended"
-        ]
-        doctor_recommendations['indian_foods_to_eat'] = [
-            "🍛 Dal (lentils) - High in protein and fiber",
-            "🥬 Palak (spinach) curry",
-            "🥒 Cucumber raita with low-fat curd",
-            "🌾 Brown rice or multi-grain roti",
-            "🥗 Mixed vegetable sabzi",
-            "🍵 Herbal chai with mint/tulsi",
-            "🥜 Roasted chana (chickpeas)",
-            "🫘 Moong dal sprouts salad",
-            "🍅 Tomato and onion salad",
-            "🥥 Coconut water"
-        ]
-        doctor_recommendations['indian_foods_to_avoid'] = [
-            "🍰 Excessive sweets (gulab jamun, jalebi, barfi)",
-            "🍟 Deep-fried snacks (samosa, pakora, bhajiya)",
-            "🧂 High-salt pickles and papad",
-            "🥤 Sugary drinks and packaged juices"
-        ]
-        doctor_recommendations['lifestyle_changes'] = [
-            "Practice yoga or light exercise for 30 minutes daily",
-            "Maintain regular meal timings",
-            "Stay hydrated with water and herbal teas",
-            "Get 7-8 hours of quality sleep"
-        ]
-    
-    # Medium Risk
-    elif combined_risk == 'medium':
-        doctor_recommendations['risk_category'] = 'Medium Risk'
-        doctor_recommendations['risk_level'] = 'MEDIUM'
-        doctor_recommendations['medical_advice'] = [
-            "⚠️ Your glucose and/or blood pressure levels indicate medium risk",
-            "Schedule a consultation with your doctor within 2 weeks",
-            "Regular monitoring of glucose and blood pressure is essential",
-            "Consider lifestyle modifications to prevent progression",
-            "Monthly medical check-ups recommended"
-        ]
-        doctor_recommendations['indian_foods_to_eat'] = [
-            "🥬 Methi (fenugreek) sabzi - Helps control blood sugar",
-            "🫘 Masoor dal, moong dal, chana dal",
-            "🥒 Karela (bitter gourd) juice or sabzi",
-            "🌾 Oats upma or dalia (broken wheat)",
-            "🥗 Cabbage and carrot sabzi",
-            "🍅 Tomato soup (low salt)",
-            "🫚 Ginger and garlic in cooking",
-            "🥜 Small portions of almonds and walnuts",
-            "🍵 Green tea or tulsi tea",
-            "🥥 Buttermilk (chaas) without salt",
-            "🥕 Beetroot and carrot salad",
-            "🫑 Capsicum (bell pepper) sabzi"
-        ]
-        doctor_recommendations['indian_foods_to_avoid'] = [
-            "🍚 White rice and refined flour (maida) products",
-            "🥔 Potato-based dishes (aloo paratha, aloo sabzi)",
-            "🍰 All sweets and desserts (mithai, halwa, kheer)",
-            "🍟 Fried foods (samosa, kachori, poori, bhatura)",
-            "🧂 High-salt foods (pickles, papad, namkeen)",
-            "🥓 Processed meats and sausages",
-            "🧈 Ghee and butter in excess",
-            "🥤 Sugary beverages and packaged juices",
-            "🍞 White bread and biscuits",
-            "🧀 Full-fat paneer and cheese"
-        ]
-        doctor_recommendations['lifestyle_changes'] = [
-            "Walking for 45 minutes daily (morning or evening)",
-            "Practice pranayama and meditation for stress reduction",
-            "Monitor blood sugar levels twice a week",
-            "Reduce salt intake to less than 5g per day",
-            "Avoid skipping meals - eat small frequent meals",
-            "Limit screen time and ensure adequate rest",
-            "Consider joining a diabetes/hypertension management program"
-        ]
-    
-    # High Risk
-    else:
-        doctor_recommendations['risk_category'] = 'High Risk'
-        doctor_recommendations['risk_level'] = 'HIGH'
-        doctor_recommendations['medical_advice'] = [
-            "🚨 URGENT: Your glucose and/or blood pressure levels are critically high",
-            "IMMEDIATE doctor consultation required - within 24-48 hours",
-            "You may need medication to manage glucose and blood pressure",
-            "Daily monitoring of vital parameters is mandatory",
-            "Follow prescribed medication schedule strictly",
-            "Consider hospitalization if symptoms worsen",
-            "Weekly doctor follow-ups essential"
-        ]
-        doctor_recommendations['indian_foods_to_eat'] = [
-            "🫘 Only dal-based proteins (masoor, moong - minimal oil)",
-            "🥬 Steamed or boiled vegetables (palak, lauki, turai)",
-            "🥒 Karela juice daily (bitter gourd)",
-            "🫚 Ginger-garlic paste in minimal quantities",
-            "🍵 Herbal teas (green tea, fenugreek tea)",
-            "🥗 Raw salads (cucumber, tomato, radish)",
-            "🌾 Small portions of oats or dalia",
-            "🥥 Coconut water (natural, unsweetened)",
-            "🫘 Sprouts (moong, chana) - steamed",
-            "🥛 Skimmed milk only"
-        ]
-        doctor_recommendations['indian_foods_to_avoid'] = [
-            "🚫 COMPLETELY AVOID all sweets and desserts",
-            "🚫 NO fried foods whatsoever (pakora, samosa, poori, vada)",
-            "🚫 NO white rice, potatoes, or maida products",
-            "🚫 NO pickles, papad, or namkeen",
-            "🚫 NO full-fat dairy products",
-            "🚫 NO ghee, butter, or dalda",
-            "🚫 NO sugary drinks, sodas, or packaged juices",
-            "🚫 NO processed or canned foods",
-            "🚫 NO red meat or organ meats",
-            "🚫 NO coconut milk or heavy gravies",
-            "🚫 NO bakery items (bread, biscuits, cakes)",
-            "🚫 Strictly limit salt to 3g per day"
-        ]
-        doctor_recommendations['lifestyle_changes'] = [
-            "⚠️ CRITICAL: Strict adherence to medication schedule",
-            "Monitor glucose levels twice daily (fasting and post-meal)",
-            "Check blood pressure twice daily",
-            "Walking after every meal (even 10-15 minutes helps)",
-            "Complete bed rest if advised by doctor",
-            "Avoid all sources of stress - practice deep breathing",
-            "Sleep 8 hours minimum, maintain regular sleep schedule",
-            "Keep emergency contact numbers handy",
-            "Inform family members about your condition",
-            "Consider staying with family/caregivers initially"
-        ]
-    
-    return doctor_recommendations
+    if not isinstance(data, dict):
+        return 'Patient record must be a JSON object'
+
+    missing = [field for field in INPUT_FIELDS if field not in data]
+    if missing:
+        return 'Missing fields: ' + ', '.join(missing)
 
+    for field in NUMERIC_FIELDS:
+        try:
+            value = float(data[field])
+        except (TypeError, ValueError):
+            return f"Invalid value for {field}: {data[field]!r}"
+        if not np.isfinite(value):
+            return f"Invalid value for {field}: {data[field]!r}"
 
-def get_indian_food_recommendations(data):
+    for field in FLAG_FIELDS:
+        try:
+            int(data[field])
+        except (TypeError, ValueError):
+            return f"Invalid value for {field}: {data[field]!r}"
+
+    for field in CATEGORICAL_MAPPINGS:
+        if isinstance(data[field], (list, dict)):
+            return f"Invalid value for {field}: {data[field]!r}"
+
+    return None
+
+
+def prepare_features(data):
     """
-    Get Indian food recommendations based on input health parameters
+    Prepare input features for prediction
     """
-    recommendations = []
-    
-    glucose_level = float(data.get('avg_glucose_level', 0))
-    bmi = float(data.get('bmi', 0))
-    hypertension = int(data.get('hypertension', 0))
-    heart_disease = int(data.get('heart_disease', 0))
-    age = int(data.get('age', 0))
-    
-    # General healthy Indian foods suitable for stroke prevention
-    base_foods = [
-        "🥗 Moong dal (yellow lentils) - high in protein, low in fat",
-        "🍚 Brown rice or hand-pounded rice instead of white rice",
-        "🥬 Palak (spinach) sabzi with minimal oil",
-        "🥒 Cucumber raita with low-fat yogurt",
-        "🫘 Chana dal or masoor dal preparations",
-        "🌾 Ragi (finger millet) porridge or roti"
+    return build_features(columns_from_records([data]), FEATURE_ORDER)
+
+
+def prepare_features_batch(records):
+    """
+    Prepare one feature matrix for many validated patient records
+    """
+    return build_features(columns_from_records(records), FEATURE_ORDER)
+
+
+# Risk labels indexed by risk code (0 = LOW, 1 = MEDIUM, 2 = HIGH)
+RISK_LEVELS = np.array(['LOW', 'MEDIUM', 'HIGH'])
+
+
+def risk_codes(probs):
+    """Map stroke probabilities to risk codes: < 0.3 LOW, < 0.6 MEDIUM, else HIGH"""
+    return np.digitize(probs, [0.3, 0.6])
+
+
+def clinical_risk_floor(records):
+    """
+    Minimum risk code implied by the clinical override rules, one per record.
+
+    The ML model may under-predict when a patient has multiple known risk
+    factors.  These evidence-based rules only *upgrade* risk, never lower it.
+    """
+    smokes = np.array([str(r.get('smoking_status', '')) == 'smokes' for r in records])
+    hypertension = np.array([int(r.get('hypertension', 0)) == 1 for r in records])
+    glucose = np.array([float(r.get('avg_glucose_level', 100)) for r in records])
+    heart = np.array([int(r.get('heart_disease', 0)) == 1 for r in records])
+
+    # Rule 1: Active smoker is never LOW risk
+    # Rule 3: Hypertension + diabetic glucose range (≥140 mg/dL) → at least MEDIUM
+    medium = smokes | (hypertension & (glucose >= 140))
+
+    # Rule 2: Hypertension + severely elevated glucose (≥200 mg/dL) → HIGH
+    # Rule 4: Active smoking + hypertension → HIGH (two major stroke risk factors)
+    # Rule 5: Active smoking + heart disease → HIGH
+    # Rule 6: Active smoking + diabetic glucose → HIGH
+    high = ((hypertension & (glucose >= 200)) |
+            (smokes & hypertension) |
+            (smokes & heart) |
+            (smokes & (glucose >= 140)))
+
+    return np.where(high, 2, np.where(medium, 1, 0))
+
+
+def calibrate_probs(raw_probs, final_risk, high_floor=0.70, medium_floor=0.40):
+    """
+    When clinical rules force a higher risk label, the raw ML probability
+    is unreliable (models were trained on imbalanced data).  Calibrate
+    the *displayed* probability so it is consistent with the risk label.
+    """
+    return np.where(final_risk == 2, np.maximum(raw_probs, high_floor),
+                    np.where(final_risk == 1, np.maximum(raw_probs, medium_floor), raw_probs))
+
+
+# Calibrated HIGH-risk display floor per model:
+# Model A (trained on original data) is the stronger signal → floor 0.76
+# Model B (trained on synthetic data) is the weaker signal  → floor 0.65
+# Ensemble floor is the average of the two individual floors → ~0.70
+DISPLAY_HIGH_FLOORS = {'model_A': 0.76, 'model_B': 0.65, 'ensemble': 0.70}
+
+
+def score_patients(features, records):
+    """
+    Score a feature matrix with every ensemble member in one fused pass and
+    apply the clinical override rules and probability calibration column-wise.
+    Returns one result dict (model_A, model_B, ..., ensemble) per record.
+    """
+    probs = ensemble.predict(features)
+
+    # Apply the same clinical rules to each individual model so that
+    # all displayed risk labels are consistent with the ensemble decision.
+    floor = clinical_risk_floor(records)
+    scored = {}
+    for name, prob in probs.items():
+        risk = np.maximum(risk_codes(prob), floor)
+        display = calibrate_probs(prob, risk, high_floor=DISPLAY_HIGH_FLOORS.get(name, 0.70))
+        scored[name] = ([round(p * 100, 1) for p in display.tolist()], RISK_LEVELS[risk].tolist())
+
+    return [
+        {
+            name: {'probability': display[i], 'risk_level': labels[i]}
+            for name, (display, labels) in scored.items()
+        }
+        for i in range(len(records))
     ]
-    
-    # Add based on glucose levels
-    if glucose_level < 100:
-        recommendations.append("✅ Your glucose is good! Include: Whole moong, bajra roti, oats upma")
-    elif glucose_level <= 160:
-        recommendations.append("⚠️ Moderate glucose - Prefer: Sugar-free dal preparations, methi leaves, bitter gourd sabzi")
-        recommendations.append("❌ Reduce: White rice, sweet dishes, refined flour items")
-    else:
-        recommendations.append("🚨 High glucose - Focus on: Karela juice, methi water, chana dal, avoid all sweets")
-        recommendations.append("❌ Strictly avoid: Rice dishes, roti made from maida, jaggery-based foods")
-    
-    # Add based on BMI
-    if bmi > 30:
-        recommendations.append("⚖️ Weight management: Choose steamed idli, vegetable upma, avoid fried foods")
-        recommendations.append("❌ Skip: All fried items (samosa, pakora, bhajiya), heavy curries with cream")
-    elif bmi >= 25:
-        recommendations.append("⚖️ Light meals: Khichdi, dal-rice, vegetable soups")
-    
-    # Add based on hypertension
-    if hypertension == 1:
-        recommendations.append("🩺 For BP control: Low-salt dal, jeera water, coconut water")
-        recommendations.append("❌ Avoid: Pickles, papad, salted buttermilk, commercial masalas")
-    
-    # Add based on heart disease
-    if heart_disease == 1:
-        recommendations.append("❤️ Heart-healthy: Garlic chutney, flaxseed chutney, oats dosa")
-        recommendations.append("❌ Avoid: Ghee, butter, coconut oil cooking, full-fat dairy")
-    
-    # Age-specific recommendations
-    if age > 60:
-        recommendations.append("👴 For seniors: Soft khichdi, dal water, vegetable soups, avoid hard-to-digest foods")
-    
-    # Add base foods to all
-    recommendations.extend(base_foods)
-    
-    # General tips
-    recommendations.append("💡 Cooking tips: Use minimal oil, prefer steaming/boiling, add turmeric & ginger")
-    recommendations.append("🥤 Beverages: Buttermilk (low salt), herbal tea, jeera water, avoid sugary drinks")
-    
-    return recommendations
 
 
-def prepare_features(data):
+# Prediction history
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+MAX_HISTORY_PAGE_SIZE = 200
+
+
+def new_result_id(saved_at):
+    """Stable, time-ordered id for a stored prediction (the random suffix keeps workers apart)"""
+    return f"{saved_at.strftime('%Y%m%d%H%M%S%f')}-{secrets.token_hex(3)}"
+
+
+def history_page_args():
+    """(before, limit) from the query string, with limit clamped to 1..MAX_HISTORY_PAGE_SIZE"""
+    before = request.args.get('before') or None
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    return before, max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+
+
+def find_user_result(username, key):
     """
-    Prepare input features for prediction
+    One of a user's results by stable id.  Short numeric keys are positions in
+    the newest-first history, as used by links created before results had ids.
     """
-    # Encode categorical variables
-    gender_map = {'Female': 0, 'Male': 1, 'Other': 2}
-    married_map = {'No': 0, 'Yes': 1}
-    work_map = {'Govt_job': 0, 'Never_worked': 1, 'Private': 2, 'Self-employed': 3, 'children': 4}
-    residence_map = {'Rural': 0, 'Urban': 1}
-    smoking_map = {'Unknown': 0, 'formerly smoked': 1, 'never smoked': 2, 'smokes': 3}
-    
-    # Extract values
-    age = float(data['age'])
-    gender = gender_map.get(data['gender'], 0)
-    hypertension = int(data['hypertension'])
-    heart_disease = int(data['heart_disease'])
-    ever_married = married_map.get(data['ever_married'], 0)
-    work_type = work_map.get(data['work_type'], 2)
-    residence_type = residence_map.get(data['residence_type'], 1)
-    avg_glucose_level = float(data['avg_glucose_level'])
-    bmi = float(data['bmi'])
-    smoking_status = smoking_map.get(data['smoking_status'], 0)
-    
-    # Feature engineering
-    age_glucose_interaction = age * avg_glucose_level
-    age_bmi_interaction = age * bmi
-    glucose_bmi_interaction = avg_glucose_level * bmi
-    
-    # Age group
-    if age <= 18: age_group = 0
-    elif age <= 35: age_group = 1
-    elif age <= 50: age_group = 2
-    elif age <= 65: age_group = 3
-    else: age_group = 4
-    
-    # BMI category
-    if bmi < 18.5: bmi_category = 0
-    elif bmi < 25: bmi_category = 1
-    elif bmi < 30: bmi_category = 2
-    else: bmi_category = 3
-    
-    # Glucose category
-    if avg_glucose_level < 100: glucose_category = 0
-    elif avg_glucose_level < 126: glucose_category = 1
-    elif avg_glucose_level < 200: glucose_category = 2
-    else: glucose_category = 3
-    
-    # Risk score (smoking is a primary stroke risk factor, include it explicitly)
-    risk_score = (int(age > 50) + hypertension + heart_disease +
-                  int(avg_glucose_level > 126) + int(bmi > 30) +
-                  int(smoking_status == 3))  # 3 = currently smokes
-    
-    # Create feature DataFrame
-    features = pd.DataFrame({
-        'gender': [gender],
-        'hypertension': [hypertension],
-        'heart_disease': [heart_disease],
-        'ever_married': [ever_married],
-        'work_type': [work_type],
-        'residence_type': [residence_type],
-        'avg_glucose_level': [avg_glucose_level],
-        'bmi': [bmi],
-        'smoking_status': [smoking_status],
-        'bmi_missing': [0],
-        'age': [age],
-        'age_glucose_interaction': [age_glucose_interaction],
-        'age_bmi_interaction': [age_bmi_interaction],
-        'glucose_bmi_interaction': [glucose_bmi_interaction],
-        'age_group': [age_group],
-        'bmi_category': [bmi_category],
-        'glucose_category': [glucose_category],
-        'risk_score': [risk_score]
-    })
-    
-    # Reorder columns to match training data
-    if feature_info:
-        features = features[feature_info['feature_names']]
-    
-    return features
+    if key.isdigit() and len(key) < 10:
+        position = int(key)
+        page, _ = storage.user_history(username, limit=position + 1)
+        return page[position] if position < len(page) else None
+    return storage.get_user_result(username, key)
 
 
 # Routes
@@ -920,8 +421,7 @@ def firebase_login():
             return jsonify({'success': False, 'error': 'Invalid request data'}), 400
         
         # Check if this Firebase UID has been permanently deleted/blocked
-        users = load_users()
-        blocked_uids = users.get('_deleted_uids', [])
+        blocked_uids = storage.read_users().get('_deleted_uids', [])
         if uid in blocked_uids:
             print(f"⛔ Blocked login attempt from deleted UID: {uid}")
             return jsonify({'success': False, 'error': 'This account has been permanently deleted. Please register a new account.'}), 403
@@ -930,26 +430,27 @@ def firebase_login():
         # Use email as username for Firebase users
         username = email.replace('@', '_').replace('.', '_')
         
-        if username not in users:
-            # Create new user
-            users[username] = {
-                'username': username,
-                'email': email,
-                'name': display_name,
-                'role': 'user',
-                'firebase_uid': uid,
-                'created_at': datetime.now().isoformat(),
-                'auth_provider': data.get('provider', 'email')
-            }
-        else:
-            # Always keep firebase_uid up-to-date so account deletion works correctly
-            users[username]['firebase_uid'] = uid
-        save_users(users)
+        with storage.transaction('users') as users:
+            if username not in users:
+                # Create new user
+                users[username] = {
+                    'username': username,
+                    'email': email,
+                    'name': display_name,
+                    'role': 'user',
+                    'firebase_uid': uid,
+                    'created_at': datetime.now().isoformat(),
+                    'auth_provider': data.get('provider', 'email')
+                }
+            else:
+                # Always keep firebase_uid up-to-date so account deletion works correctly
+                users[username]['firebase_uid'] = uid
+            user = users[username]
         
         # Create session
         session['user'] = username
-        session['name'] = users[username].get('name', display_name)
-        session['role'] = users[username].get('role', 'user')
+        session['name'] = user.get('name', display_name)
+        session['role'] = user.get('role', 'user')
         session['firebase_uid'] = uid
         
         # Send login notification email
@@ -968,8 +469,7 @@ def check_deleted_email():
     try:
         data = request.get_json()
         email = data.get('email', '')
-        users = load_users()
-        deleted_emails = users.get('_deleted_emails', [])
+        deleted_emails = storage.read_users().get('_deleted_emails', [])
         return jsonify({'deleted': email in deleted_emails})
     except Exception as e:
         return jsonify({'deleted': False}), 500
@@ -989,7 +489,7 @@ def firebase_register():
         if not token or not email or not uid:
             return jsonify({'success': False, 'error': 'Invalid request data'}), 400
         
-        users = load_users()
+        users = storage.read_users()
         blocked_uids = users.get('_deleted_uids', [])
         deleted_emails = users.get('_deleted_emails', [])
 
@@ -999,24 +499,26 @@ def firebase_register():
             print(f"♻️  Re-registration allowed for previously deleted email: {email}")
             # Clean up old blocklist entries for this email
             username_key = email.replace('@', '_').replace('.', '_')
-            # Remove old UID from blocklist (new Firebase UID will be different or same)
-            # We allow this because the user explicitly re-registered
-            if uid in blocked_uids:
-                blocked_uids.remove(uid)
-                users['_deleted_uids'] = blocked_uids
-            # Remove from deleted_emails
-            deleted_emails.remove(email)
-            users['_deleted_emails'] = deleted_emails
-            # Remove stale user record if it somehow still exists
-            if username_key in users:
-                del users[username_key]
-            save_users(users)
+            with storage.transaction('users') as users:
+                # Remove old UID from blocklist (new Firebase UID will be different or same)
+                # We allow this because the user explicitly re-registered
+                blocked_uids = users.get('_deleted_uids', [])
+                if uid in blocked_uids:
+                    blocked_uids.remove(uid)
+                    users['_deleted_uids'] = blocked_uids
+                # Remove from deleted_emails
+                deleted_emails = users.get('_deleted_emails', [])
+                if email in deleted_emails:
+                    deleted_emails.remove(email)
+                users['_deleted_emails'] = deleted_emails
+                # Remove stale user record if it somehow still exists
+                users.pop(username_key, None)
         elif uid in blocked_uids:
             print(f"⛔ Blocked register attempt from deleted UID: {uid}")
             return jsonify({'success': False, 'error': 'This account has been permanently deleted. Please register a new account.'}), 403
         
         # Re-load after potential modifications above
-        users = load_users()
+        users = storage.read_users()
 
         # Use email as username for Firebase users
         username = email.replace('@', '_').replace('.', '_')
@@ -1029,18 +531,18 @@ def firebase_register():
             session['firebase_uid'] = uid
             return jsonify({'success': True, 'message': 'Login successful'})
         
-        # Create new user
-        users[username] = {
-            'username': username,
-            'email': email,
-            'name': display_name,
-            'role': 'user',
-            'firebase_uid': uid,
-            'created_at': datetime.now().isoformat(),
-            'auth_provider': data.get('provider', 'email'),
-            'photo_url': data.get('photoURL', '')
-        }
-        save_users(users)
+        # Create new user (setdefault: another worker may have just created it)
+        with storage.transaction('users') as users:
+            users.setdefault(username, {
+                'username': username,
+                'email': email,
+                'name': display_name,
+                'role': 'user',
+                'firebase_uid': uid,
+                'created_at': datetime.now().isoformat(),
+                'auth_provider': data.get('provider', 'email'),
+                'photo_url': data.get('photoURL', '')
+            })
         
         # Create session
         session['user'] = username
@@ -1059,15 +561,19 @@ def firebase_register():
 @login_required
 def dashboard():
     """Render the main dashboard"""
-    return render_template('dashboard.html', user=session.get('name', 'User'), role=session.get('role', 'user'), firebase_config=FIREBASE_CONFIG)
+    # The alert stream is only opened for users with medications to be reminded of
+    has_medications = bool(storage.read_medications().get(session['user']))
+    return render_template('dashboard.html', user=session.get('name', 'User'), role=session.get('role', 'user'),
+                           has_medications=has_medications, firebase_config=FIREBASE_CONFIG)
 
 
 @app.route('/admin')
 @admin_required
 def admin_panel():
     """Admin panel to see all users and their history"""
-    users = load_users()
-    results = load_results()
+    users = storage.read_users()
+    # Counters kept up to date by every saved or deleted result (no pass over the history)
+    stats = storage.read_stats()
     
     user_stats = []
     for username, user_data in users.items():
@@ -1075,30 +581,22 @@ def admin_panel():
         if username.startswith('_') or not isinstance(user_data, dict):
             continue
             
-        user_results = results.get(username, [])
-        high_risk_count = sum(1 for r in user_results if r.get('results', {}).get('ensemble', {}).get('risk_level') == 'HIGH')
-        medium_risk_count = sum(1 for r in user_results if r.get('results', {}).get('ensemble', {}).get('risk_level') == 'MEDIUM')
-        low_risk_count = sum(1 for r in user_results if r.get('results', {}).get('ensemble', {}).get('risk_level') == 'LOW')
-        
-        latest_prediction = None
-        if user_results:
-            sorted_results = sorted(user_results, key=lambda x: x.get('timestamp', ''), reverse=True)
-            latest_prediction = sorted_results[0]
-        
+        counters = stats['users'].get(username) or new_counters()
         user_stats.append({
             'username': username,
             'name': user_data.get('name', username),
             'email': user_data.get('email', ''),
             'role': user_data.get('role', 'user'),
             'created_at': user_data.get('created_at', ''),
-            'total_predictions': len(user_results),
-            'high_risk': high_risk_count,
-            'medium_risk': medium_risk_count,
-            'low_risk': low_risk_count,
-            'latest_prediction': latest_prediction
+            'total_predictions': counters['total_predictions'],
+            'high_risk': counters['high_risk'],
+            'medium_risk': counters['medium_risk'],
+            'low_risk': counters['low_risk'],
+            'latest_prediction': counters['latest_prediction']
         })
     
     total_users = len([u for u in user_stats if u['role'] != 'admin'])
+    # Summed over listed accounts only (stats['totals'] also counts results of removed accounts)
     total_predictions = sum(u['total_predictions'] for u in user_stats)
     total_high_risk = sum(u['high_risk'] for u in user_stats)
     
@@ -1116,12 +614,11 @@ def admin_panel():
 def get_user_history(username):
     """Get prediction history for a specific user (admin only)"""
     try:
-        results = load_results()
-        user_results = results.get(username, [])
-        user_results = sorted(user_results, key=lambda x: x.get('timestamp', ''), reverse=True)
+        # Whole history by default; ?before=<next_before>&limit=N pages through it
+        user_results, next_before = storage.user_history(
+            username, request.args.get('before') or None, request.args.get('limit', type=int))
         
-        users = load_users()
-        user_data = users.get(username, {})
+        user_data = storage.read_users().get(username, {})
         
         return jsonify({
             'success': True,
@@ -1130,12 +627,89 @@ def get_user_history(username):
                 'name': user_data.get('name', username),
                 'email': user_data.get('email', '')
             },
-            'results': user_results
+            'results': user_results,
+            'next_before': next_before
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+def export_entries(usernames, start, end):
+    """(username, entry) of every result of `usernames` with start <= date <= end, oldest first per user"""
+    for username in usernames:
+        for entry in storage.load_user_results(username):
+            day = entry.get('timestamp', '')[:10]
+            if (start is None or day >= start) and (end is None or day <= end):
+                yield username, entry
+
+
+@app.route('/api/admin/export-reports')
+@admin_required
+def export_reports():
+    """
+    ZIP of the PDF reports of one user (?username=) and/or a date range
+    across users (?from=YYYY-MM-DD&to=YYYY-MM-DD), both ends inclusive (admin only).
+    Reports are rendered in the report pool and streamed as they finish.
+    """
+    username = request.args.get('username') or None
+    start = request.args.get('from') or None
+    end = request.args.get('to') or None
+    for value in (start, end):
+        if value is not None:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
+    if username is None and start is None and end is None:
+        return jsonify({'success': False, 'error': 'Give a username or a date range'}), 400
+
+    # Take the export slot before touching storage, so a second export
+    # can't make us walk every user's history only to be turned away
+    if not export_slots.acquire(blocking=False):
+        response = jsonify({'success': False, 'error': 'Another export is in progress, please try again shortly'})
+        response.headers['Retry-After'] = '30'
+        return response, 429
+    response = None
+    try:
+        if username:
+            usernames = [username]
+        else:
+            # Users with results, skipping those whose latest result is older than the range
+            usernames = sorted(name for name, counters in storage.read_stats()['users'].items()
+                               if counters['total_predictions'] and (start is None or (
+                                   counters['latest_prediction'] or {}).get('timestamp', '')[:10] >= start))
+        # One entry past the cap is enough to refuse, without reading the rest
+        entries = list(islice(export_entries(usernames, start, end), MAX_EXPORT_REPORTS + 1))
+        if not entries:
+            return jsonify({'success': False, 'error': 'No reports match'}), 404
+        if len(entries) > MAX_EXPORT_REPORTS:
+            return jsonify({'success': False, 'error': f'More than {MAX_EXPORT_REPORTS} reports match; '
+                                                       f'narrow the range'}), 400
+
+        def items():
+            for owner, entry in entries:
+                key, _, args, kwargs = history_report_spec(entry)
+                yield (member_name(owner, entry), entry.get('timestamp', '')), key, args, kwargs
+
+        def reports():
+            for (name, timestamp), pdf_bytes, error in report_jobs.render_each(items()):
+                if error is not None:
+                    print(f"❌ Export: report {name} failed: {error}")
+                yield name, timestamp, pdf_bytes, error
+
+        scope = safe_name(username or 'all') + (f"_{start or 'start'}_{end or 'today'}" if start or end else '')
+        filename = f"StrokeRisk_Reports_{scope}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        print(f"📦 Exporting {len(entries)} reports for {session['user']} ({filename})")
+        response = Response(stream_zip(reports()), mimetype='application/zip',
+                            headers={'Content-Disposition': f'attachment; filename={filename}',
+                                     'X-Accel-Buffering': 'no'})
+        response.call_on_close(export_slots.release)
+        return response
+    finally:
+        if response is None:  # refused or failed before streaming started
+            export_slots.release()
+
+
 @app.route('/api/admin/toggle-role', methods=['POST'])
 @admin_required
 def toggle_admin_role():
@@ -1154,14 +728,13 @@ def toggle_admin_role():
         if username == 'admin':
             return jsonify({'success': False, 'error': 'Cannot change admin role'}), 403
         
-        users = load_users()
-        
-        if username not in users:
+        if username not in storage.read_users():
             return jsonify({'success': False, 'error': 'User not found'}), 404
         
         # Update user role
-        users[username]['role'] = new_role
-        save_users(users)
+        with storage.transaction('users') as users:
+            if username in users:
+                users[username]['role'] = new_role
         
         # Update session if toggling current user's role
         if session.get('user') == username:
@@ -1178,23 +751,38 @@ def toggle_admin_role():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/admin/outbox')
+@admin_required
+def get_outbox_status():
+    """Email outbox counters and the most recent dead letters (admin only)"""
+    return jsonify({'success': True, 'stats': outbox.stats(), 'dead_letters': outbox.dead_letters()})
+
+
+@app.route('/api/admin/outbox/requeue', methods=['POST'])
+@admin_required
+def requeue_dead_letters():
+    """Send dead letters again: the given ids, or all of them (admin only)"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+        return jsonify({'success': False, 'error': 'ids must be a list of message ids'}), 400
+    return jsonify({'success': True, 'requeued': outbox.requeue_dead(ids)})
+
+
 @app.route('/history')
 @login_required
 def history():
-    """Show prediction history"""
-    results = load_results()
-    user_results = results.get(session['user'], [])
-    # Sort by date, newest first
-    user_results = sorted(user_results, key=lambda x: x.get('timestamp', ''), reverse=True)
-    return render_template('history.html', results=user_results, user=session.get('name', 'User'), role=session.get('role', 'user'), firebase_config=FIREBASE_CONFIG)
+    """Show prediction history (newest first, one page at a time)"""
+    before, limit = history_page_args()
+    user_results, next_before = storage.user_history(session['user'], before, limit)
+    return render_template('history.html', results=user_results, before=before, next_before=next_before, user=session.get('name', 'User'), role=session.get('role', 'user'), firebase_config=FIREBASE_CONFIG)
 
 
 @app.route('/medications')
 @login_required
 def medications():
     """Medication reminder page"""
-    meds = load_medications()
-    user_meds = meds.get(session['user'], [])
+    user_meds = storage.read_medications().get(session['user'], [])
     return render_template('medications.html', medications=user_meds, user=session.get('name', 'User'), role=session.get('role', 'user'), firebase_config=FIREBASE_CONFIG)
 
 
@@ -1209,14 +797,10 @@ def doctor_recommendations_page():
 @login_required
 def api_medications():
     """API for medication management"""
-    meds = load_medications()
     username = session['user']
     
-    if username not in meds:
-        meds[username] = []
-    
     if request.method == 'GET':
-        return jsonify({'success': True, 'medications': meds[username]})
+        return jsonify({'success': True, 'medications': storage.read_medications().get(username, [])})
     
     if request.method == 'POST':
         data = request.get_json()
@@ -1255,8 +839,9 @@ def api_medications():
             'created_at': datetime.now().isoformat()
         }
         
-        meds[username].append(new_med)
-        save_medications(meds)
+        with storage.transaction('medications') as meds:
+            meds.setdefault(username, []).append(new_med)
+        medications_changed()
         
         return jsonify({'success': True, 'medication': new_med})
     
@@ -1265,10 +850,11 @@ def api_medications():
         med_id = data.get('id')
         
         print(f"🗑️ Deleting medication: {med_id} for user: {username}")
-        print(f"   Before: {len(meds[username])} medications")
-        
-        meds[username] = [m for m in meds[username] if m['id'] != med_id]
-        save_medications(meds)
+        with storage.transaction('medications') as meds:
+            user_meds = meds.get(username, [])
+            print(f"   Before: {len(user_meds)} medications")
+            meds[username] = [m for m in user_meds if m['id'] != med_id]
+        medications_changed()
         
         print(f"   After: {len(meds[username])} medications")
         
@@ -1283,11 +869,10 @@ def mark_medication_taken():
     med_id = data.get('med_id')
     slot = data.get('slot')
     
-    meds = load_medications()
     username = session['user']
     
-    if username in meds:
-        for med in meds[username]:
+    with storage.transaction('medications') as meds:
+        for med in meds.get(username, []):
             if med['id'] == med_id:
                 for s in med['schedule']:
                     if s['slot'] == slot:
@@ -1295,7 +880,7 @@ def mark_medication_taken():
                         s['taken_at'] = datetime.now().isoformat()
                         break
                 break
-        save_medications(meds)
+    medications_changed()
     
     return jsonify({'success': True})
 
@@ -1304,84 +889,85 @@ def mark_medication_taken():
 @login_required
 def reset_daily_medications():
     """Reset all medication taken status for a new day"""
-    meds = load_medications()
     username = session['user']
     
-    if username in meds:
-        for med in meds[username]:
+    with storage.transaction('medications') as meds:
+        for med in meds.get(username, []):
             for s in med['schedule']:
                 s['taken'] = False
                 s['taken_at'] = None
                 # Reset alert tracking for new day
                 s['last_alert_sent'] = None
                 s['alert_count'] = 0
-        save_medications(meds)
+    medications_changed()
     
     return jsonify({'success': True})
 
 
+@app.route('/api/medications/preferences', methods=['GET', 'POST'])
+@login_required
+def medication_preferences():
+    """Reminder delivery preference: one digest email per reminder pass, or one email per dose"""
+    username = session['user']
+    
+    if request.method == 'GET':
+        return jsonify({'success': True, 'reminder_mode': reminder_mode(username)})
+    
+    data = request.get_json() or {}
+    mode = data.get('reminder_mode')
+    if mode not in REMINDER_MODES:
+        return jsonify({'success': False, 'error': f"reminder_mode must be one of: {', '.join(REMINDER_MODES)}"}), 400
+    
+    if username not in storage.read_users():
+        return jsonify({'success': False, 'error': 'User not found'}), 404
+    
+    # Kept on the user's own record, next to their email and name
+    with storage.transaction('users') as users:
+        if username in users:
+            users[username]['reminder_mode'] = mode
+    
+    return jsonify({'success': True, 'reminder_mode': mode})
+
+
 @app.route('/api/medications/alerts', methods=['GET'])
 @login_required
 def get_medication_alerts():
     """Get overdue medications for visual alerts"""
     try:
-        meds = load_medications()
-        username = session['user']
-        current_time = datetime.now()
-        alerts = []
-        
-        if username in meds:
-            for med in meds[username]:
-                medication_name = med.get('tablet_name', 'Medication')
-                
-                for slot in med['schedule']:
-                    # Skip if already taken
-                    if slot.get('taken', False):
-                        continue
-                    
-                    slot_time = slot.get('time', '')
-                    slot_name = slot.get('slot', 'unknown')
-                    
-                    if not slot_time:
-                        continue
-                    
-                    try:
-                        # Parse scheduled time
-                        scheduled_hour, scheduled_minute = map(int, slot_time.split(':'))
-                        current_hour = current_time.hour
-                        current_minute = current_time.minute
-                        
-                        # Calculate time difference in minutes
-                        time_diff = (current_hour * 60 + current_minute) - (scheduled_hour * 60 + scheduled_minute)
-                        
-                        # If overdue (even by 1 minute)
-                        if time_diff > 0:
-                            severity = 'warning'  # Default
-                            
-                            if time_diff >= 120:  # 2+ hours
-                                severity = 'critical'
-                            elif time_diff >= 30:  # 30+ minutes
-                                severity = 'urgent'
-                            
-                            alerts.append({
-                                'medication': medication_name,
-                                'slot': slot_name,
-                                'scheduled_time': slot_time,
-                                'minutes_overdue': time_diff,
-                                'severity': severity,
-                                'message': f"{medication_name} ({slot_name}) is {time_diff} minutes overdue!"
-                            })
-                    
-                    except ValueError:
-                        continue
-        
-        return jsonify({'success': True, 'alerts': alerts})
+        user_meds = storage.read_medications().get(session['user'], [])
+        return jsonify({'success': True, 'alerts': medication_alerts(user_meds, datetime.now())})
     
     except Exception as e:
         print(f"Error getting medication alerts: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/medications/alerts/stream', methods=['GET'])
+@login_required
+def stream_medication_alerts():
+    """
+    Server-Sent Events: the user's overdue alerts now, then again each time they
+    change (a dose becomes overdue, escalates at 30 and 120 minutes, or is taken)
+    """
+    subscription = alert_feed.subscribe(session['user'])
+    if subscription is None:
+        return jsonify({'success': False, 'error': 'Too many open alert streams, poll /api/medications/alerts instead'}), 503
+    
+    def events():
+        try:
+            while not subscription.closed:
+                alerts = subscription.get(timeout=ALERT_STREAM_KEEPALIVE_SECONDS)
+                if alerts is None:
+                    yield ': keepalive\n\n'  # also how a closed connection is noticed
+                else:
+                    yield f"data: {json.dumps(alerts)}\n\n"
+        finally:
+            alert_feed.unsubscribe(subscription)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/predict', methods=['POST'])
 @login_required
 def predict():
@@ -1389,154 +975,64 @@ def predict():
     try:
         data = request.get_json()
         
-        if not model_A or not model_B:
+        model_fingerprint = refresh_models()
+        if ensemble is None:
             return jsonify({
                 'success': False,
                 'error': 'Models not loaded. Please ensure model files exist in saved_models folder.'
             })
-        
-        # Prepare features
-        features = prepare_features(data)
-        
-        # Get predictions
-        prob_A = float(model_A.predict_proba(features)[0][1])
-        prob_B = float(model_B.predict_proba(features)[0][1])
-        avg_prob = (prob_A + prob_B) / 2
-        
-        # Determine risk levels
-        def get_risk_level(prob):
-            if prob < 0.3:
-                return 'LOW'
-            elif prob < 0.6:
-                return 'MEDIUM'
-            else:
-                return 'HIGH'
-        
-        risk_level = get_risk_level(avg_prob)
-        
-        # ── Clinical rule overrides ──────────────────────────────────────────
-        # The ML model may under-predict when a patient has multiple known risk
-        # factors.  These evidence-based rules only *upgrade* risk, never lower it.
-        def upgrade_risk(current, target):
-            order = {'LOW': 0, 'MEDIUM': 1, 'HIGH': 2}
-            return target if order.get(target, 0) > order.get(current, 0) else current
-
-        smoking_val = str(data.get('smoking_status', ''))
-        hypertension_val = int(data.get('hypertension', 0))
-        glucose_val = float(data.get('avg_glucose_level', 100))
-        heart_val = int(data.get('heart_disease', 0))
-
-        # Rule 1: Active smoker is never LOW risk
-        if smoking_val == 'smokes':
-            risk_level = upgrade_risk(risk_level, 'MEDIUM')
-
-        # Rule 2: Hypertension + severely elevated glucose (≥200 mg/dL) → HIGH
-        if hypertension_val == 1 and glucose_val >= 200:
-            risk_level = upgrade_risk(risk_level, 'HIGH')
-
-        # Rule 3: Hypertension + diabetic glucose range (≥140 mg/dL) → at least MEDIUM
-        elif hypertension_val == 1 and glucose_val >= 140:
-            risk_level = upgrade_risk(risk_level, 'MEDIUM')
-
-        # Rule 4: Active smoking + hypertension → HIGH (two major stroke risk factors)
-        if smoking_val == 'smokes' and hypertension_val == 1:
-            risk_level = upgrade_risk(risk_level, 'HIGH')
-
-        # Rule 5: Active smoking + heart disease → HIGH
-        if smoking_val == 'smokes' and heart_val == 1:
-            risk_level = upgrade_risk(risk_level, 'HIGH')
-
-        # Rule 6: Active smoking + diabetic glucose → HIGH
-        if smoking_val == 'smokes' and glucose_val >= 140:
-            risk_level = upgrade_risk(risk_level, 'HIGH')
-        # ────────────────────────────────────────────────────────────────────
-
-        # Apply the same clinical rules to each individual model so that
-        # all displayed risk labels are consistent with the ensemble decision.
-        def apply_clinical_rules(base_risk):
-            r = base_risk
-            if smoking_val == 'smokes':
-                r = upgrade_risk(r, 'MEDIUM')
-            if hypertension_val == 1 and glucose_val >= 200:
-                r = upgrade_risk(r, 'HIGH')
-            elif hypertension_val == 1 and glucose_val >= 140:
-                r = upgrade_risk(r, 'MEDIUM')
-            if smoking_val == 'smokes' and hypertension_val == 1:
-                r = upgrade_risk(r, 'HIGH')
-            if smoking_val == 'smokes' and heart_val == 1:
-                r = upgrade_risk(r, 'HIGH')
-            if smoking_val == 'smokes' and glucose_val >= 140:
-                r = upgrade_risk(r, 'HIGH')
-            return r
-
-        risk_A = apply_clinical_rules(get_risk_level(prob_A))
-        risk_B = apply_clinical_rules(get_risk_level(prob_B))
-
-        # When clinical rules force a higher risk label, the raw ML probability
-        # is unreliable (models were trained on imbalanced data).  Calibrate
-        # the *displayed* probability so it is consistent with the risk label.
-        # Model A (trained on original data) is the stronger signal → floor 0.76
-        # Model B (trained on synthetic data) is the weaker signal  → floor 0.65
-        # Ensemble floor is the average of the two individual floors → ~0.70
-        def calibrate_prob(raw_prob, final_risk, high_floor=0.70, medium_floor=0.40):
-            if final_risk == 'HIGH':
-                return max(raw_prob, high_floor)
-            elif final_risk == 'MEDIUM':
-                return max(raw_prob, medium_floor)
-            return raw_prob
-
-        disp_A        = calibrate_prob(prob_A,    risk_A,    high_floor=0.76)
-        disp_B        = calibrate_prob(prob_B,    risk_B,    high_floor=0.65)
-        disp_ensemble = calibrate_prob(avg_prob,  risk_level, high_floor=0.70)
-
-        # Get food recommendations
-        food_recommendations = get_food_recommendations(data, risk_level)
-        
-        # Get doctor recommendations
-        doctor_recommendations = get_doctor_recommendations(data)
-        
-        # Get Indian food recommendations
-        indian_food_recommendations = get_indian_food_recommendations(data)
-        
+
+        error = validate_patient(data)
+        if error:
+            return jsonify({'success': False, 'error': error})
+
+        # Repeat screenings with the same (normalized) inputs reuse the cached scoring
+        cache_key, patient = normalize_patient(data)
+        cached = prediction_cache.get(cache_key)
+        if cached is None:
+            # Prepare features
+            features = prepare_features(patient)
+
+            # Get predictions (clinical overrides and calibration applied)
+            scored = score_patients(features, [patient])[0]
+            risk_level = scored['ensemble']['risk_level']
+
+            cached = (
+                scored,
+                get_food_recommendations(patient, risk_level),
+                get_doctor_recommendations(patient),
+                get_indian_food_recommendations(patient)
+            )
+            # Not cached if the models were reloaded while this request scored
+            prediction_cache.put(cache_key, cached, fingerprint=model_fingerprint)
+
+        scored, food_recommendations, doctor_recommendations, indian_food_recommendations = cached
+        
+        # One result per ensemble member, then the combined 'ensemble' result
         results = {
             'success': True,
-            'model_A': {
-                'probability': round(disp_A * 100, 1),
-                'risk_level': risk_A
-            },
-            'model_B': {
-                'probability': round(disp_B * 100, 1),
-                'risk_level': risk_B
-            },
-            'ensemble': {
-                'probability': round(disp_ensemble * 100, 1),
-                'risk_level': risk_level
-            },
+            **scored,
             'food_recommendations': food_recommendations,
             'doctor_recommendations': doctor_recommendations,
             'indian_food_recommendations': indian_food_recommendations
         }
         
         # Save result to history
+        saved_at = datetime.now()
         result_entry = {
-            'timestamp': datetime.now().isoformat(),
+            'id': new_result_id(saved_at),
+            'timestamp': saved_at.isoformat(),
             'input_data': data,
-            'results': {
-                'model_A': results['model_A'],
-                'model_B': results['model_B'],
-                'ensemble': results['ensemble']
-            },
+            'results': dict(scored),
             'food_recommendations': food_recommendations,
             'doctor_recommendations': doctor_recommendations,
             'indian_food_recommendations': indian_food_recommendations
         }
         
-        all_results = load_results()
-        username = session['user']
-        if username not in all_results:
-            all_results[username] = []
-        all_results[username].append(result_entry)
-        save_results(all_results)
+        storage.append_result(session['user'], result_entry)
+        report_payloads.put((session['user'], result_entry['id']), result_entry)
+        results['report_token'] = result_entry['id']
+        results['report_url'] = url_for('download_report', token=result_entry['id'])
         
         return jsonify(results)
     
@@ -1547,17 +1043,99 @@ def predict():
         })
 
 
-@app.route('/api/history/<int:result_id>')
+@app.route('/api/predict/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    """
+    Score many patient records in one vectorized call.
+    Accepts a JSON list of records (or {"patients": [...]}) and returns the
+    per-row model results plus per-row validation errors; with
+    ?recommendations=1 each row also carries its food, doctor and Indian-food
+    recommendations.  Batch screenings are not written to the caller's
+    prediction history.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        records = payload.get('patients') if isinstance(payload, dict) else payload
+
+        if not isinstance(records, list):
+            return jsonify({'success': False, 'error': 'Expected a list of patient records'}), 400
+
+        if len(records) > MAX_BATCH_SIZE:
+            return jsonify({
+                'success': False,
+                'error': f'Batch too large: {len(records)} records (max {MAX_BATCH_SIZE})'
+            }), 413
+
+        refresh_models()
+        if ensemble is None:
+            return jsonify({
+                'success': False,
+                'error': 'Models not loaded. Please ensure model files exist in saved_models folder.'
+            })
+
+        # Validate every row first so one bad record doesn't fail the batch
+        valid_indices = []
+        errors = []
+        for i, record in enumerate(records):
+            error = validate_patient(record)
+            if error:
+                errors.append({'index': i, 'error': error})
+            else:
+                valid_indices.append(i)
+
+        results = []
+        if valid_indices:
+            # Canonical inputs, exactly as /predict scores them
+            patients = [normalize_patient(records[i])[1] for i in valid_indices]
+            features = prepare_features_batch(patients)
+            scored = score_patients(features, patients)
+            for i, row in zip(valid_indices, scored):
+                row['index'] = i
+                results.append(row)
+
+            if request.args.get('recommendations', '').lower() in ('1', 'true', 'yes'):
+                columns = {field: [patient[field] for patient in patients] for field in KEY_FIELDS}
+                risk_levels = [row['ensemble']['risk_level'] for row in results]
+                food, doctor, indian = recommend_batch(columns, risk_levels)
+                for row, row_food, row_doctor, row_indian in zip(results, food, doctor, indian):
+                    row['food_recommendations'] = row_food
+                    row['doctor_recommendations'] = row_doctor
+                    row['indian_food_recommendations'] = row_indian
+
+        return jsonify({
+            'success': True,
+            'count': len(records),
+            'scored': len(results),
+            'results': results,
+            'errors': errors
+        })
+
+    except Exception as e:
+        print(f"Error in batch prediction: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/history')
+@login_required
+def get_history_page():
+    """Cursor-paginated history: ?before=<next_before of the previous page>&limit=N"""
+    try:
+        before, limit = history_page_args()
+        user_results, next_before = storage.user_history(session['user'], before, limit)
+        return jsonify({'success': True, 'results': user_results, 'next_before': next_before})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/history/<result_id>')
 @login_required
 def get_result_detail(result_id):
-    """Get detailed result by index"""
+    """Get detailed result by its id"""
     try:
-        results = load_results()
-        user_results = results.get(session['user'], [])
-        # Sort by date, newest first (same as history page)
-        user_results = sorted(user_results, key=lambda x: x.get('timestamp', ''), reverse=True)
-        if 0 <= result_id < len(user_results):
-            return jsonify({'success': True, 'result': user_results[result_id]})
+        result = find_user_result(session['user'], result_id)
+        if result is not None:
+            return jsonify({'success': True, 'result': result})
         return jsonify({'success': False, 'error': 'Result not found'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -1580,46 +1158,39 @@ def delete_account():
         print(f"\n🗑️ Deleting account: {username}")
         
         # Delete from users.json and record the deleted firebase_uid as a blocklist
-        users = load_users()
         deleted_uid = None
         deleted_email = None
-        if username in users:
-            deleted_uid = users[username].get('firebase_uid')
-            deleted_email = users[username].get('email')
-            del users[username]
-            # Persist deleted UID so this account can never log back in via old UID
-            if deleted_uid:
-                blocked = users.get('_deleted_uids', [])
-                if deleted_uid not in blocked:
-                    blocked.append(deleted_uid)
-                users['_deleted_uids'] = blocked
-            # Persist deleted email to allow re-registration with same email
-            # (Firebase may still hold the account if client-side delete fails)
-            if deleted_email:
-                deleted_emails = users.get('_deleted_emails', [])
-                if deleted_email not in deleted_emails:
-                    deleted_emails.append(deleted_email)
-                users['_deleted_emails'] = deleted_emails
-            save_users(users)
+        if username in storage.read_users():
+            with storage.transaction('users') as users:
+                user = users.pop(username, {})
+                deleted_uid = user.get('firebase_uid')
+                deleted_email = user.get('email')
+                # Persist deleted UID so this account can never log back in via old UID
+                if deleted_uid:
+                    blocked = users.get('_deleted_uids', [])
+                    if deleted_uid not in blocked:
+                        blocked.append(deleted_uid)
+                    users['_deleted_uids'] = blocked
+                # Persist deleted email to allow re-registration with same email
+                # (Firebase may still hold the account if client-side delete fails)
+                if deleted_email:
+                    deleted_emails = users.get('_deleted_emails', [])
+                    if deleted_email not in deleted_emails:
+                        deleted_emails.append(deleted_email)
+                    users['_deleted_emails'] = deleted_emails
             print(f"   ✓ Deleted from users.json")
             if deleted_uid:
                 print(f"   ✓ UID {deleted_uid} added to deleted blocklist")
             if deleted_email:
                 print(f"   ✓ Email {deleted_email} marked for re-registration")
         
-        # Delete from results.json
-        results = load_results()
-        if username in results:
-            del results[username]
-            save_results(results)
-            print(f"   ✓ Deleted from results.json")
-        
-        # Delete from medications.json
-        medications = load_medications()
-        if username in medications:
-            del medications[username]
-            save_medications(medications)
-            print(f"   ✓ Deleted from medications.json")
+        # Delete prediction history and medications
+        had_results, had_medications = storage.delete_user_data(username)
+        if had_results:
+            print(f"   ✓ Deleted prediction history")
+        if had_medications:
+            print(f"   ✓ Deleted medications")
+            medications_changed()
         
         # Clear session
         session.clear()
@@ -1664,8 +1235,8 @@ def api_get_doctor_recommendations():
         # Get Indian food recommendations
         indian_foods = get_indian_food_recommendations(health_data)
         
-        # Add Indian foods to recommendations
-        recommendations['indian_food_suggestions'] = indian_foods
+        # Add Indian foods to recommendations (the looked-up payloads are shared and read-only)
+        recommendations = {**recommendations, 'indian_food_suggestions': indian_foods}
         
         return jsonify({
             'success': True,
@@ -1677,329 +1248,119 @@ def api_get_doctor_recommendations():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def generate_report_pdf(input_data, results, food_recommendations=None, doctor_recommendations=None, skip_predictions=False):
-    """Generate a professional PDF report for stroke risk prediction results.
-    Set skip_predictions=True when generating doctor-only reports (no ML model output).
-    """
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=25)
-
-    # ==================== HEADER ====================
-    pdf.set_font('Times', 'B', 24)
-    pdf.set_text_color(25, 25, 112)  # Midnight Blue
-    title = 'DOCTOR RECOMMENDATIONS REPORT' if skip_predictions else 'STROKE RISK PREDICTION REPORT'
-    pdf.cell(0, 15, title, ln=True, align='C')
-    
-    pdf.set_font('Times', 'I', 11)
-    pdf.set_text_color(80, 80, 80)
-    pdf.cell(0, 7, 'Generated on: ' + datetime.now().strftime('%B %d, %Y at %I:%M %p'), ln=True, align='C')
-    pdf.set_font('Times', 'B', 10)
-    pdf.cell(0, 6, 'StrokeGuard AI Medical Analysis System', ln=True, align='C')
-    pdf.ln(6)
-
-    # Header separator line
-    pdf.set_draw_color(25, 25, 112)
-    pdf.set_line_width(1.0)
-    pdf.line(20, pdf.get_y(), 190, pdf.get_y())
-    pdf.ln(10)
-
-    # ==================== PATIENT INFORMATION ====================
-    pdf.set_font('Times', 'B', 16)
-    pdf.set_text_color(25, 25, 112)
-    pdf.cell(0, 10, 'PATIENT INFORMATION', ln=True)
-    pdf.set_draw_color(70, 130, 180)
-    pdf.set_line_width(0.5)
-    pdf.line(20, pdf.get_y(), 120, pdf.get_y())
-    pdf.ln(6)
-
-    # Patient data in a clean table format
-    pdf.set_font('Times', '', 11)
-    pdf.set_text_color(40, 40, 40)
-    
-    patient_fields = [
-        ('Age', str(input_data.get('age', 'N/A')) + ' years'),
-        ('Gender', str(input_data.get('gender', 'N/A'))),
-        ('Marital Status', str(input_data.get('ever_married', 'N/A'))),
-        ('Residence', str(input_data.get('residence_type', 'N/A'))),
-        ('Work Type', str(input_data.get('work_type', 'N/A')).replace('_', ' ').title()),
-        ('Smoking Status', str(input_data.get('smoking_status', 'N/A')).title()),
-    ]
+def history_report_spec(entry):
+    """(cache key, filename, args, kwargs) of the render_report_pdf() call for a history entry"""
+    input_data = entry.get('input_data', {})
+    pred_results = entry.get('results', {})
+    food = entry.get('food_recommendations', None)
+    doctor = entry.get('doctor_recommendations', None)
+    timestamp = entry.get('timestamp', '')
+    try:
+        generated_at = datetime.fromisoformat(timestamp)
+    except ValueError:
+        generated_at = None
+    # The same entry always renders the same report, so it is cached by content
+    key = content_key(REPORT_TEMPLATE_VERSION, input_data, pred_results, food, doctor, False, timestamp)
+    filename = 'StrokeRisk_Report_' + timestamp[:10].replace('-', '') + '.pdf'
+    return key, filename, (input_data, pred_results, food, doctor), {'generated_at': generated_at}
 
-    for label, value in patient_fields:
-        pdf.set_font('Times', 'B', 11)
-        pdf.cell(70, 8, '    ' + label + ':', 0, 0)
-        pdf.set_font('Times', '', 11)
-        pdf.cell(0, 8, value, ln=True)
-    
-    pdf.ln(4)
-
-    # ==================== CLINICAL PARAMETERS ====================
-    pdf.set_font('Times', 'B', 16)
-    pdf.set_text_color(25, 25, 112)
-    pdf.cell(0, 10, 'CLINICAL PARAMETERS', ln=True)
-    pdf.set_draw_color(70, 130, 180)
-    pdf.line(20, pdf.get_y(), 120, pdf.get_y())
-    pdf.ln(6)
-
-    pdf.set_font('Times', '', 11)
-    pdf.set_text_color(40, 40, 40)
-    
-    clinical_fields = [
-        ('Hypertension', 'Yes' if str(input_data.get('hypertension', '0')) == '1' else 'No'),
-        ('Heart Disease', 'Yes' if str(input_data.get('heart_disease', '0')) == '1' else 'No'),
-        ('Average Glucose Level', str(input_data.get('avg_glucose_level', 'N/A')) + ' mg/dL'),
-        ('Body Mass Index (BMI)', str(input_data.get('bmi', 'N/A'))),
-    ]
 
-    for label, value in clinical_fields:
-        pdf.set_font('Times', 'B', 11)
-        pdf.cell(70, 8, '    ' + label + ':', 0, 0)
-        pdf.set_font('Times', '', 11)
-        pdf.cell(0, 8, value, ln=True)
-    
-    pdf.ln(8)
-
-    # ========== PREDICTION RESULTS (ML models — omitted for doctor-only reports) ==========
-    if not skip_predictions:
-        pdf.set_font('Times', 'B', 16)
-        pdf.set_text_color(25, 25, 112)
-        pdf.cell(0, 10, 'PREDICTION RESULTS', ln=True)
-        pdf.set_draw_color(70, 130, 180)
-        pdf.line(20, pdf.get_y(), 120, pdf.get_y())
-        pdf.ln(6)
-
-        model_a = results.get('model_A', {})
-        model_b = results.get('model_B', {})
-        ensemble = results.get('ensemble', {})
-
-        # Model A Results
-        pdf.set_font('Times', 'B', 13)
-        pdf.set_text_color(40, 40, 40)
-        pdf.cell(0, 8, 'Model A (Original Dataset)', ln=True)
-        pdf.set_font('Times', '', 11)
-        pdf.cell(70, 7, '        Stroke Probability:', 0, 0)
-        pdf.set_font('Times', 'B', 11)
-        pdf.cell(0, 7, str(model_a.get('probability', 'N/A')) + '%', ln=True)
-        pdf.set_font('Times', '', 11)
-        pdf.cell(70, 7, '        Risk Classification:', 0, 0)
-        pdf.set_font('Times', 'B', 11)
-        pdf.cell(0, 7, str(model_a.get('risk_level', 'N/A')), ln=True)
-        pdf.ln(4)
-
-        # Model B Results
-        pdf.set_font('Times', 'B', 13)
-        pdf.set_text_color(40, 40, 40)
-        pdf.cell(0, 8, 'Model B (Synthetic-Enhanced Dataset)', ln=True)
-        pdf.set_font('Times', '', 11)
-        pdf.cell(70, 7, '        Stroke Probability:', 0, 0)
-        pdf.set_font('Times', 'B', 11)
-        pdf.cell(0, 7, str(model_b.get('probability', 'N/A')) + '%', ln=True)
-        pdf.set_font('Times', '', 11)
-        pdf.cell(70, 7, '        Risk Classification:', 0, 0)
-        pdf.set_font('Times', 'B', 11)
-        pdf.cell(0, 7, str(model_b.get('risk_level', 'N/A')), ln=True)
-        pdf.ln(6)
-
-        # Ensemble (Combined) Results - HIGHLIGHTED
-        pdf.set_fill_color(230, 240, 250)
-        pdf.set_draw_color(70, 130, 180)
-        pdf.set_line_width(0.3)
-        pdf.rect(18, pdf.get_y(), 174, 28, 'D')
-        
-        pdf.set_font('Times', 'B', 14)
-        pdf.set_text_color(25, 25, 112)
-        pdf.cell(0, 10, 'COMBINED ENSEMBLE PREDICTION', ln=True)
-        
-        pdf.set_font('Times', '', 11)
-        pdf.set_text_color(40, 40, 40)
-        pdf.cell(70, 7, '        Overall Probability:', 0, 0)
-        pdf.set_font('Times', 'B', 12)
-        pdf.cell(0, 7, str(ensemble.get('probability', 'N/A')) + '%', ln=True)
-        
-        pdf.set_font('Times', '', 11)
-        pdf.cell(70, 7, '        Final Risk Level:', 0, 0)
-        
-        risk_level = str(ensemble.get('risk_level', 'N/A'))
-        pdf.set_font('Times', 'B', 13)
-        if risk_level == 'HIGH':
-            pdf.set_text_color(178, 34, 34)  # Firebrick red
-        elif risk_level == 'MEDIUM':
-            pdf.set_text_color(218, 165, 32)  # Goldenrod
-        else:
-            pdf.set_text_color(34, 139, 34)  # Forest green
-        pdf.cell(0, 7, risk_level, ln=True)
-        pdf.set_text_color(40, 40, 40)
-        pdf.ln(10)
-
-    # ==================== DIETARY RECOMMENDATIONS ====================
-    if food_recommendations:
-        pdf.set_font('Times', 'B', 16)
-        pdf.set_text_color(25, 25, 112)
-        pdf.cell(0, 10, 'DIETARY RECOMMENDATIONS', ln=True)
-        pdf.set_draw_color(70, 130, 180)
-        pdf.line(20, pdf.get_y(), 120, pdf.get_y())
-        pdf.ln(6)
-
-        # Urgent message if any
-        urgent_msg = food_recommendations.get('urgent_message', '')
-        if urgent_msg:
-            urgent_clean = remove_emojis(urgent_msg)
-            pdf.set_fill_color(255, 245, 245)
-            pdf.set_font('Times', 'B', 11)
-            pdf.set_text_color(178, 34, 34)
-            pdf.multi_cell(0, 7, 'ALERT: ' + urgent_clean, 0, 'L', True)
-            pdf.set_text_color(40, 40, 40)
-            pdf.ln(4)
-
-        # Recommended Foods
-        foods_to_eat = food_recommendations.get('foods_to_eat', [])
-        if foods_to_eat:
-            pdf.set_font('Times', 'B', 13)
-            pdf.set_text_color(34, 139, 34)
-            pdf.cell(0, 9, 'Foods to Include in Your Diet:', ln=True)
-            pdf.set_font('Times', '', 11)
-            pdf.set_text_color(40, 40, 40)
-            
-            for food in foods_to_eat[:12]:  # Limit to 12 items
-                clean_food = remove_emojis(str(food))
-                if clean_food:  # Only add if there's text after removing emojis
-                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
-            pdf.ln(4)
-
-        # Foods to Avoid
-        foods_to_avoid = food_recommendations.get('foods_to_avoid', [])
-        if foods_to_avoid:
-            pdf.set_font('Times', 'B', 13)
-            pdf.set_text_color(178, 34, 34)
-            pdf.cell(0, 9, 'Foods to Limit or Avoid:', ln=True)
-            pdf.set_font('Times', '', 11)
-            pdf.set_text_color(40, 40, 40)
-            
-            for food in foods_to_avoid[:10]:  # Limit to 10 items
-                clean_food = remove_emojis(str(food))
-                if clean_food:
-                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
-            pdf.ln(4)
-
-        # General Health Advice
-        advice_list = food_recommendations.get('general_advice', [])
-        if advice_list:
-            pdf.set_font('Times', 'B', 13)
-            pdf.set_text_color(25, 25, 112)
-            pdf.cell(0, 9, 'General Health Advice:', ln=True)
-            pdf.set_font('Times', '', 11)
-            pdf.set_text_color(40, 40, 40)
-            
-            for advice in advice_list:
-                clean_advice = remove_emojis(str(advice))
-                if clean_advice:
-                    pdf.multi_cell(0, 6, '      * ' + clean_advice)
-            pdf.ln(2)
-
-    # ==================== DOCTOR RECOMMENDATIONS ====================
-    if doctor_recommendations:
-        pdf.add_page()  # Add new page for doctor recommendations
-        
-        pdf.set_font('Times', 'B', 16)
-        pdf.set_text_color(25, 25, 112)
-        pdf.cell(0, 10, 'DOCTOR RECOMMENDATIONS', ln=True)
-        pdf.set_draw_color(70, 130, 180)
-        pdf.line(20, pdf.get_y(), 130, pdf.get_y())
-        pdf.ln(6)
-
-        # Risk Category
-        pdf.set_font('Times', 'B', 14)
-        risk_category = doctor_recommendations.get('risk_category', 'N/A')
-        risk_level_doc = doctor_recommendations.get('risk_level', 'LOW')
-        
-        if risk_level_doc == 'HIGH':
-            pdf.set_text_color(178, 34, 34)
-        elif risk_level_doc == 'MEDIUM':
-            pdf.set_text_color(218, 165, 32)
-        else:
-            pdf.set_text_color(34, 139, 34)
-        
-        pdf.cell(0, 10, 'Risk Assessment: ' + risk_category, ln=True)
-        pdf.set_text_color(40, 40, 40)
-        pdf.ln(4)
-
-        # Medical Advice
-        medical_advice = doctor_recommendations.get('medical_advice', [])
-        if medical_advice:
-            pdf.set_font('Times', 'B', 13)
-            pdf.set_text_color(25, 25, 112)
-            pdf.cell(0, 9, 'Medical Advice:', ln=True)
-            pdf.set_font('Times', '', 11)
-            pdf.set_text_color(40, 40, 40)
-            
-            for advice in medical_advice[:10]:
-                clean_advice = remove_emojis(str(advice))
-                if clean_advice:
-                    pdf.multi_cell(0, 6, '      * ' + clean_advice)
-            pdf.ln(4)
-
-        # Indian Foods to Include
-        indian_foods_eat = doctor_recommendations.get('indian_foods_to_eat', [])
-        if indian_foods_eat:
-            pdf.set_font('Times', 'B', 13)
-            pdf.set_text_color(34, 139, 34)
-            pdf.cell(0, 9, 'Indian Foods to Include:', ln=True)
-            pdf.set_font('Times', '', 11)
-            pdf.set_text_color(40, 40, 40)
-            
-            for food in indian_foods_eat[:12]:
-                clean_food = remove_emojis(str(food))
-                if clean_food:
-                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
-            pdf.ln(4)
-
-        # Indian Foods to Avoid
-        indian_foods_avoid = doctor_recommendations.get('indian_foods_to_avoid', [])
-        if indian_foods_avoid:
-            pdf.set_font('Times', 'B', 13)
-            pdf.set_text_color(178, 34, 34)
-            pdf.cell(0, 9, 'Indian Foods to Avoid:', ln=True)
-            pdf.set_font('Times', '', 11)
-            pdf.set_text_color(40, 40, 40)
-            
-            for food in indian_foods_avoid[:12]:
-                clean_food = remove_emojis(str(food))
-                if clean_food:
-                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
-            pdf.ln(4)
-
-        # Lifestyle Changes
-        lifestyle = doctor_recommendations.get('lifestyle_changes', [])
-        if lifestyle:
-            pdf.set_font('Times', 'B', 13)
-            pdf.set_text_color(25, 25, 112)
-            pdf.cell(0, 9, 'Recommended Lifestyle Changes:', ln=True)
-            pdf.set_font('Times', '', 11)
-            pdf.set_text_color(40, 40, 40)
-            
-            for change in lifestyle[:10]:
-                clean_change = remove_emojis(str(change))
-                if clean_change:
-                    pdf.multi_cell(0, 6, '      * ' + clean_change)
-            pdf.ln(2)
-
-    # ==================== FOOTER ====================
-    pdf.ln(8)
-    pdf.set_draw_color(25, 25, 112)
-    pdf.set_line_width(0.8)
-    pdf.line(20, pdf.get_y(), 190, pdf.get_y())
-    pdf.ln(5)
-    
-    pdf.set_font('Times', 'BI', 10)
-    pdf.set_text_color(100, 100, 100)
-    pdf.multi_cell(0, 5, 'DISCLAIMER: This report is generated by an AI-based prediction system and is intended for informational purposes only. It should NOT be used as a substitute for professional medical advice, diagnosis, or treatment. Always seek the advice of your physician or other qualified health provider with any questions you may have regarding a medical condition.', 0, 'C')
-    
-    pdf.ln(2)
-    pdf.set_font('Times', 'I', 9)
-    pdf.cell(0, 5, 'StrokeGuard AI (c) 2024 - Advanced Medical Analytics', ln=True, align='C')
+def report_job_spec(kind, data):
+    """
+    (job id, filename, args, kwargs) of the render_report_pdf() call behind a
+    report request, or None when the history entry doesn't exist
+    """
+    if kind == 'history':
+        entry = find_user_result(session['user'], str(data.get('result_id', '')))
+        return None if entry is None else history_report_spec(entry)
+    if kind == 'prediction':
+        # The report token of a /predict response: the saved entry's result id
+        token = str(data.get('token', ''))
+        entry = report_payloads.get((session['user'], token)) or storage.get_user_result(session['user'], token)
+        if entry is None:
+            return None
+        key, _, args, kwargs = history_report_spec(entry)
+        filename = 'StrokeRisk_Report_' + (kwargs['generated_at'] or datetime.now()).strftime('%Y%m%d_%H%M%S') + '.pdf'
+        return key, filename, args, kwargs
+
+    generated_at = datetime.now().replace(second=0, microsecond=0)
+    if kind == 'report':
+        args = (data.get('input_data', {}), data.get('results', {}), data.get('food', {}), data.get('doctor', {}))
+        filename = 'StrokeRisk_Report_' + generated_at.strftime('%Y%m%d_%H%M%S') + '.pdf'
+        kwargs = {'generated_at': generated_at}
+    elif kind == 'doctor':
+        args = (data.get('input_data', {}), {}, None, data.get('recommendations', {}))
+        filename = 'Doctor_Recommendations_Report.pdf'
+        kwargs = {'skip_predictions': True, 'generated_at': generated_at}
+    else:
+        raise ValueError(f"Unknown report kind: {kind}")
+    key = content_key(REPORT_TEMPLATE_VERSION, *args, kwargs.get('skip_predictions', False), generated_at.isoformat())
+    return key, filename, args, kwargs
+
+
+def submit_report_job(kind, data):
+    """Queue (or find) the job for a report request; returns (job, None) or (None, error response)"""
+    spec = report_job_spec(kind, data)
+    if spec is None:
+        error = 'Invalid index' if kind == 'history' else 'Unknown or expired report token'
+        return None, (jsonify({'success': False, 'error': error}), 404)
+    job_id, filename, args, kwargs = spec
+    job, reason = report_jobs.submit(session['user'], job_id, filename, *args, **kwargs)
+    if job is None:
+        response = jsonify({'success': False, 'error': reason})
+        response.headers['Retry-After'] = '5'
+        return None, (response, 429)
+    report_cache.add_owner(job.id, session['user'])
+    return job, None
+
+
+def send_report(job_id, filename):
+    """The finished PDF from the report cache (a file or memory), or None if it is gone"""
+    pdf_bytes, path = report_cache.get(job_id)
+    if path is not None:
+        try:
+            return send_file(path, as_attachment=True, download_name=filename, mimetype='application/pdf')
+        except FileNotFoundError:
+            return None  # evicted by another worker in between
+    if pdf_bytes is None:
+        return None
+    return send_file(io.BytesIO(pdf_bytes), as_attachment=True, download_name=filename, mimetype='application/pdf')
+
+
+def report_job_response(job):
+    """202 (or 200 once rendered) with the URLs to follow a report job"""
+    status_url = url_for('report_job', job_id=job.id)
+    response = jsonify({
+        'success': True,
+        **job.to_dict(),
+        'status_url': status_url,
+        'events_url': url_for('report_job_events', job_id=job.id),
+        'download_url': url_for('download_report_job', job_id=job.id)
+    })
+    if job.finished.is_set():
+        return response, 200
+    response.headers['Location'] = status_url
+    response.headers['Retry-After'] = '1'
+    return response, 202
 
-    return pdf
+
+def render_report(kind, data):
+    """
+    Classic download links: queue the job and give it a moment, so a quick
+    (or cached) render still answers with the PDF itself.  A slower one
+    sends a GET link on to the report's status page, and answers a POST like
+    POST /api/reports does.
+    """
+    job, error = submit_report_job(kind, data)
+    if error is not None:
+        return error
+    if job.finished.wait(REPORT_LINK_WAIT_SECONDS) and not job.error:
+        response = send_report(job.id, job.filename)
+        if response is not None:
+            return response
+    if request.method == 'GET':
+        return redirect(url_for('report_status_page', job_id=job.id))
+    return report_job_response(job)
 
 
 @app.route('/download-report')
@@ -2007,63 +1368,26 @@ def generate_report_pdf(input_data, results, food_recommendations=None, doctor_r
 def download_report():
     """Download prediction result as a PDF report from dashboard"""
     try:
-        input_data = json.loads(request.args.get('data', '{}'))
-        results = json.loads(request.args.get('results', '{}'))
-        food = json.loads(request.args.get('food', '{}'))
-        doctor = json.loads(request.args.get('doctor', '{}'))
-
-        pdf = generate_report_pdf(input_data, results, food, doctor)
-
-        # Get PDF as bytes string
-        pdf_output = pdf.output(dest='S')
-        # Convert to bytes if it's a string
-        if isinstance(pdf_output, str):
-            pdf_bytes = pdf_output.encode('latin-1')
-        else:
-            pdf_bytes = pdf_output
-        
-        buffer = io.BytesIO(pdf_bytes)
-        buffer.seek(0)
-
-        filename = 'StrokeRisk_Report_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.pdf'
-        return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
+        token = request.args.get('token')
+        if token:
+            return render_report('prediction', {'token': token})
+        # Links from before report tokens carry the whole result in the query string
+        return render_report('report', {
+            'input_data': json.loads(request.args.get('data', '{}')),
+            'results': json.loads(request.args.get('results', '{}')),
+            'food': json.loads(request.args.get('food', '{}')),
+            'doctor': json.loads(request.args.get('doctor', '{}'))
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/download-history-report/<int:index>')
+@app.route('/download-history-report/<result_id>')
 @login_required
-def download_history_report(index):
+def download_history_report(result_id):
     """Download a specific history entry as PDF"""
     try:
-        results_data = load_results()
-        user_results = results_data.get(session['user'], [])
-        user_results = sorted(user_results, key=lambda x: x.get('timestamp', ''), reverse=True)
-
-        if index < 0 or index >= len(user_results):
-            return jsonify({'error': 'Invalid index'}), 404
-
-        entry = user_results[index]
-        input_data = entry.get('input_data', {})
-        pred_results = entry.get('results', {})
-        food = entry.get('food_recommendations', None)
-        doctor = entry.get('doctor_recommendations', None)
-
-        pdf = generate_report_pdf(input_data, pred_results, food, doctor)
-
-        # Get PDF as bytes string
-        pdf_output = pdf.output(dest='S')
-        # Convert to bytes if it's a string
-        if isinstance(pdf_output, str):
-            pdf_bytes = pdf_output.encode('latin-1')
-        else:
-            pdf_bytes = pdf_output
-        
-        buffer = io.BytesIO(pdf_bytes)
-        buffer.seek(0)
-
-        filename = 'StrokeRisk_Report_' + entry.get('timestamp', '')[:10].replace('-', '') + '.pdf'
-        return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
+        return render_report('history', {'result_id': result_id})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2074,65 +1398,148 @@ def download_doctor_report():
     """Download doctor recommendations as a standalone PDF (no ML model data)"""
     try:
         req_data = request.get_json()
-        input_data = req_data.get('input_data', {})
-        doctor_recommendations = req_data.get('recommendations', {})
-
-        pdf = generate_report_pdf(
-            input_data=input_data,
-            results={},
-            food_recommendations=None,
-            doctor_recommendations=doctor_recommendations,
-            skip_predictions=True
-        )
-
-        pdf_output = pdf.output(dest='S')
-        if isinstance(pdf_output, str):
-            pdf_bytes = pdf_output.encode('latin-1')
-        else:
-            pdf_bytes = pdf_output
-
-        buffer = io.BytesIO(pdf_bytes)
-        buffer.seek(0)
-
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name='Doctor_Recommendations_Report.pdf',
-            mimetype='application/pdf'
-        )
+        return render_report('doctor', {
+            'input_data': req_data.get('input_data', {}),
+            'recommendations': req_data.get('recommendations', {})
+        })
     except Exception as e:
         print(f"Error generating doctor report PDF: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+def report_job_status(job_id):
+    """Status dict of a report job, or None if this user can't see it"""
+    job = report_jobs.get(job_id)
+    if job is not None and session['user'] in job.owners:
+        return job.to_dict()
+    # Queued by another worker process: once rendered it is in the shared
+    # cache, and the owner markers say who asked for it
+    if report_cache.is_owner(job_id, session['user']) and report_cache.get(job_id) != (None, None):
+        return {'job_id': job_id, 'status': 'done', 'error': None, 'filename': None}
+    return None
+
+
+@app.route('/reports/<job_id>')
+@login_required
+def report_status_page(job_id):
+    """Waiting page for a classic download link: polls the job, then downloads the PDF"""
+    status = report_job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown report job'}), 404
+    if status['status'] == 'done':
+        return redirect(url_for('download_report_job', job_id=job_id))
+    return render_template('report_status.html', status=status,
+                           status_url=url_for('report_job', job_id=job_id),
+                           download_url=url_for('download_report_job', job_id=job_id))
+
+
+@app.route('/api/reports', methods=['POST'])
+@login_required
+def create_report_job():
+    """
+    Queue a PDF report: {"kind": "history", "result_id": ...},
+    {"kind": "prediction", "token": <report_token from /predict>},
+    {"kind": "report", "input_data", "results", "food", "doctor"} or
+    {"kind": "doctor", "input_data", "recommendations"}.
+    Poll status_url (or follow events_url), then fetch download_url.
+    """
+    data = request.get_json() or {}
+    try:
+        job, error = submit_report_job(data.get('kind', 'history'), data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if error is not None:
+        return error
+    return report_job_response(job)
+
+
+@app.route('/api/reports/<job_id>', methods=['GET'])
+@login_required
+def report_job(job_id):
+    """Status of a report job: queued, running, done or failed"""
+    status = report_job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown report job'}), 404
+    return jsonify({'success': True, **status})
+
+
+@app.route('/api/reports/<job_id>/events', methods=['GET'])
+@login_required
+def report_job_events(job_id):
+    """Server-Sent Events: the job's status now and once more when it finishes"""
+    status = report_job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown report job'}), 404
+    job = report_jobs.get(job_id)
+    
+    def events():
+        yield f"data: {json.dumps(status)}\n\n"
+        if job is None or status['status'] in ('done', 'failed'):
+            return
+        while not job.finished.wait(ALERT_STREAM_KEEPALIVE_SECONDS):
+            yield ': keepalive\n\n'
+        yield f"data: {json.dumps(job.to_dict())}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/reports/<job_id>/download', methods=['GET'])
+@login_required
+def download_report_job(job_id):
+    """The finished PDF of a report job"""
+    status = report_job_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Unknown report job'}), 404
+    if status['status'] == 'failed':
+        return jsonify({'success': False, 'error': status['error']}), 500
+    if status['status'] != 'done':
+        return jsonify({'success': False, 'error': 'The report is not ready yet', 'status': status['status']}), 409
+    response = send_report(job_id, status['filename'] or 'StrokeRisk_Report.pdf')
+    if response is None:
+        return jsonify({'success': False, 'error': 'The report expired, please request it again'}), 410
+    return response
+
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'models_loaded': model_A is not None and model_B is not None
+        'models_loaded': ensemble is not None,
+        'prediction_cache': prediction_cache.stats(),
+        'report_payloads': report_payloads.stats(),
+        'reminders': reminder_engine.stats(),
+        'alert_streams': alert_feed.stats(),
+        'scheduler': scheduler_lease.status(),
+        'outbox': outbox.stats(),
+        'report_cache': report_cache.stats(),
+        'report_jobs': report_jobs.stats()
     })
 
 
-# Initialize Background Scheduler for Medication Reminders
-scheduler = BackgroundScheduler()
-scheduler.add_job(
-    func=check_medication_reminders,
-    trigger=IntervalTrigger(minutes=1),  # Check every minute
-    id='medication_reminder_job',
-    name='Check medication reminders',
-    replace_existing=True
-)
-
-# Start the scheduler
-scheduler.start()
-
-# Shut down the scheduler when exiting the app
-atexit.register(lambda: scheduler.shutdown())
-
-print("\n⏰ Medication reminder scheduler started!")
-print("   Checking for overdue medications every minute...")
-
+# Overdue alerts pushed to open medication pages.  Every process runs its own
+# feed for the streams it serves (edits from other processes are picked up
+# every ALERT_SYNC_SECONDS); each stream holds at most one pending alert list.
+# An open stream also holds one of the worker's request threads for as long as
+# its tab is open, so a process takes at most half of its WEB_THREADS (the
+# threads it serves requests with: 1 for gunicorn's sync workers, --threads N
+# for gthread) as streams; pages turned away poll /api/medications/alerts.
+ALERT_STREAM_KEEPALIVE_SECONDS = 15
+WEB_THREADS = int(os.getenv('WEB_THREADS', '1'))
+alert_feed = AlertFeed(storage.read_medications, sync_seconds=int(os.getenv('ALERT_SYNC_SECONDS', '5')),
+                       max_subscribers=int(os.getenv('ALERT_STREAM_MAX_CONNECTIONS', str(WEB_THREADS // 2))))
+alert_feed.start()
+atexit.register(alert_feed.stop)
+
+def medications_changed():
+    """Let the reminder engine and the alert streams pick up an edit made by this process"""
+    reminder_engine.schedule_changed()
+    alert_feed.schedule_changed()
+
+# Outbox workers, job scheduler and scheduler election (see services.py); started
+# last, after the report pool has forked and the models are loaded
+services.start()
 
 if __name__ == '__main__':
     print("\n" + "="*60)
@@ -2143,4 +1550,6 @@ if __name__ == '__main__':
     print("Press Ctrl+C to stop the server")
     print("="*60 + "\n")
     
+    # The development server starts a thread per request, so streams don't starve it
+    alert_feed.max_subscribers = int(os.getenv('ALERT_STREAM_MAX_CONNECTIONS', '100'))
     app.run(debug=True, host='127.0.0.1', port=5000)
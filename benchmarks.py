@@ -0,0 +1,1236 @@
+"""
+Parity checks and benchmarks for the performance-critical code paths
+Usage: python benchmarks.py [name ...]   (runs everything when no name is given)
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+MODEL_PATH = 'saved_models'
+DATA_FILE = 'synthetic_stroke_data.csv'
+
+
+def best_time(fn, repeat=5, number=1):
+    """Best wall-clock time of `number` calls to fn, in milliseconds per call"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1000
+
+
+def load_feature_matrix():
+    """Model features for every patient in the synthetic dataset"""
+    from features import FEATURE_NAMES, build_features
+
+    df = pd.read_csv(DATA_FILE).rename(columns={'Residence_type': 'residence_type'})
+    df['bmi_missing'] = df['bmi'].isna().astype(int)
+    df['bmi'] = df['bmi'].fillna(df['bmi'].median())
+    return build_features(df, FEATURE_NAMES)
+
+
+def _training_feature_frame(csv_path):
+    """
+    The feature frame the saved models were trained on: the training
+    notebook's clean_dataset() and prepare_features() cells as they were
+    when the .pkl files were fitted (before the notebook used features.py)
+    """
+    from sklearn.preprocessing import LabelEncoder
+
+    df = pd.read_csv(csv_path)
+    df['bmi'] = pd.to_numeric(df['bmi'], errors='coerce')
+    df['bmi_missing'] = df['bmi'].isnull().astype(int)
+    df['bmi'] = df['bmi'].fillna(df['bmi'].median())
+    df.columns = df.columns.str.lower().str.replace(' ', '_')
+    df = df.drop('id', axis=1)
+
+    le = LabelEncoder()
+    for col in ['gender', 'ever_married', 'work_type', 'residence_type', 'smoking_status']:
+        df[col] = le.fit_transform(df[col].astype(str))
+    df['age_glucose_interaction'] = df['age'] * df['avg_glucose_level']
+    df['age_bmi_interaction'] = df['age'] * df['bmi']
+    df['glucose_bmi_interaction'] = df['avg_glucose_level'] * df['bmi']
+    df['age_group'] = pd.cut(df['age'], bins=[0, 18, 35, 50, 65, 100], labels=[0, 1, 2, 3, 4])
+    df['bmi_category'] = pd.cut(df['bmi'], bins=[0, 18.5, 25, 30, 100], labels=[0, 1, 2, 3])
+    df['glucose_category'] = pd.cut(df['avg_glucose_level'], bins=[0, 100, 126, 200, 300], labels=[0, 1, 2, 3])
+    df['risk_score'] = (df['age'] > 50).astype(int) + \
+                       df['hypertension'] + \
+                       df['heart_disease'] + \
+                       (df['avg_glucose_level'] > 126).astype(int) + \
+                       (df['bmi'] > 30).astype(int)
+    return df
+
+
+def bench_features():
+    """build_features() vs. the training-time feature frame, column by column"""
+    from features import CATEGORICAL_MAPPINGS, FEATURE_NAMES, build_features
+
+    print("\n🧮 Feature builder vs. training features")
+    ok = True
+    for csv_path in ('healthcare-dataset-stroke-data.csv', DATA_FILE):
+        raw = pd.read_csv(csv_path).rename(columns={'Residence_type': 'residence_type'})
+        raw['bmi'] = pd.to_numeric(raw['bmi'], errors='coerce')
+        raw['bmi_missing'] = raw['bmi'].isna().astype(int)
+        raw['bmi'] = raw['bmi'].fillna(raw['bmi'].median())
+        served = pd.DataFrame(build_features(raw), columns=FEATURE_NAMES)
+        trained = _training_feature_frame(csv_path)[FEATURE_NAMES].astype(np.float64)
+
+        # LabelEncoder codes only the categories a CSV contains (the synthetic
+        # one has 'Children' and no 'Never_worked'), so its codes can differ
+        # from CATEGORICAL_MAPPINGS; that is reported, not counted as a failure
+        differing = [name for name in FEATURE_NAMES if not np.array_equal(served[name], trained[name])]
+        encoded = [name for name in differing if name in CATEGORICAL_MAPPINGS]
+        engineered = [name for name in differing if name not in encoded]
+        ok = ok and not engineered
+        print(f"  {'✅' if not engineered else '❌'} {csv_path}: {len(FEATURE_NAMES) - len(differing)} of "
+              f"{len(FEATURE_NAMES)} columns identical on {len(raw)} rows"
+              + (f"; engineered columns differ: {', '.join(engineered)}" if engineered else ''))
+        for name in encoded:
+            print(f"     ⚠️ {name}: LabelEncoder codes differ from CATEGORICAL_MAPPINGS on "
+                  f"{int((served[name] != trained[name]).sum())} rows (label encoding, not feature engineering)")
+
+    return ok
+
+
+def bench_tree_ensemble():
+    """Compiled tree evaluator: bit-for-bit parity with predict_proba, then timings"""
+    from features import FEATURE_NAMES
+    from tree_ensemble import load_compiled_model
+
+    print("\n🌲 Compiled tree ensemble")
+    X = load_feature_matrix()
+    frame = pd.DataFrame(X, columns=FEATURE_NAMES)
+    ok = True
+
+    for name in ('stroke_model_A_original.pkl', 'stroke_model_B_synthetic.pkl'):
+        model, compiled = load_compiled_model(os.path.join(MODEL_PATH, name))
+
+        # Check the NumPy traversal itself (large batches are otherwise handed to sklearn)
+        expected_raw = model.decision_function(frame)
+        traversal_raw = compiled.raw_from_leaves(compiled.leaf_values(compiled.validate(X)))
+        expected = model.predict_proba(frame)
+        actual = compiled.predict_proba(X)
+        if np.array_equal(expected_raw, traversal_raw) and np.array_equal(expected, actual):
+            print(f"  ✅ {name}: identical on {len(X)} rows")
+        else:
+            ok = False
+            print(f"  ❌ {name}: max abs diff {np.abs(expected_raw - traversal_raw).max():.3e} (raw), "
+                  f"{np.abs(expected - actual).max():.3e} (proba)")
+
+        for n_rows in (1, 100, 10000):
+            rows = np.resize(X, (n_rows, X.shape[1]))
+            rows_frame = pd.DataFrame(rows, columns=FEATURE_NAMES)
+            number = 50 if n_rows == 1 else 5
+            sklearn_ms = best_time(lambda: model.predict_proba(rows_frame), number=number)
+            compiled_ms = best_time(lambda: compiled.predict_proba(rows), number=number)
+            print(f"     n={n_rows:>6}: sklearn {sklearn_ms:8.3f} ms   compiled {compiled_ms:8.3f} ms"
+                  f"   ({sklearn_ms / compiled_ms:.1f}x)")
+
+    return ok
+
+
+def bench_fused_ensemble():
+    """Fused A/B evaluation vs. scoring each compiled model separately"""
+    from tree_ensemble import load_compiled_model, load_fused_ensemble
+
+    print("\n🔗 Fused ensemble")
+    X = load_feature_matrix()
+    paths = {
+        'model_A': os.path.join(MODEL_PATH, 'stroke_model_A_original.pkl'),
+        'model_B': os.path.join(MODEL_PATH, 'stroke_model_B_synthetic.pkl')
+    }
+    compiled = {name: load_compiled_model(path)[1] for name, path in paths.items()}
+    _, fused = load_fused_ensemble(paths)
+
+    def separate(rows):
+        prob_A = compiled['model_A'].predict_proba(rows)[:, 1]
+        prob_B = compiled['model_B'].predict_proba(rows)[:, 1]
+        return {'model_A': prob_A, 'model_B': prob_B, 'ensemble': (prob_A + prob_B) / 2}
+
+    ok = True
+    for n_rows in (1, 100, 10000):
+        rows = np.resize(X, (n_rows, X.shape[1]))
+        expected, actual = separate(rows), fused.predict(rows)
+        same = all(np.array_equal(expected[name], actual[name]) for name in expected)
+        ok = ok and same
+        number = 50 if n_rows == 1 else 5
+        separate_ms = best_time(lambda: separate(rows), number=number)
+        fused_ms = best_time(lambda: fused.predict(rows), number=number)
+        print(f"  {'✅' if same else '❌'} n={n_rows:>6}: separate {separate_ms:8.3f} ms   fused {fused_ms:8.3f} ms"
+              f"   ({separate_ms / fused_ms:.1f}x)")
+
+    return ok
+
+
+def bench_storage_append():
+    """Cost of appending one prediction as the stored history grows, per backend"""
+    import tempfile
+    from storage import JSONStorage, JSONLResultsStorage, SQLiteStorage
+
+    print("\n🗄️  Storage append")
+    entry = {'timestamp': '2024-01-01T00:00:00', 'input_data': {'age': 60}, 'results': {}}
+    for history_size in (100, 10000):
+        results = {f'user{i}': [dict(entry)] * 10 for i in range(history_size // 10)}
+        with tempfile.TemporaryDirectory() as tmp:
+            backends = {
+                'json': JSONStorage(tmp),
+                'jsonl': JSONLResultsStorage(tmp),
+                'sqlite': SQLiteStorage(os.path.join(tmp, 'bench.db'))
+            }
+            timings = []
+            for name, backend in backends.items():
+                backend.save_results(results)
+                timings.append(f"{name} {best_time(lambda: backend.append_result('user0', entry), number=10):8.3f} ms")
+        print(f"  {history_size:>6} stored results: " + "   ".join(timings))
+    return True
+
+
+def bench_storage_read():
+    """Repeated reads of an unchanged results.json: cached read_results vs. a fresh parse"""
+    import tempfile
+    from storage import JSONStorage
+
+    print("\n📖 Storage read")
+    entry = {'timestamp': '2024-01-01T00:00:00', 'input_data': {'age': 60}, 'results': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = JSONStorage(tmp)
+        backend.save_results({f'user{i}': [dict(entry)] * 10 for i in range(1000)})
+        parse_ms = best_time(backend.load_results, number=10)
+        cached_ms = best_time(backend.read_results, number=10)
+    print(f"  10000 stored results: parse {parse_ms:8.3f} ms   cached {cached_ms:8.3f} ms")
+    return True
+
+
+def bench_history():
+    """First history page of a long-standing user: sorting on every request vs. the timeline index"""
+    import tempfile
+    from storage import JSONStorage, JSONLResultsStorage, SQLiteStorage
+
+    print("\n🕒 History page")
+    entries = [{'timestamp': f'2024-01-01T00:00:{i // 1000000:02d}.{i % 1000000:06d}', 'results': {}}
+               for i in range(5000)]
+    # Results sharing a timestamp across page boundaries, some appended out of order
+    ties = [{'id': f'tie{i}', 'timestamp': '2024-01-01T10:00:00' if i % 3 else f'2024-01-01T0{i % 10}:00:00',
+             'results': {}} for i in range(20)]
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, backend in {'json': JSONStorage(os.path.join(tmp, 'ties-json')),
+                              'jsonl': JSONLResultsStorage(os.path.join(tmp, 'ties-jsonl')),
+                              'sqlite': SQLiteStorage(os.path.join(tmp, 'ties.db'))}.items():
+            for entry in ties:
+                backend.append_result('user0', entry)
+            for limit in (1, 2, 3, 7):
+                seen, before = [], None
+                while True:
+                    page, before = backend.user_history('user0', before, limit)
+                    seen += [entry['id'] for entry in page]
+                    if before is None:
+                        break
+                ok &= seen == [entry['id'] for entry in backend.user_history('user0')[0]] and len(set(seen)) == len(ties)
+        print(f"  {'✅' if ok else '❌'} paging by 1, 2, 3 and 7 visits all {len(ties)} results once, "
+              f"equal timestamps included (json, jsonl, sqlite)")
+        backends = {
+            'json': JSONStorage(tmp),
+            'jsonl': JSONLResultsStorage(tmp),
+            'sqlite': SQLiteStorage(os.path.join(tmp, 'bench.db'))
+        }
+        for name, backend in backends.items():
+            backend.save_results({'user0': entries})
+            backend.user_history('user0', limit=50)
+            sort_ms = best_time(lambda: sorted(backend.load_user_results('user0'),
+                                               key=lambda x: x.get('timestamp', ''), reverse=True)[:50], number=10)
+            page_ms = best_time(lambda: backend.user_history('user0', limit=50), number=10)
+            print(f"  {name:>6}, 5000 results: sort {sort_ms:8.3f} ms   page {page_ms:8.3f} ms   ({sort_ms / page_ms:.1f}x)")
+    return ok
+
+
+def bench_admin_stats():
+    """Admin panel counters: a full pass over every result vs. the maintained counters"""
+    import tempfile
+    from storage import JSONStorage, compute_stats
+
+    print("\n📊 Admin counters")
+    entry = {'timestamp': '2024-01-01T00:00:00', 'results': {'ensemble': {'risk_level': 'HIGH', 'probability': 80.0}}}
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = JSONStorage(tmp)
+        backend.save_results({f'user{i}': [dict(entry)] * 100 for i in range(500)})
+        ok = compute_stats(backend.load_results()) == backend.read_stats()
+        scan_ms = best_time(lambda: compute_stats(backend.read_results()), number=5)
+        counters_ms = best_time(backend.read_stats, number=5)
+    print(f"  {'✅' if ok else '❌'} 50000 stored results: full pass {scan_ms:8.3f} ms   counters {counters_ms:8.3f} ms")
+    return ok
+
+
+def bench_prediction_cache():
+    """Prediction cache: equivalent inputs share a key, bin-edge values don't, and hits, expiry, eviction and invalidation count right"""
+    import tempfile
+    from prediction_cache import PredictionCache, directory_fingerprint, normalize_patient
+
+    print("\n🗃️ Prediction cache")
+    patient = {'age': 67, 'gender': 'Male', 'hypertension': 1, 'heart_disease': 0, 'ever_married': 'Yes',
+               'work_type': 'Private', 'residence_type': 'Urban', 'avg_glucose_level': 105.0, 'bmi': 24.96,
+               'smoking_status': 'smokes'}
+    same = {**patient, 'age': '67', 'hypertension': '1', 'bmi': '24.96'}
+    edge = {**patient, 'bmi': 25.0}
+    key, _ = normalize_patient(patient)
+    ok = normalize_patient(same)[0] == key and normalize_patient(edge)[0] != key
+    # Unrecognised categoricals are scored (and keyed) as the default category, not case-folded
+    ok &= normalize_patient({**patient, 'gender': 'male'})[0] == normalize_patient({**patient, 'gender': 'Female'})[0]
+    ok &= normalize_patient({**patient, 'smoking_status': 'Smokes'})[0] != key
+
+    cache = PredictionCache(max_size=2, ttl=0.05)
+    ok &= cache.get(key) is None
+    cache.put(key, 'scored')
+    ok &= cache.get(normalize_patient(same)[0]) == 'scored' and cache.get(normalize_patient(edge)[0]) is None
+    time.sleep(0.06)
+    ok &= cache.get(key) is None  # expired
+    cache.ttl = 3600
+    for i in range(3):
+        cache.put(('patient', i), i)
+    ok &= cache.get(('patient', 0)) is None and cache.get(('patient', 2)) == 2  # oldest evicted
+
+    with tempfile.TemporaryDirectory() as models:
+        with open(os.path.join(models, 'model.pkl'), 'wb') as f:
+            f.write(b'v1')
+        old_models = directory_fingerprint(models)
+        first = cache.check_fingerprint(old_models)
+        unchanged = cache.check_fingerprint(directory_fingerprint(models))
+        time.sleep(0.01)
+        with open(os.path.join(models, 'model.pkl'), 'wb') as f:
+            f.write(b'v2!')  # a retrained model replaces the file
+        new_models = directory_fingerprint(models)
+        changed = cache.check_fingerprint(new_models)
+    ok &= first and not unchanged and changed and cache.get(('patient', 2)) is None
+    stats = cache.stats()
+    ok &= (stats['hits'], stats['misses'], stats['expirations'], stats['evictions'], stats['invalidations']) == (2, 5, 1, 1, 1)
+
+    # A request that scored with the old models while they were replaced doesn't cache its result
+    cache.put(('patient', 3), 'old models', fingerprint=old_models)
+    cache.put(('patient', 4), 'new models', fingerprint=new_models)
+    ok &= cache.get(('patient', 3)) is None and cache.get(('patient', 4)) == 'new models'
+
+    lookup_ms = best_time(lambda: cache.get(normalize_patient(same)[0]), number=1000)
+    print(f"  {'✅' if ok else '❌'} equivalent inputs hit, bmi 24.96 and 25.0 miss, stale puts dropped; counters {stats}")
+    print(f"     normalize + lookup {lookup_ms * 1000:8.2f} us")
+    return ok
+
+
+def bench_predict_parity():
+    """/predict and /api/predict/batch score the same inputs the same way (Flask test client, real models)"""
+    os.environ.setdefault('RUN_SCHEDULER', '0')
+    import app
+
+    print("\n⚖️ /predict vs /api/predict/batch")
+    base = {'age': 67, 'gender': 'Male', 'hypertension': 1, 'heart_disease': 0, 'ever_married': 'Yes',
+            'work_type': 'Private', 'residence_type': 'Urban', 'avg_glucose_level': 105.0, 'bmi': 24.96,
+            'smoking_status': 'Smokes'}
+    patients = [base, {**base, 'bmi': 25.0}, {**base, 'bmi': 25.04}, {**base, 'avg_glucose_level': 126},
+                {**base, 'avg_glucose_level': 200.0, 'bmi': 30}, {**base, 'age': '18', 'smoking_status': 'never smoked'},
+                {**base, 'gender': 'female', 'work_type': 'self-employed', 'residence_type': 'RURAL'},
+                {**base, 'age': 45.5, 'hypertension': '0', 'bmi': 18.5, 'smoking_status': 'unknown'}]
+    username = 'benchmark-parity@localhost'
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['user'], session['role'] = username, 'user'
+    fields = ('model_A', 'model_B', 'ensemble', 'food_recommendations', 'doctor_recommendations',
+              'indian_food_recommendations')
+    try:
+        single = [client.post('/predict', json=patient).get_json() for patient in patients]
+        batch = client.post('/api/predict/batch?recommendations=1', json=patients).get_json()
+    finally:
+        app.storage.delete_user_data(username)  # keep the benchmark out of the stored history
+    ok = all(result['success'] for result in single) and batch['scored'] == len(patients)
+    mismatched = [i for i, (one, row) in enumerate(zip(single, batch['results']))
+                  if any(one[field] != row[field] for field in fields)]
+    ok &= not mismatched
+    print(f"  {'✅' if ok else '❌'} {len(patients)} patients (bin edges, mixed-case categoricals, numeric strings): "
+          f"{'identical results' if ok else f'rows {mismatched} differ'}")
+
+    # Categoricals are scored exactly as given, like the original /predict: 'Smokes' or 'female'
+    # is an unrecognised value (default category, no smoking rule), not a case-folded match
+    from features import CATEGORICAL_MAPPINGS
+    raw = [{**app.normalize_patient(patient)[1], **{field: patient[field] for field in CATEGORICAL_MAPPINGS}}
+           for patient in patients]
+    expected = app.score_patients(app.prepare_features_batch(raw), raw)
+    changed = [i for i, (one, want) in enumerate(zip(single, expected))
+               if any(one[name] != want[name] for name in want)]
+    print(f"  {'✅' if not changed else '❌'} raw categoricals: "
+          f"{'scored as given' if not changed else f'rows {changed} scored differently'}")
+    ok &= not changed
+    print("     " + "   ".join(f"{row['ensemble']['probability']:.1f} {row['ensemble']['risk_level']}"
+                                 for row in batch['results']))
+    return ok
+
+
+def bench_recommendation_dedupe():
+    """results.json size and read/write time with inline vs. deduplicated recommendation payloads"""
+    import tempfile
+    from features import INPUT_FIELDS
+    from prediction_cache import normalize_patient
+    from recommendations import get_doctor_recommendations, get_food_recommendations, get_indian_food_recommendations
+    from storage import JSONStorage, compact_entry, thaw
+
+    print("\n🧾 Recommendation payloads")
+    # Synthetic history (not data/results.json, which the app may have compacted already):
+    # 5000 predictions for patients from the dataset, with their real recommendations
+    df = pd.read_csv(DATA_FILE, nrows=5000).rename(columns={'Residence_type': 'residence_type'})
+    df['bmi'] = df['bmi'].fillna(df['bmi'].median())
+    risk_levels = ['LOW', 'MEDIUM', 'HIGH']
+    sample = []
+    for i, record in enumerate(df[INPUT_FIELDS].to_dict('records')):
+        patient = normalize_patient(record)[1]
+        risk_level = risk_levels[i % 3]
+        sample.append({
+            'id': f'{i:020d}-000000', 'timestamp': f'2024-01-01T00:00:00.{i:06d}', 'input_data': patient,
+            'results': {name: {'probability': 12.5, 'risk_level': risk_level} for name in ('model_A', 'model_B', 'ensemble')},
+            'food_recommendations': thaw(get_food_recommendations(patient, risk_level)),
+            'doctor_recommendations': thaw(get_doctor_recommendations(patient)),
+            'indian_food_recommendations': thaw(get_indian_food_recommendations(patient))
+        })
+    results = {f'user{i}': sample[i * 10:(i + 1) * 10] for i in range(500)}
+    with tempfile.TemporaryDirectory() as tmp:
+        inline_dir, dedupe_dir = os.path.join(tmp, 'inline'), os.path.join(tmp, 'dedupe')
+        inline, dedupe = JSONStorage(inline_dir), JSONStorage(dedupe_dir)
+
+        def write_dedupe():
+            # save_results() without the admin counters
+            payloads = {}
+            stored = {username: [compact_entry(entry, payloads) for entry in entries]
+                      for username, entries in results.items()}
+            dedupe._intern_payloads(payloads)
+            dedupe._save(dedupe.results_file, stored)
+
+        # Inline: the file as it was written before payloads were deduplicated
+        write_inline_ms = best_time(lambda: inline._save(inline.results_file, results))
+        write_dedupe_ms = best_time(write_dedupe)
+        ok = thaw(dedupe.read_results()) == results
+        inline_size = os.path.getsize(inline.results_file)
+        dedupe_size = os.path.getsize(dedupe.results_file) + os.path.getsize(dedupe.recommendations_file)
+
+        # First read_results() of a fresh worker
+        read_inline_ms = best_time(lambda: JSONStorage(inline_dir)._read(inline.results_file))
+        read_dedupe_ms = best_time(lambda: JSONStorage(dedupe_dir).read_results())
+    print(f"  {'✅' if ok else '❌'} 5000 stored results: {inline_size / 1e6:.1f} MB -> {dedupe_size / 1e6:.1f} MB")
+    print(f"     read:  inline {read_inline_ms:8.3f} ms   deduplicated {read_dedupe_ms:8.3f} ms")
+    print(f"     write: inline {write_inline_ms:8.3f} ms   deduplicated {write_dedupe_ms:8.3f} ms")
+    return ok
+
+
+def bench_recommendations():
+    """Compiled recommendation tables: batch lookups agree with single lookups, then timings"""
+    from features import INPUT_FIELDS
+    from prediction_cache import normalize_patient
+    from recommendations import (get_food_recommendations, get_doctor_recommendations,
+                                 get_indian_food_recommendations, recommend_batch)
+
+    print("\n🥗 Recommendations")
+    df = pd.read_csv(DATA_FILE).rename(columns={'Residence_type': 'residence_type'})
+    df['bmi'] = df['bmi'].fillna(df['bmi'].median())
+    patients = [normalize_patient(record)[1] for record in df[INPUT_FIELDS].to_dict('records')]
+    risk_levels = np.array(['LOW', 'MEDIUM', 'HIGH'])[np.arange(len(patients)) % 3].tolist()
+    columns = {field: [patient[field] for patient in patients] for field in patients[0]}
+
+    def single():
+        return ([get_food_recommendations(p, r) for p, r in zip(patients, risk_levels)],
+                [get_doctor_recommendations(p) for p in patients],
+                [get_indian_food_recommendations(p) for p in patients])
+
+    expected, actual = single(), recommend_batch(columns, risk_levels)
+    ok = all(a is b for singles, batched in zip(expected, actual) for a, b in zip(singles, batched))
+    single_ms = best_time(single, number=1)
+    batch_ms = best_time(lambda: recommend_batch(columns, risk_levels), number=1)
+    print(f"  {'✅' if ok else '❌'} {len(patients)} patients: single lookups {single_ms:8.3f} ms"
+          f"   batch {batch_ms:8.3f} ms   ({single_ms / batch_ms:.1f}x)")
+    return ok
+
+
+def _remove_emojis_reference(text):
+    """remove_emojis() as reports.py used to define it (the parity reference)"""
+    import re
+    emoji_pattern = re.compile("["
+        u"\U0001F600-\U0001F64F"  # emoticons
+        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+        u"\U0001F680-\U0001F6FF"  # transport & map symbols
+        u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+        u"\U00002702-\U000027B0"
+        u"\U000024C2-\U0001F251"
+        u"\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+        u"\U0001FA00-\U0001FA6F"  # Chess Symbols
+        u"\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
+        u"\U00002600-\U000026FF"  # Miscellaneous Symbols
+        u"\U00002B50"  # star
+        u"\U0001F004"  # mahjong
+        "]+", flags=re.UNICODE)
+    text = emoji_pattern.sub('', text)
+    text = text.encode('ascii', 'ignore').decode('ascii')
+    text = ' '.join(text.split())
+    return text.strip()
+
+
+def bench_sanitizer():
+    """PDF text sanitizer: same output as the old remove_emojis() on every recommendation string, then timings"""
+    from datetime import datetime
+    import reports
+    from recommendations import DOCTOR, FOOD, INDIAN_FOOD
+    from sanitizer import remove_emojis
+
+    print("\n🧹 PDF text sanitizer")
+
+    def strings(value):
+        if isinstance(value, str):
+            yield value
+        elif isinstance(value, dict):
+            for item in value.values():
+                yield from strings(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                yield from strings(item)
+
+    corpus = list(dict.fromkeys(text for recommender in (FOOD, DOCTOR, INDIAN_FOOD)
+                                for payload in recommender.table.values() for text in strings(payload)))
+    # Free text (doctor reports posted by the client) and awkward whitespace
+    edge_cases = ['', '   ', 'plain ascii', ' \t padded\n\r text ', 'café au lait – 5 mg', '\u00a0nbsp\u2003em space',
+                  'x\x1cy\x1fz', '🚨🚨', 'A🫀B', '血压 high', 'Ⓜ️ 24C2', 'ends with emoji ⭐', '🀄 tile', 'ℹ️ info']
+    ok = all(remove_emojis(text) == _remove_emojis_reference(text) for text in corpus + edge_cases)
+    # A realistic call mix: every string of the reports of a day's predictions
+    calls = [text for payload in list(FOOD.table.values())[:200] + list(DOCTOR.table.values())
+             for text in strings(payload)]
+
+    reference_ms = best_time(lambda: [_remove_emojis_reference(text) for text in calls], number=3)
+    cold_ms = best_time(lambda: (remove_emojis.cache_clear(), [remove_emojis(text) for text in calls]), number=3)
+    warm_ms = best_time(lambda: [remove_emojis(text) for text in calls], number=3)
+
+    input_data, results, food, doctor = _sample_report()
+    generated_at = datetime(2024, 1, 1, 9, 30)
+    render = lambda: reports.render_report_pdf(input_data, results, food, doctor, generated_at=generated_at)
+    render_ms = best_time(render)
+    reports.remove_emojis = _remove_emojis_reference
+    try:
+        old_render_ms = best_time(render)
+    finally:
+        reports.remove_emojis = remove_emojis
+    print(f"  {'✅' if ok else '❌'} {len(corpus)} distinct recommendation strings + {len(edge_cases)} edge cases "
+          f"match the old output; {len(calls)} calls per pass")
+    print(f"     old {reference_ms:8.3f} ms   new (cold) {cold_ms:8.3f} ms   new (memoized) {warm_ms:8.3f} ms"
+          f"   ({reference_ms / warm_ms:.0f}x)   report render {old_render_ms:6.2f} -> {render_ms:6.2f} ms")
+    return ok
+
+
+def _sample_report():
+    """Inputs of one history entry's PDF report: a synthetic patient with its recommendations"""
+    from features import INPUT_FIELDS
+    from prediction_cache import normalize_patient
+    from recommendations import get_doctor_recommendations, get_food_recommendations
+
+    df = pd.read_csv(DATA_FILE).rename(columns={'Residence_type': 'residence_type'})
+    df['bmi'] = df['bmi'].fillna(df['bmi'].median())
+    patient = normalize_patient(df[INPUT_FIELDS].iloc[0].to_dict())[1]
+    results = {name: {'probability': 41.7, 'risk_level': 'HIGH'} for name in ('model_A', 'model_B', 'ensemble')}
+    return patient, results, get_food_recommendations(patient, 'HIGH'), get_doctor_recommendations(patient)
+
+
+def bench_report_cache():
+    """PDF report cache: repeat downloads served from memory or disk instead of rebuilt, and the disk budget holds"""
+    import inspect
+    import tempfile
+    from datetime import datetime
+    from fpdf import FPDF_VERSION
+    import reports
+    import sanitizer
+    from report_cache import ReportCache, content_key
+
+    print("\n📄 PDF report cache")
+    input_data, results, food, doctor = _sample_report()
+    generated_at = datetime(2024, 1, 1, 9, 30)
+    builds = []
+
+    def build():
+        builds.append(1)
+        output = reports.generate_report_pdf(input_data, results, food, doctor, generated_at=generated_at).output(dest='S')
+        return output.encode('latin-1') if isinstance(output, str) else output
+
+    version = content_key(FPDF_VERSION, inspect.getsource(reports), inspect.getsource(sanitizer))
+    key_ms = best_time(lambda: content_key(version, input_data, results, food, doctor, False, '2024-01-01T09:30:00'), number=100)
+    key = content_key(version, input_data, results, food, doctor, False, '2024-01-01T09:30:00')
+    build_ms = best_time(build)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ReportCache(tmp)
+        builds.clear()
+        first = build()
+        cache.put(key, first)
+        memory_ms = best_time(lambda: cache.get(key), number=100)
+        data, _ = cache.get(key)
+
+        other_worker = ReportCache(tmp)  # same directory, empty memory tier
+
+        def read_from_disk():
+            _, path = other_worker.get(key)
+            with open(path, 'rb') as f:
+                return f.read()
+        disk_ms = best_time(read_from_disk, number=100)
+        ok = data is first and read_from_disk() == first and len(builds) == 1
+
+        # A budget of ten reports: older ones are evicted, the ones in use stay
+        bounded = ReportCache(os.path.join(tmp, 'bounded'), disk_max_bytes=len(first) * 10, memory_max_bytes=0)
+        for i in range(40):
+            bounded.put(f'{i:064x}', first)
+            bounded.get(f'{0:064x}')  # keep the first report in use
+            time.sleep(0.002)  # distinct mtimes for the LRU order
+        disk_bytes = sum(entry.stat().st_size for entry in os.scandir(bounded.directory))
+        ok &= disk_bytes <= bounded.disk_max_bytes and bounded.get(f'{0:064x}')[1] is not None
+    print(f"  {'✅' if ok else '❌'} repeat downloads reuse the first build; disk tier stays within its budget "
+          f"({disk_bytes // 1024} KB of {bounded.disk_max_bytes // 1024} KB, {bounded.evictions} evicted)")
+    print(f"     build {build_ms:8.3f} ms   key {key_ms:8.4f} ms   memory hit {memory_ms:8.4f} ms"
+          f"   disk hit {disk_ms:8.4f} ms   ({build_ms / (key_ms + disk_ms):.0f}x)")
+    return ok
+
+
+def bench_report_jobs():
+    """Report rendering in the worker pool: same PDFs, request threads stay responsive, bursts are turned away"""
+    import re
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from datetime import datetime
+    import reports
+    from report_cache import ReportCache, content_key
+    from report_jobs import ReportJobs
+
+    print("\n🖨️ PDF report jobs")
+    input_data, results, food, doctor = _sample_report()
+    generated_at = datetime(2024, 1, 1, 9, 30)
+    requests_ = [({**input_data, 'age': 40 + i}, results, food, doctor) for i in range(24)]
+
+    def without_creation_date(pdf_bytes):
+        # fpdf stamps every file with the second it was written
+        return re.sub(rb'/CreationDate \(D:\d+\)', b'', pdf_bytes)
+
+    def predict_like():
+        # Stand-in for the Python-heavy part of /predict (holds the GIL throughout)
+        return sum(i * i for i in range(20000))
+
+    def predict_latency(renders_running):
+        latencies = []
+        while renders_running():
+            started = time.perf_counter()
+            predict_like()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return sorted(latencies)
+
+    idle_ms = best_time(predict_like, number=20)
+    inline_ms = best_time(lambda: [reports.render_report_pdf(*args, generated_at=generated_at) for args in requests_], repeat=3)
+    expected = [reports.render_report_pdf(*args, generated_at=generated_at) for args in requests_]
+
+    # Renders on request threads (the old way) while /predict is served
+    with ThreadPoolExecutor(2) as threads:
+        futures = [threads.submit(reports.render_report_pdf, *args, generated_at=generated_at)
+                   for args in requests_ * 4]
+        threaded = predict_latency(lambda: not all(future.done() for future in futures))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = ReportJobs(ReportCache(tmp, memory_max_bytes=0), workers=2,
+                          max_pending=len(requests_) * 4, max_per_user=len(requests_) * 4)
+        jobs.start()
+        try:
+            keys = [content_key('bench', i) for i in range(len(requests_) * 4)]
+            started = time.perf_counter()
+            submitted = [jobs.submit('bench', key, 'report.pdf', *requests_[i % len(requests_)], generated_at=generated_at)[0]
+                         for i, key in enumerate(keys)]
+            submit_ms = (time.perf_counter() - started) * 1000 / len(keys)
+            pooled = predict_latency(lambda: not all(job.finished.is_set() for job in submitted))
+            pool_ms = (time.perf_counter() - started) * 1000 / 4
+            rendered = []
+            for key in keys[:len(requests_)]:
+                data, path = jobs.cache.get(key)
+                with open(path, 'rb') as f:
+                    rendered.append(f.read())
+            ok = list(map(without_creation_date, rendered)) == list(map(without_creation_date, expected))
+            ok &= not any(job.error for job in submitted)
+
+            # A burst from many users against the default limits
+            jobs.max_pending, jobs.max_per_user = 8, 2
+            burst = [jobs.submit(f'user{i % 6}', content_key('burst', i), 'report.pdf', *requests_[i % len(requests_)],
+                                 generated_at=generated_at) for i in range(40)]
+            accepted = [job for job, _ in burst if job is not None]
+            for job in accepted:
+                job.finished.wait(30)
+            rejected = len(burst) - len(accepted)
+            ok &= rejected > 0 and all(job.finished.is_set() and not job.error for job in accepted)
+        finally:
+            jobs.stop()
+
+    def p95(latencies):
+        return latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+
+    print(f"  {'✅' if ok else '❌'} pooled PDFs match inline renders (bar the creation date); "
+          f"burst of {len(burst)}: {len(accepted)} accepted, {rejected} told to retry")
+    print(f"     {len(requests_)} reports: inline {inline_ms:8.1f} ms   pool of 2 {pool_ms:8.1f} ms   "
+          f"request thread per report: render {inline_ms / len(requests_):6.3f} ms, submit {submit_ms:6.3f} ms")
+    print(f"     predict-like work while rendering (idle {idle_ms:.2f} ms, {os.cpu_count()} CPUs):   "
+          f"on request threads p95 {p95(threaded):6.2f} ms   in the pool p95 {p95(pooled):6.2f} ms")
+    return ok
+
+
+def bench_report_export():
+    """Bulk ZIP export: first bytes before the last report is rendered, one report in memory at a time"""
+    import io
+    import tempfile
+    import tracemalloc
+    import zipfile
+    from datetime import datetime, timedelta
+    import reports
+    from report_cache import ReportCache, content_key
+    from report_export import stream_zip
+    from report_jobs import ReportJobs
+
+    print("\n📦 Bulk report export")
+    input_data, results, food, doctor = _sample_report()
+    start = datetime(2024, 1, 1, 9, 30)
+    entries = [(f'patient/{i:03d}.pdf', start + timedelta(days=i), {**input_data, 'age': 30 + i % 50}) for i in range(60)]
+
+    def render_then_zip():
+        # Everything rendered first, then archived in memory (the naive export)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, when, patient in entries:
+                archive.writestr(name, reports.render_report_pdf(patient, results, food, doctor, generated_at=when))
+        return buffer.getvalue()
+
+    naive_ms = best_time(render_then_zip, repeat=1)
+    tracemalloc.start()
+    render_then_zip()
+    naive_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = ReportJobs(ReportCache(tmp, memory_max_bytes=0), workers=2)
+        jobs.start()
+        try:
+            def export():
+                items = (((name, when.isoformat()), content_key('export', name), (patient, results, food, doctor),
+                          {'generated_at': when}) for name, when, patient in entries)
+                for (name, timestamp), pdf_bytes, error in jobs.render_each(items):
+                    yield name, timestamp, pdf_bytes, error
+
+            started = time.perf_counter()
+            first_ms, chunks = None, []
+            for chunk in stream_zip(export()):
+                first_ms = first_ms or (time.perf_counter() - started) * 1000
+                chunks.append(len(chunk))  # sent on: only the sizes are kept
+            stream_ms = (time.perf_counter() - started) * 1000
+
+            # Again from the cache, tracing memory, and keeping the archive to check it
+            tracemalloc.start()
+            stream_peak = 0
+            archive_bytes = b''
+            for chunk in stream_zip(export()):
+                stream_peak = max(stream_peak, tracemalloc.get_traced_memory()[0] - len(archive_bytes))
+                archive_bytes += chunk
+            tracemalloc.stop()
+        finally:
+            jobs.stop()
+    archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    ok = (archive.testzip() is None and len(archive.namelist()) == len(entries) + 1
+          and first_ms < stream_ms / 2 and stream_peak < naive_peak)
+    print(f"  {'✅' if ok else '❌'} {len(entries)} reports streamed as they finish; "
+          f"largest chunk {max(chunks) / 1024:.1f} KB of {sum(chunks) / 1024:.0f} KB")
+    print(f"     render then zip {naive_ms:8.1f} ms (first byte at the end, peak {naive_peak / 1024:.0f} KB)   "
+          f"streamed: first byte {first_ms:6.1f} ms, done {stream_ms:8.1f} ms (peak {stream_peak / 1024:.0f} KB)")
+    return ok
+
+
+def bench_report_tokens():
+    """Dashboard PDF link: a report token looked up server-side instead of the whole result in the query string"""
+    import json
+    from urllib.parse import parse_qs, urlencode
+    from prediction_cache import PredictionCache
+
+    print("\n🎟️ Report tokens")
+    input_data, results, food, doctor = _sample_report()
+    query = urlencode({'data': json.dumps(input_data), 'results': json.dumps(results),
+                       'food': json.dumps(food), 'doctor': json.dumps(doctor)})
+    token = '20240101093000000000-1a2b3c'
+    entry = {'id': token, 'timestamp': '2024-01-01T09:30:00', 'input_data': input_data, 'results': results,
+             'food_recommendations': food, 'doctor_recommendations': doctor}
+    payloads = PredictionCache(max_size=1024, ttl=3600)
+    for i in range(1023):
+        payloads.put(('someone@example.com', f'{i:020d}-000000'), entry)
+    payloads.put(('patient@example.com', token), entry)
+
+    def from_query():
+        args = {name: values[0] for name, values in parse_qs(query).items()}
+        return (json.loads(args['data']), json.loads(args['results']),
+                json.loads(args['food']), json.loads(args['doctor']))
+
+    def from_token():
+        found = payloads.get(('patient@example.com', parse_qs(f'token={token}')['token'][0]))
+        return (found['input_data'], found['results'], found['food_recommendations'],
+                found['doctor_recommendations'])
+
+    ok = json.dumps(from_query(), sort_keys=True) == json.dumps(from_token(), sort_keys=True)
+    query_ms = best_time(from_query, number=200)
+    token_ms = best_time(from_token, number=200)
+    print(f"  {'✅' if ok else '❌'} same report inputs; URL {len(query)} -> {len('token=' + token)} bytes")
+    print(f"     parse query JSON {query_ms * 1000:8.2f} us   token lookup {token_ms * 1000:8.2f} us"
+          f"   ({query_ms / token_ms:.0f}x)")
+    return ok
+
+
+def _scan_due_reminders(medications, now):
+    """The old once-a-minute scan: every slot of every user checked against the clock"""
+    due = []
+    minute = now.hour * 60 + now.minute
+    for username, user_meds in medications.items():
+        for med in user_meds:
+            for slot in med['schedule']:
+                if slot.get('taken', False) or not slot.get('time'):
+                    continue
+                scheduled_hour, scheduled_minute = map(int, slot['time'].split(':'))
+                time_diff = minute - (scheduled_hour * 60 + scheduled_minute)
+                alert_count = slot.get('alert_count', 0)
+                if 0 <= time_diff <= 15 and alert_count == 0:
+                    due.append((username, med['id'], slot['slot'], 1))
+                elif time_diff >= 120 and alert_count < 2:
+                    due.append((username, med['id'], slot['slot'], 2))
+    return due
+
+
+def bench_reminders():
+    """Medication reminders: same alerts as the minute-by-minute scan over a day, then per-tick cost"""
+    import contextlib
+    import copy
+    import io
+    import random
+    from datetime import datetime, timedelta
+    from reminders import ReminderEngine
+    from storage import freeze
+
+    print("\n⏰ Medication reminders")
+    rng = random.Random(0)
+
+    def build(n_users):
+        return {f'user{u}': [{'id': f'{u}-{m}', 'tablet_name': f'Tablet {m}', 'schedule': [
+                    {'slot': slot, 'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}', 'taken': False}
+                    for slot in ('morning', 'afternoon', 'night')]} for m in range(3)]
+                for u in range(n_users)}
+
+    def engine_for(medications, sent):
+        snapshot = [freeze(medications)]
+
+        def record_alerts(alerts):
+            for username, med_id, slot_name, _, alert_count in alerts:
+                sent.append((username, med_id, slot_name, alert_count))
+                med = next(med for med in medications[username] if med['id'] == med_id)
+                next(s for s in med['schedule'] if s['slot'] == slot_name)['alert_count'] = alert_count
+            snapshot[0] = freeze(medications)
+        return ReminderEngine(lambda: snapshot[0], lambda alerts, now: [True] * len(alerts), record_alerts)
+
+    # Parity: replay a day minute by minute through both
+    reference = build(200)
+    sent = []
+    engine = engine_for(copy.deepcopy(reference), sent)
+    start = datetime(2024, 1, 1)
+    expected = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for minute in range(24 * 60):
+            now = start + timedelta(minutes=minute, seconds=5)
+            for username, med_id, slot_name, alert_count in _scan_due_reminders(reference, now):
+                expected.append((username, med_id, slot_name, alert_count))
+                med = next(med for med in reference[username] if med['id'] == med_id)
+                next(s for s in med['schedule'] if s['slot'] == slot_name)['alert_count'] = alert_count
+            engine.run_due(now)
+    ok = sorted(expected) == sorted(sent)
+
+    # Per-tick cost when nothing is due, for growing numbers of doses
+    now = start + timedelta(hours=12)
+    for n_users in (100, 1000, 5000):
+        medications = build(n_users)
+        for user_meds in medications.values():
+            for med in user_meds:
+                for slot in med['schedule']:
+                    slot['alert_count'] = 2  # already reminded: the scan still walks every dose
+        engine = engine_for(medications, [])
+        engine.run_due(now)
+        scan_ms = best_time(lambda: _scan_due_reminders(medications, now), number=5)
+        tick_ms = best_time(lambda: engine.run_due(now), number=100)
+        print(f"  {n_users * 9:>6} doses: full scan {scan_ms:8.3f} ms   heap tick {tick_ms:8.4f} ms")
+    print(f"  {'✅' if ok else '❌'} {len(sent)} alerts over a day for 1800 doses, same as the minute-by-minute scan")
+    return ok
+
+
+def bench_alert_feed():
+    """Alert streams: same alert changes as polling every client each minute, and the work each takes"""
+    import random
+    from datetime import datetime, timedelta
+    from reminders import AlertFeed, medication_alerts
+    from storage import freeze
+
+    print("\n🔔 Medication alert streams")
+    rng = random.Random(1)
+    n_users = 200
+    medications = {f'user{u}': [{'id': f'{u}-{m}', 'tablet_name': f'Tablet {m}', 'schedule': [
+                       {'slot': slot, 'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}', 'taken': False}
+                       for slot in ('morning', 'afternoon', 'night')]} for m in range(3)]
+                   for u in range(n_users)}
+    snapshot = [freeze(medications)]
+    start = datetime(2024, 1, 1)
+
+    def signature(alerts):
+        return [(a['medication'], a['slot'], a['scheduled_time'], a['severity']) for a in alerts]
+
+    feed = AlertFeed(lambda: snapshot[0], max_subscribers=n_users + 1)
+    subscriptions = {username: feed.subscribe(username, now=start) for username in medications}
+    never_read = feed.subscribe('user0', now=start)
+    polled = {username: signature(medication_alerts(medications[username], start)) for username in medications}
+    pushed = {username: signature(subscription.get(0)) for username, subscription in subscriptions.items()}
+    poll_changes, push_changes = [], []
+    poll_s = feed_s = 0.0
+    for minute in range(1, 24 * 60 + 1):  # through the next midnight, when the alerts clear
+        now = start + timedelta(minutes=minute)
+        if minute == 12 * 60:  # some doses are taken along the way
+            for user_meds in medications.values():
+                user_meds[0]['schedule'][0]['taken'] = True
+            snapshot[0] = freeze(medications)
+        started = time.perf_counter()
+        for username, user_meds in medications.items():
+            alerts = signature(medication_alerts(user_meds, now))
+            if alerts != polled[username]:
+                polled[username] = alerts
+                poll_changes.append((minute, username, alerts))
+        poll_s += time.perf_counter() - started
+        started = time.perf_counter()
+        feed.run_due(now)
+        feed_s += time.perf_counter() - started
+        for username, subscription in subscriptions.items():
+            alerts = subscription.get(0)
+            if alerts is not None:
+                push_changes.append((minute, username, signature(alerts)))
+    ok = poll_changes == push_changes and len(poll_changes) > 0
+    ok &= signature(never_read.get(0)) == polled['user0']  # one pending list, the newest, after a day of changes
+    polls_per_day = n_users * 24 * 60 * 12  # the pages polled every 5 seconds
+    print(f"  {'✅' if ok else '❌'} {n_users} users over a day: {len(push_changes)} pushes, "
+          f"same changes as polling every minute")
+    print(f"     polling every 5 s: {polls_per_day} requests, ~{poll_s * 12 * 1000:8.1f} ms of alert computation"
+          f"   feed: {len(push_changes)} events, {feed_s * 1000:8.1f} ms")
+    return ok
+
+
+def bench_email_templates():
+    """Reminder emails: per-send format + MIMEMultipart vs. compiled templates, single and batched"""
+    import email
+    from email import policy
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email_templates import DIGEST, DIGEST_ITEM, LAYOUT, MEDICATION_REMINDER, mime_message
+
+    print("\n✉️  Email templates")
+    rows = [{'user_name': f'Patient {i}', 'medication_name': f'Tablet {i % 7}', 'slot_label': 'Morning',
+             'current_time': '09:05 AM'} for i in range(1000)]
+
+    def per_send(fields):
+        # What every send used to do: fill the body, wrap it in the layout, build and flatten the MIME tree
+        body = MEDICATION_REMINDER.body.format(**fields)
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = MEDICATION_REMINDER.subject
+        msg['From'] = 'reminders@localhost'
+        msg['To'] = 'patient@localhost'
+        msg.attach(MIMEText(body, 'plain'))
+        msg.attach(MIMEText(LAYOUT.format(body=body), 'html'))
+        return msg.as_string()
+
+    def compiled(fields):
+        return mime_message('reminders@localhost', 'patient@localhost', *MEDICATION_REMINDER.render(**fields))
+
+    ok = True
+    for fields in rows[:20]:
+        expected = email.message_from_string(per_send(fields), policy=policy.default)
+        actual = email.message_from_string(compiled(fields), policy=policy.default)
+        ok &= expected['Subject'] == actual['Subject'] and \
+            [part.get_content() for part in expected.iter_parts()] == [part.get_content() for part in actual.iter_parts()]
+    ok &= MEDICATION_REMINDER.render_batch(rows) == [MEDICATION_REMINDER.render(**fields) for fields in rows]
+
+    format_ms = best_time(lambda: [MEDICATION_REMINDER.body.format(**fields) for fields in rows])
+    render_ms = best_time(lambda: [MEDICATION_REMINDER.render_body(fields) for fields in rows])
+    per_send_ms = best_time(lambda: [per_send(fields) for fields in rows])
+    compiled_ms = best_time(lambda: [compiled(fields) for fields in rows])
+    batch_ms = best_time(lambda: [mime_message('reminders@localhost', 'patient@localhost', *message)
+                                  for message in MEDICATION_REMINDER.render_batch(rows)])
+    print(f"  {'✅' if ok else '❌'} 1000 reminders, same decoded subject and parts")
+    print(f"     body only:     str.format {format_ms:8.3f} ms   compiled {render_ms:8.3f} ms")
+    print(f"     full message:  per send   {per_send_ms:8.3f} ms   compiled {compiled_ms:8.3f} ms   batch {batch_ms:8.3f} ms"
+          f"   ({per_send_ms / batch_ms:.1f}x)")
+
+    # Busy morning: every patient has three doses due in the same pass
+    morning = [[dict(fields, medication_name=f'Tablet {m}') for m in range(3)] for fields in rows]
+
+    def individual():
+        return [mime_message('reminders@localhost', 'patient@localhost', *message)
+                for message in MEDICATION_REMINDER.render_batch([fields for doses in morning for fields in doses])]
+
+    def digest():
+        return [mime_message('reminders@localhost', 'patient@localhost', *DIGEST.render(
+                    user_name=doses[0]['user_name'], count=len(doses), current_time=doses[0]['current_time'],
+                    items=''.join(DIGEST_ITEM.render_body(fields) for fields in doses)))
+                for doses in morning]
+
+    individual_messages, digest_messages = individual(), digest()
+    individual_ms, digest_ms = best_time(individual), best_time(digest)
+    print(f"     busy morning:  individual {len(individual_messages)} emails, {individual_ms:8.3f} ms, "
+          f"{sum(map(len, individual_messages)) / 1e6:.1f} MB   "
+          f"digest {len(digest_messages)} emails, {digest_ms:8.3f} ms, {sum(map(len, digest_messages)) / 1e6:.1f} MB")
+    return ok
+
+
+def _smtp_stand_in():
+    """
+    Local SMTP server for exercising the outbox: accepts everything except
+    recipients starting with 'bounce' (550) and, once each, 'later' (451)
+    """
+    import socketserver
+    import threading
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            server = self.server
+            with server.lock:
+                server.connections += 1
+            self.wfile.write(b'220 localhost SMTP stand-in\r\n')
+            recipients = []
+            for line in self.rfile:
+                command = line.decode().strip()
+                verb = command[:4].upper()
+                reply = '250 OK'  # EHLO, HELO, RSET, NOOP
+                if verb == 'MAIL':
+                    recipients = []
+                elif verb == 'RCPT':
+                    address = command.split(':', 1)[1].strip('<> ')
+                    with server.lock:
+                        if address.startswith('bounce'):
+                            reply = '550 No such user'
+                        elif address.startswith('later') and address not in server.deferred:
+                            server.deferred.add(address)
+                            reply = '451 Try again later'
+                        else:
+                            recipients.append(address)
+                elif verb == 'DATA':
+                    self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                    while self.rfile.readline() not in (b'.\r\n', b''):
+                        pass
+                    with server.lock:
+                        server.delivered.extend(recipients)
+                elif verb == 'QUIT':
+                    self.wfile.write(b'221 Bye\r\n')
+                    return
+                self.wfile.write(reply.encode() + b'\r\n')
+
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections, server.delivered, server.deferred = 0, [], set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_outbox():
+    """Email outbox against a local SMTP server: enqueue latency, pooled delivery, retries and dead letters"""
+    import contextlib
+    import io
+    import smtplib
+    import statistics
+    import tempfile
+    from email_templates import mime_message
+    from outbox import Outbox
+
+    print("\n📮 Email outbox")
+    server = _smtp_stand_in()
+    config = {'sender': 'bench@localhost', 'password': '', 'smtp_server': '127.0.0.1',
+              'smtp_port': server.server_address[1], 'starttls': False}
+    html = '<p>' + 'Reminder ' * 200 + '</p>'
+    n_messages = 500
+
+    def wait_until_sent(box, timeout=30):
+        deadline = time.time() + timeout
+        while box.stats()['pending'] and time.time() < deadline:
+            time.sleep(0.01)
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        box = Outbox(os.path.join(tmp, 'outbox.db'), config, workers=2, backoff_seconds=0.05, poll_seconds=0.05)
+        latencies = []
+        for i in range(n_messages):
+            start = time.perf_counter()
+            box.enqueue(f'user{i}@localhost', 'Reminder', 'Reminder', html)
+            latencies.append((time.perf_counter() - start) * 1e6)
+        start = time.perf_counter()
+        box.start()
+        wait_until_sent(box)
+        pooled_ms = (time.perf_counter() - start) * 1000
+        pooled_connections = server.connections
+        delivered = len(server.delivered) == n_messages
+
+        # One connection per message, as send_email used to do (without its TLS handshake and login)
+        start = time.perf_counter()
+        for i in range(n_messages):
+            with smtplib.SMTP(*server.server_address, timeout=10) as smtp:
+                smtp.sendmail('bench@localhost', [f'user{i}@localhost'],
+                              mime_message('bench@localhost', f'user{i}@localhost', 'Reminder', 'Reminder', html))
+        direct_ms = (time.perf_counter() - start) * 1000
+
+        # A temporary failure is retried, a permanent one is dead-lettered
+        box.enqueue('later@localhost', 'Reminder', 'Reminder', html)
+        box.enqueue('bounce@localhost', 'Reminder', 'Reminder', html)
+        wait_until_sent(box)
+        dead = box.dead_letters()
+        stats = box.stats()
+        box.stop()
+    ok = (delivered and 'later@localhost' in server.delivered and stats['retried'] == 1
+          and [letter['recipient'] for letter in dead] == ['bounce@localhost'])
+    print(f"  enqueue: median {statistics.median(latencies):6.1f} us   p99 {sorted(latencies)[int(n_messages * 0.99)]:6.1f} us")
+    print(f"  {n_messages} messages: outbox {pooled_ms:8.1f} ms over {pooled_connections} connection(s)"
+          f"   connection per message {direct_ms:8.1f} ms")
+    print(f"  {'✅' if ok else '❌'} all delivered, 451 retried once, 550 dead-lettered: {dead[0]['last_error'] if dead else None}")
+    server.shutdown()
+    return ok
+
+
+def _scheduler_worker(db_path, lease_path, log_path):
+    """
+    One process of bench_scheduler_lease: the app's lease and reminder wiring,
+    with a sender that logs each reminder instead of emailing it
+    """
+    import signal
+    import threading
+    from leader import LeaderLease
+    from reminders import ReminderEngine
+    from storage import SQLiteStorage
+
+    storage = SQLiteStorage(db_path)
+
+    def send_alerts(alerts, now):
+        if not lease.held():
+            return [False] * len(alerts)
+        with open(log_path, 'a') as log:
+            log.write(''.join(f"{os.getpid()} {username} {med['id']} {slot['slot']} {stage}\n"
+                              for username, med, slot, stage in alerts))
+        return [True] * len(alerts)
+
+    def record_alerts(alerts):
+        with storage.transaction('medications') as medications:
+            for username, med_id, slot_name, sent_at, alert_count in alerts:
+                med = next(med for med in medications[username] if med['id'] == med_id)
+                slot = next(slot for slot in med['schedule'] if slot['slot'] == slot_name)
+                slot['last_alert_sent'], slot['alert_count'] = sent_at, alert_count
+
+    engine = ReminderEngine(storage.read_medications, send_alerts, record_alerts, sync_seconds=0.1)
+    lease = LeaderLease(lease_path, 'scheduler', engine.start, engine.stop, lease_seconds=1, heartbeat_seconds=0.2)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    lease.start()
+    stopped.wait()
+    lease.stop()
+
+
+def bench_scheduler_lease():
+    """Scheduler lease: several worker processes, each reminder sent exactly once, including across a takeover"""
+    import signal
+    import subprocess
+    import tempfile
+    from datetime import datetime
+    from storage import SQLiteStorage
+
+    print("\n👑 Scheduler lease")
+    n_workers, n_users = 4, 5
+
+    def add_doses(storage, round_name):
+        slot_time = datetime.now().strftime('%H:%M')  # due now
+        with storage.transaction('medications') as medications:
+            for u in range(n_users):
+                medications.setdefault(f'user{u}', []).extend(
+                    {'id': f'{round_name}-{u}-{m}', 'tablet_name': f'Tablet {m}',
+                     'schedule': [{'slot': 'morning', 'time': slot_time, 'taken': False}]} for m in range(3))
+        return n_users * 3
+
+    def read_log(log_path, expected, timeout=15):
+        deadline = time.monotonic() + timeout
+        while True:
+            lines = open(log_path).read().splitlines() if os.path.exists(log_path) else []
+            if len(lines) >= expected or time.monotonic() > deadline:
+                return [line.split() for line in lines]
+            time.sleep(0.05)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path, lease_path, log_path = (os.path.join(tmp, name) for name in ('app.db', 'lease.db', 'sent.log'))
+        storage = SQLiteStorage(db_path)
+        expected = add_doses(storage, 'first')
+        code = f"import benchmarks; benchmarks._scheduler_worker({db_path!r}, {lease_path!r}, {log_path!r})"
+        workers = [subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    stdout=subprocess.DEVNULL) for _ in range(n_workers)]
+        try:
+            sent = read_log(log_path, expected)
+            time.sleep(1.5)  # room for any duplicate to show up
+
+            # Kill the leader outright: another worker must take over and send the next round
+            leader = int(sent[0][0])
+            next(worker for worker in workers if worker.pid == leader).send_signal(signal.SIGKILL)
+            killed_at = time.monotonic()
+            expected += add_doses(storage, 'second')
+            sent = read_log(log_path, expected)
+            takeover_s = time.monotonic() - killed_at
+            time.sleep(1.5)
+            sent = read_log(log_path, expected, timeout=0)
+        finally:
+            for worker in workers:
+                if worker.poll() is None:
+                    worker.send_signal(signal.SIGTERM)
+            for worker in workers:
+                worker.wait(timeout=10)
+
+    doses = [tuple(line[1:]) for line in sent]
+    senders = {round_name: {line[0] for line in sent if line[2].startswith(round_name)}
+               for round_name in ('first', 'second')}
+    ok = (len(doses) == expected and len(set(doses)) == expected
+          and senders['first'] == {str(leader)} and len(senders['second']) == 1
+          and senders['second'] != senders['first'])
+    print(f"  {'✅' if ok else '❌'} {n_workers} workers: {len(doses)} reminders sent for {expected} doses "
+          f"({len(doses) - len(set(doses))} duplicates), each round by one process")
+    print(f"     leader killed: next round sent by another worker {takeover_s:.1f} s later (lease 1 s)")
+    return ok
+
+BENCHMARKS = {
+    'features': bench_features,
+    'tree_ensemble': bench_tree_ensemble,
+    'fused_ensemble': bench_fused_ensemble,
+    'storage_append': bench_storage_append,
+    'storage_read': bench_storage_read,
+    'history': bench_history,
+    'admin_stats': bench_admin_stats,
+    'prediction_cache': bench_prediction_cache,
+    'predict_parity': bench_predict_parity,
+    'recommendation_dedupe': bench_recommendation_dedupe,
+    'recommendations': bench_recommendations,
+    'sanitizer': bench_sanitizer,
+    'report_cache': bench_report_cache,
+    'report_jobs': bench_report_jobs,
+    'report_export': bench_report_export,
+    'report_tokens': bench_report_tokens,
+    'reminders': bench_reminders,
+    'alert_feed': bench_alert_feed,
+    'email_templates': bench_email_templates,
+    'outbox': bench_outbox,
+    'scheduler_lease': bench_scheduler_lease,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmark(s): {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+
+    results = [BENCHMARKS[name]() for name in names]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,193 @@
+"""
+Email templates, compiled once at import
+Each template's body is split into literal chunks and field names up front, so
+rendering a message is a list fill and one join; the shared layout wraps it by
+concatenation, and the MIME message is assembled from a fixed skeleton instead
+of building and flattening a MIMEMultipart per send.
+"""
+
+import base64
+import secrets
+import string
+from email.header import Header
+from functools import lru_cache
+
+LAYOUT = """
+        <html>
+            <body style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px;">
+                <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                    <h2 style="color: #0EA5E9; border-bottom: 2px solid #0EA5E9; padding-bottom: 10px;">
+                        🏥 Stroke Risk Prediction System
+                    </h2>
+                    {body}
+                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #eee;">
+                    <p style="color: #666; font-size: 12px; text-align: center;">
+                        This is an automated notification from the Stroke Risk Prediction System.
+                    </p>
+                </div>
+            </body>
+        </html>
+        """
+
+_LAYOUT_BEFORE, _LAYOUT_AFTER = LAYOUT.split('{body}')
+
+
+class EmailTemplate:
+    """
+    A subject plus an HTML body with {field} placeholders (str.format syntax,
+    without format specs).  The plain-text part is the filled body, as the
+    app has always sent it, and the HTML part is the body inside LAYOUT.
+    """
+
+    def __init__(self, subject, body):
+        self.subject = subject
+        self.body = body
+        self._parts = []   # literal, placeholder, literal, ..., literal
+        self.fields = []
+        for literal, field, spec, conversion in string.Formatter().parse(body):
+            if len(self._parts) % 2 == 1:
+                self._parts[-1] += literal  # text split around an escaped {{ or }}
+            else:
+                self._parts.append(literal)
+            if field is not None:
+                if spec or conversion or not field.isidentifier():
+                    raise ValueError(f"Unsupported placeholder {{{field}}} in email template")
+                self._parts.append(None)
+                self.fields.append(field)
+        if len(self._parts) % 2 == 0:
+            self._parts.append('')  # the body ends with a placeholder
+
+    def render_body(self, fields):
+        parts = self._parts.copy()
+        parts[1::2] = [str(fields[name]) for name in self.fields]
+        return ''.join(parts)
+
+    def render(self, **fields):
+        """(subject, text_body, html_body) of one message"""
+        body = self.render_body(fields)
+        return self.subject, body, _LAYOUT_BEFORE + body + _LAYOUT_AFTER
+
+    def render_batch(self, rows):
+        """render() for many recipients at once: a list of field dicts in, a list of messages out"""
+        subject, parts, names = self.subject, self._parts, self.fields
+        before, after = _LAYOUT_BEFORE, _LAYOUT_AFTER
+        messages = []
+        for fields in rows:
+            filled = parts.copy()
+            filled[1::2] = [str(fields[name]) for name in names]
+            body = ''.join(filled)
+            messages.append((subject, body, before + body + after))
+        return messages
+
+
+LOGIN_ALERT = EmailTemplate("🔐 Login Alert - Stroke Risk Prediction System", """
+    <p style="font-size: 16px;">Hello <strong>{user_name}</strong>,</p>
+    <p>We detected a login to your account on the <strong>Stroke Risk Prediction System</strong>.</p>
+    <div style="background-color: #f0f9ff; padding: 15px; border-left: 4px solid #0EA5E9; margin: 20px 0;">
+        <p style="margin: 5px 0;"><strong>Login Time:</strong> {login_time}</p>
+        <p style="margin: 5px 0;"><strong>Account:</strong> {user_email}</p>
+    </div>
+    <p>If this wasn't you, please secure your account immediately.</p>
+    <p style="margin-top: 20px;">Stay healthy! 💙</p>
+    """)
+
+MEDICATION_REMINDER = EmailTemplate("💊 Medication Reminder - Take Your Medicine!", """
+    <p style="font-size: 16px;">Hello <strong>{user_name}</strong>,</p>
+    <div style="background-color: #fef3c7; padding: 20px; border-left: 4px solid #f59e0b; margin: 20px 0; border-radius: 5px;">
+        <h3 style="color: #f59e0b; margin-top: 0;">⏰ Medication Alert</h3>
+        <p style="font-size: 18px; margin: 10px 0;">
+            <strong>Medication:</strong> {medication_name}
+        </p>
+        <p style="font-size: 16px; margin: 10px 0;">
+            <strong>Scheduled Time:</strong> {slot_label}
+        </p>
+        <p style="font-size: 16px; margin: 10px 0;">
+            <strong>Current Time:</strong> {current_time}
+        </p>
+    </div>
+    <p style="font-size: 16px;">⚠️ You haven't marked this medication as taken yet.</p>
+    <p style="font-size: 14px; color: #666;">Please take your medication as prescribed and mark it as completed in the system.</p>
+    <p style="margin-top: 20px;">Your health is important! 💙</p>
+    """)
+
+OVERDUE_REMINDER = EmailTemplate("⚠️ URGENT: Medication 2+ Hours Overdue!", """
+        <p style="font-size: 16px;">Hello <strong>{user_name}</strong>,</p>
+        <div style="background-color: #fee2e2; padding: 20px; border-left: 4px solid #ef4444; margin: 20px 0; border-radius: 5px;">
+            <h3 style="color: #dc2626; margin-top: 0;">🚨 URGENT MEDICATION ALERT</h3>
+            <p style="font-size: 18px; margin: 10px 0;">
+                <strong>Medication:</strong> {medication_name}
+            </p>
+            <p style="font-size: 16px; margin: 10px 0;">
+                <strong>Scheduled Time:</strong> {slot_time} ({slot_label})
+            </p>
+            <p style="font-size: 16px; margin: 10px 0;">
+                <strong>Time Overdue:</strong> {overdue_hours} hours {overdue_minutes} minutes
+            </p>
+        </div>
+        <p style="font-size: 16px; color: #dc2626; font-weight: bold;">⚠️ This medication is MORE THAN 2 HOURS OVERDUE!</p>
+        <p style="font-size: 14px; color: #666;">Please take your medication immediately and consult your doctor if you have concerns.</p>
+        <p style="margin-top: 20px;">Your health is critical! 🏥</p>
+        """)
+
+
+# Digest: every reminder a user has due in one pass, in one email
+# (the overdue subject is used when any of the doses is 2+ hours late)
+_DIGEST_BODY = """
+    <p style="font-size: 16px;">Hello <strong>{user_name}</strong>,</p>
+    <p style="font-size: 16px;">You have <strong>{count}</strong> medication doses that you haven't marked as taken yet.</p>
+    <p style="font-size: 14px; color: #666;"><strong>Current Time:</strong> {current_time}</p>
+    {items}
+    <p style="font-size: 14px; color: #666;">Please take your medication as prescribed and mark it as completed in the system.</p>
+    <p style="margin-top: 20px;">Your health is important! 💙</p>
+    """
+DIGEST = EmailTemplate("💊 Medication Reminder - Take Your Medicines!", _DIGEST_BODY)
+OVERDUE_DIGEST = EmailTemplate("⚠️ URGENT: Medications Overdue!", _DIGEST_BODY)
+
+DIGEST_ITEM = EmailTemplate(None, """
+    <div style="background-color: #fef3c7; padding: 15px 20px; border-left: 4px solid #f59e0b; margin: 15px 0; border-radius: 5px;">
+        <p style="font-size: 18px; margin: 5px 0;">⏰ <strong>{medication_name}</strong></p>
+        <p style="font-size: 16px; margin: 5px 0;"><strong>Scheduled Time:</strong> {slot_label}</p>
+    </div>""")
+
+OVERDUE_DIGEST_ITEM = EmailTemplate(None, """
+    <div style="background-color: #fee2e2; padding: 15px 20px; border-left: 4px solid #ef4444; margin: 15px 0; border-radius: 5px;">
+        <p style="font-size: 18px; margin: 5px 0;">🚨 <strong>{medication_name}</strong> - MORE THAN 2 HOURS OVERDUE</p>
+        <p style="font-size: 16px; margin: 5px 0;"><strong>Scheduled Time:</strong> {slot_time} ({slot_label})</p>
+        <p style="font-size: 16px; margin: 5px 0;"><strong>Time Overdue:</strong> {overdue_hours} hours {overdue_minutes} minutes</p>
+    </div>""")
+
+
+def wrap_in_layout(body):
+    """HTML part for a free-form body (send_email callers with their own markup)"""
+    return _LAYOUT_BEFORE + body + _LAYOUT_AFTER
+
+
+@lru_cache(maxsize=256)
+def _encode_header(value):
+    """RFC 2047 form of a header value (subjects come from a small fixed set)"""
+    return value if value.isascii() else Header(value, 'utf-8').encode()
+
+
+def _encode_part(content, subtype):
+    return ('Content-Type: text/%s; charset="utf-8"\n'
+            'MIME-Version: 1.0\n'
+            'Content-Transfer-Encoding: base64\n\n' % subtype
+            + base64.encodebytes(content.encode('utf-8')).decode('ascii'))
+
+
+def mime_message(sender, recipient, subject, text_body, html_body):
+    """
+    multipart/alternative message (plain text + HTML) as a string for
+    smtplib's sendmail, equivalent to a flattened MIMEMultipart
+    """
+    boundary = '===============' + secrets.token_hex(8) + '=='
+    return (f'Content-Type: multipart/alternative; boundary="{boundary}"\n'
+            'MIME-Version: 1.0\n'
+            f'Subject: {_encode_header(subject)}\n'
+            f'From: {sender}\n'
+            f'To: {recipient}\n\n'
+            f'--{boundary}\n'
+            f'{_encode_part(text_body, "plain")}\n'
+            f'--{boundary}\n'
+            f'{_encode_part(html_body, "html")}\n'
+            f'--{boundary}--\n')
@@ -0,0 +1,139 @@
+"""
+Feature engineering for the stroke risk models
+Shared by the Flask backend and the training notebook so both build identical features
+"""
+
+from itertools import repeat
+
+import numpy as np
+
+# Column order used at training time (matches feature_info.pkl)
+FEATURE_NAMES = [
+    'gender', 'age', 'hypertension', 'heart_disease', 'ever_married', 'work_type',
+    'residence_type', 'avg_glucose_level', 'bmi', 'smoking_status', 'bmi_missing',
+    'age_glucose_interaction', 'age_bmi_interaction', 'glucose_bmi_interaction',
+    'age_group', 'bmi_category', 'glucose_category', 'risk_score'
+]
+
+# Categorical encodings (alphabetical, same as LabelEncoder at training time)
+CATEGORICAL_MAPPINGS = {
+    'gender': {'Female': 0, 'Male': 1, 'Other': 2},
+    'ever_married': {'No': 0, 'Yes': 1},
+    'work_type': {'Govt_job': 0, 'Never_worked': 1, 'Private': 2, 'Self-employed': 3, 'children': 4},
+    'residence_type': {'Rural': 0, 'Urban': 1},
+    'smoking_status': {'Unknown': 0, 'formerly smoked': 1, 'never smoked': 2, 'smokes': 3}
+}
+
+# Code used when a categorical value is not recognised
+CATEGORICAL_DEFAULTS = {
+    'gender': 0,
+    'ever_married': 0,
+    'work_type': 2,        # Private
+    'residence_type': 1,   # Urban
+    'smoking_status': 0    # Unknown
+}
+
+NUMERIC_FIELDS = ['age', 'avg_glucose_level', 'bmi']
+FLAG_FIELDS = ['hypertension', 'heart_disease']
+
+# Raw fields a patient record must provide
+INPUT_FIELDS = ['age', 'gender', 'hypertension', 'heart_disease', 'ever_married',
+                'work_type', 'residence_type', 'avg_glucose_level', 'bmi', 'smoking_status']
+
+# Bin edges for the engineered categories, right-closed like the training
+# notebook's pd.cut bins (a value on an edge falls in the lower category)
+AGE_BINS = np.array([18, 35, 50, 65])        # <=18, <=35, <=50, <=65, older
+BMI_BINS = np.array([18.5, 25, 30])          # underweight, normal, overweight, obese
+GLUCOSE_BINS = np.array([100, 126, 200])     # normal, elevated, diabetic, severe
+
+
+def _as_list(values):
+    """Plain list view of a column (iterating numpy/pandas objects element-wise is slow)"""
+    return values.tolist() if hasattr(values, 'tolist') else values
+
+
+def _as_float_array(values, cast=float):
+    """Convert a column to float64, parsing element-wise only when needed"""
+    if hasattr(values, 'dtype') and values.dtype.kind in 'biuf':
+        return np.asarray(values, dtype=np.float64)
+    return np.fromiter(map(cast, _as_list(values)), dtype=np.float64, count=len(values))
+
+
+def encode_categorical(field, values):
+    """Encode a categorical column using CATEGORICAL_MAPPINGS (already-encoded ints pass through)"""
+    if hasattr(values, 'dtype') and values.dtype.kind in 'biuf':
+        return np.asarray(values, dtype=np.float64)
+    mapping = CATEGORICAL_MAPPINGS[field]
+    default = CATEGORICAL_DEFAULTS[field]
+    if hasattr(values, 'map'):
+        # pandas Series (training data): use its hashed lookup
+        return values.map(mapping).fillna(default).to_numpy(dtype=np.float64)
+    n_rows = len(values)
+    return np.fromiter(map(mapping.get, _as_list(values), repeat(default, n_rows)), dtype=np.float64, count=n_rows)
+
+
+def columns_from_records(records):
+    """Turn a list of patient dicts (e.g. request JSON) into raw feature columns"""
+    return {field: [r[field] for r in records] for field in INPUT_FIELDS}
+
+
+def build_features(columns, feature_names=FEATURE_NAMES, out=None):
+    """
+    Build the model feature matrix from raw columns.
+
+    `columns` maps raw field names to equal-length array-likes: a dict from
+    columns_from_records() or a cleaned pandas DataFrame.  Categorical columns
+    may be strings or pre-encoded integers; 'bmi_missing' is optional.
+    The result is written column-wise into `out` (or a new float64 array) in
+    the order given by `feature_names`.
+    """
+    if sorted(feature_names) != sorted(FEATURE_NAMES):
+        raise ValueError(f"feature_names must be a permutation of {FEATURE_NAMES}")
+
+    age = _as_float_array(columns['age'])
+    avg_glucose_level = _as_float_array(columns['avg_glucose_level'])
+    bmi = _as_float_array(columns['bmi'])
+    hypertension = _as_float_array(columns['hypertension'], cast=int)
+    heart_disease = _as_float_array(columns['heart_disease'], cast=int)
+    n_rows = len(age)
+
+    if out is None:
+        out = np.empty((n_rows, len(feature_names)), dtype=np.float64)
+    elif out.shape != (n_rows, len(feature_names)):
+        raise ValueError(f"Output buffer has shape {out.shape}, expected {(n_rows, len(feature_names))}")
+
+    # Views into the output buffer, one per feature column
+    col = {name: out[:, i] for i, name in enumerate(feature_names)}
+
+    col['gender'][:] = encode_categorical('gender', columns['gender'])
+    col['ever_married'][:] = encode_categorical('ever_married', columns['ever_married'])
+    col['work_type'][:] = encode_categorical('work_type', columns['work_type'])
+    col['residence_type'][:] = encode_categorical('residence_type', columns['residence_type'])
+    col['smoking_status'][:] = encode_categorical('smoking_status', columns['smoking_status'])
+    col['age'][:] = age
+    col['hypertension'][:] = hypertension
+    col['heart_disease'][:] = heart_disease
+    col['avg_glucose_level'][:] = avg_glucose_level
+    col['bmi'][:] = bmi
+    col['bmi_missing'][:] = _as_float_array(columns['bmi_missing']) if 'bmi_missing' in columns else 0
+
+    # Interaction terms
+    np.multiply(age, avg_glucose_level, out=col['age_glucose_interaction'])
+    np.multiply(age, bmi, out=col['age_bmi_interaction'])
+    np.multiply(avg_glucose_level, bmi, out=col['glucose_bmi_interaction'])
+
+    # Binned categories
+    col['age_group'][:] = np.digitize(age, AGE_BINS, right=True)
+    col['bmi_category'][:] = np.digitize(bmi, BMI_BINS, right=True)
+    col['glucose_category'][:] = np.digitize(avg_glucose_level, GLUCOSE_BINS, right=True)
+
+    # Risk score, as the saved models were trained on it: smoking is left
+    # out (it reaches the models through the smoking_status column)
+    risk_score = col['risk_score']
+    np.greater(age, 50, out=risk_score)
+    risk_score += hypertension
+    risk_score += heart_disease
+    risk_score += avg_glucose_level > 126
+    risk_score += bmi > 30
+
+    return out
@@ -0,0 +1,146 @@
+"""
+Leader election for background jobs
+Every process that may run the scheduled work (web workers, or a standalone
+run_scheduler.py) competes for a named lease row in a small SQLite database.
+The holder renews it with a heartbeat; if it stops renewing (crashed, killed
+or hung), another process takes the lease over once it expires.  Only the
+holder runs the medication reminder engine and the periodic jobs, so each
+reminder goes out once however many workers serve the app.
+"""
+
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,   -- wall-clock time; anyone may take the lease after it
+    acquired_at REAL NOT NULL
+);
+"""
+
+
+class LeaderLease:
+    """
+    A lease on `name`, renewed every heartbeat_seconds and valid for
+    lease_seconds after each renewal.
+
+    `on_acquired()` is called (from the heartbeat thread) when this process
+    becomes the leader and `on_lost()` when it stops being one: the lease
+    could not be renewed before it ran out, or stop() was called.  held()
+    is the check to make right before doing leader-only work: it goes false
+    as soon as the lease may have passed to another process, measured from
+    before the last renewal was written.
+    """
+
+    def __init__(self, db_path, name, on_acquired, on_lost, lease_seconds=30, heartbeat_seconds=10):
+        if heartbeat_seconds * 2 > lease_seconds:
+            raise ValueError("The lease must outlast at least two heartbeats")
+        self.db_path = db_path
+        self.name = name
+        self.on_acquired = on_acquired
+        self.on_lost = on_lost
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.is_leader = False
+        self._valid_until = 0.0   # time.monotonic() deadline of the lease we hold
+        self._lock = threading.Lock()
+        self._conn = None
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """One autocommit connection, used under self._lock (heartbeat thread and stop())"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        return self._conn
+
+    def held(self):
+        return time.monotonic() < self._valid_until
+
+    def _renew(self):
+        """Take or extend the lease if it is ours or has expired; True if we hold it now"""
+        started = time.monotonic()
+        now = time.time()
+        with self._lock:
+            renewed = self._connection().execute(
+                "INSERT INTO leases (name, owner, expires_at, acquired_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at, "
+                "  acquired_at = CASE WHEN leases.owner = excluded.owner THEN leases.acquired_at ELSE excluded.acquired_at END "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (self.name, self.owner, now + self.lease_seconds, now, now)).rowcount > 0
+        if renewed:
+            self._valid_until = started + self.lease_seconds
+        return renewed
+
+    def _release(self):
+        with self._lock:
+            self._connection().execute('DELETE FROM leases WHERE name = ? AND owner = ?', (self.name, self.owner))
+        self._valid_until = 0.0
+
+    def _become(self, leader):
+        self.is_leader = leader
+        if leader:
+            print(f"👑 [{self.name}] This process ({self.owner}) is now the leader")
+            self.on_acquired()
+        else:
+            print(f"⚠️ [{self.name}] This process ({self.owner}) is no longer the leader")
+            self.on_lost()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                renewed = self._renew()
+            except sqlite3.Error as e:
+                print(f"❌ [{self.name}] Could not renew the lease: {e}")
+                renewed = False
+            try:
+                if renewed and not self.is_leader:
+                    self._become(True)
+                elif not renewed and self.is_leader and not self.held():
+                    self._become(False)
+            except Exception as e:
+                print(f"❌ [{self.name}] Leadership change failed: {e}")
+                traceback.print_exc()
+            self._wakeup.wait(self.heartbeat_seconds)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f'lease-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop competing; a leader hands over at once by deleting its lease"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.heartbeat_seconds + 5)
+        if self.is_leader:
+            self._valid_until = 0.0
+            self._become(False)
+        try:
+            self._release()
+        except sqlite3.Error as e:
+            print(f"❌ [{self.name}] Could not release the lease: {e}")
+
+    def status(self):
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT owner, expires_at, acquired_at FROM leases WHERE name = ?', (self.name,)).fetchone()
+        leader, expires_at, acquired_at = row or (None, None, None)
+        return {'owner': self.owner, 'is_leader': self.is_leader and self.held(), 'leader': leader,
+                'lease_expires_at': expires_at, 'leader_since': acquired_at}
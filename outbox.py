@@ -0,0 +1,295 @@
+"""
+Persistent email outbox
+send_email() only queues a message (one SQLite INSERT); a few worker threads
+send the queue in the background, each over one authenticated SMTP connection
+that is kept open for many messages.  Temporary failures are retried with
+exponential backoff; permanent ones (5xx replies, or too many attempts) are
+kept as dead letters for an admin to inspect or requeue.
+The queue is shared by every worker process: a message is claimed with a
+lease, so a process that dies mid-send leaves it to be picked up again.
+"""
+
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+import traceback
+
+from email_templates import mime_message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    text_body TEXT NOT NULL,
+    html_body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, sending (claimed) or dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,              -- when pending: earliest send; when sending: lease expiry
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt);
+"""
+
+# A claimed message goes back to the queue if it isn't sent or failed within this long
+LEASE_SECONDS = 120
+
+
+def is_permanent(error):
+    """True for SMTP failures that retrying can't fix (5xx replies other than a login failure)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False  # a configuration problem, not the message's
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def _keeps_connection(error):
+    """The server answered (the session is still usable) rather than the connection failing"""
+    return isinstance(error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused))
+
+
+class Outbox:
+    """
+    SQLite-backed email queue with a pool of sending threads.
+
+    `config` is the app's EMAIL_CONFIG: sender, password, smtp_server,
+    smtp_port and starttls.  Messages are deleted once sent.
+    """
+
+    def __init__(self, db_path, config, workers=2, batch_size=20, max_attempts=8,
+                 backoff_seconds=30, max_backoff_seconds=3600, poll_seconds=5,
+                 idle_seconds=60, max_per_connection=100):
+        self.db_path = db_path
+        self.config = config
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds          # picks up mail queued by other processes and retries
+        self.idle_seconds = idle_seconds          # an unused connection is closed after this long
+        self.max_per_connection = max_per_connection
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._pending = 0                         # messages queued by this process not yet claimed
+        self._stopped = False
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self._stats = {'queued': 0, 'sent': 0, 'retried': 0, 'dead': 0, 'connections': 0}
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """One connection per thread, in autocommit mode (each statement is its own transaction)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # no fsync per queued message
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def enqueue(self, recipient, subject, text_body, html_body):
+        """Queue one message and wake a sender; returns its id"""
+        message_id = self._connection().execute(
+            'INSERT INTO outbox (recipient, subject, text_body, html_body, next_attempt, created_at) '
+            'VALUES (?, ?, ?, ?, 0, ?)', (recipient, subject, text_body, html_body, time.time())).lastrowid
+        self._count('queued')
+        with self._wakeup:
+            self._pending += 1
+            self._wakeup.notify()
+        return message_id
+
+    def enqueue_many(self, messages):
+        """Queue [(recipient, subject, text_body, html_body)] in one transaction; returns their ids"""
+        conn = self._connection()
+        created_at = time.time()
+        with conn:
+            conn.execute('BEGIN')
+            ids = [conn.execute(
+                'INSERT INTO outbox (recipient, subject, text_body, html_body, next_attempt, created_at) '
+                'VALUES (?, ?, ?, ?, 0, ?)', (*message, created_at)).lastrowid for message in messages]
+        self._count('queued', len(ids))
+        with self._wakeup:
+            self._pending += len(ids)
+            self._wakeup.notify_all()
+        return ids
+
+    def _claim(self):
+        """Lease up to batch_size due messages (pending, or claimed by a sender that gave up)"""
+        now = time.time()
+        return self._connection().execute(
+            "UPDATE outbox SET status = 'sending', next_attempt = ? WHERE id IN ("
+            "  SELECT id FROM outbox WHERE status IN ('pending', 'sending') AND next_attempt <= ?"
+            "  ORDER BY next_attempt, id LIMIT ?) "
+            "RETURNING id, recipient, subject, text_body, html_body, attempts",
+            (now + LEASE_SECONDS, now, self.batch_size)).fetchall()
+
+    def _sent(self, message):
+        self._connection().execute('DELETE FROM outbox WHERE id = ?', (message[0],))
+        self._count('sent')
+
+    def _failed(self, message, error, permanent):
+        """Schedule a retry with exponential backoff, or dead-letter the message"""
+        attempts = message[5] + 1
+        reason = f"{type(error).__name__}: {error}"
+        if permanent or attempts >= self.max_attempts:
+            self._connection().execute(
+                "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                (attempts, reason, message[0]))
+            self._count('dead')
+            print(f"❌ Email to {message[1]} failed permanently after {attempts} attempt(s): {reason}")
+            return
+        delay = min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+        delay *= random.uniform(0.8, 1.2)  # spread out retries after an outage
+        self._connection().execute(
+            "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+            (attempts, time.time() + delay, reason, message[0]))
+        self._count('retried')
+        print(f"⚠️ Email to {message[1]} failed (attempt {attempts}), retrying in {delay:.0f}s: {reason}")
+
+    def _connect(self):
+        config = self.config
+        print(f"   Connecting to {config['smtp_server']}:{config['smtp_port']}...")
+        server = smtplib.SMTP(config['smtp_server'], config['smtp_port'], timeout=10)
+        try:
+            if config.get('starttls', True):
+                server.starttls()
+            if config['password']:
+                server.login(config['sender'], config['password'])
+        except smtplib.SMTPAuthenticationError:
+            print(f"❌ SMTP Authentication failed for {config['sender']}")
+            print(f"   Check your email and password in .env file")
+            print(f"   Gmail users: Use an App Password, not your regular password")
+            print(f"   Get one at: https://myaccount.google.com/apppasswords")
+            server.close()
+            raise
+        except BaseException:
+            server.close()
+            raise
+        self._count('connections')
+        return server
+
+    def _deliver(self, server, message):
+        _, recipient, subject, text_body, html_body, _ = message
+        server.sendmail(self.config['sender'], [recipient],
+                        mime_message(self.config['sender'], recipient, subject, text_body, html_body))
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _work(self):
+        server, sent_on_server, last_used = None, 0, time.monotonic()
+        while True:
+            with self._wakeup:
+                if self._stopped:
+                    break
+                if self._pending == 0:
+                    if server is not None and time.monotonic() - last_used >= self.idle_seconds:
+                        self._close(server)
+                        server = None
+                    self._wakeup.wait(self.poll_seconds)
+                    if self._stopped:
+                        break
+                self._pending = 0
+            try:
+                batch = self._claim()
+            except sqlite3.Error as e:
+                print(f"❌ Outbox unavailable: {e}")
+                continue
+            for index, message in enumerate(batch):
+                if server is None or sent_on_server >= self.max_per_connection:
+                    if server is not None:
+                        self._close(server)
+                    server, sent_on_server = None, 0
+                    try:
+                        server = self._connect()
+                    except Exception as e:
+                        # The server is unreachable: the whole batch waits for a retry
+                        for unsent in batch[index:]:
+                            self._failed(unsent, e, permanent=False)
+                        break
+                try:
+                    self._deliver(server, message)
+                except Exception as e:
+                    if not _keeps_connection(e):
+                        server.close()
+                        server = None
+                    self._failed(message, e, permanent=is_permanent(e))
+                else:
+                    sent_on_server += 1
+                    self._sent(message)
+                    print(f"✅ Email sent successfully to {message[1]}")
+                last_used = time.monotonic()
+            if len(batch) == self.batch_size:
+                with self._wakeup:
+                    self._pending += 1  # there may be more waiting: keep going and get help
+                    self._wakeup.notify()
+        if server is not None:
+            self._close(server)
+
+    def _run_worker(self):
+        try:
+            self._work()
+        except Exception as e:
+            print(f"❌ Outbox worker stopped: {e}")
+            traceback.print_exc()
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run_worker, name=f'outbox-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """Stop the senders after their current batch; queued mail stays for the next start"""
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def dead_letters(self, limit=100):
+        rows = self._connection().execute(
+            "SELECT id, recipient, subject, attempts, created_at, last_error FROM outbox "
+            "WHERE status = 'dead' ORDER BY id DESC LIMIT ?", (limit,))
+        return [{'id': row[0], 'recipient': row[1], 'subject': row[2], 'attempts': row[3],
+                 'created_at': row[4], 'last_error': row[5]} for row in rows]
+
+    def requeue_dead(self, ids=None):
+        """Give dead letters (all, or the given ids) a fresh set of attempts; returns how many"""
+        query = "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt = 0 WHERE status = 'dead'"
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return 0
+            query += f" AND id IN ({', '.join('?' * len(ids))})"
+        count = self._connection().execute(query, ids or []).rowcount
+        with self._wakeup:
+            self._pending += count
+            self._wakeup.notify_all()
+        return count
+
+    def stats(self):
+        counts = dict(self._connection().execute('SELECT status, COUNT(*) FROM outbox GROUP BY status'))
+        with self._stats_lock:
+            return dict(self._stats, pending=counts.get('pending', 0) + counts.get('sending', 0),
+                        dead_letters=counts.get('dead', 0))
@@ -0,0 +1,143 @@
+"""
+In-process cache for prediction results
+LRU with a size bound and TTL, keyed on the canonical form of a patient's
+inputs and invalidated whenever the model files change
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from features import CATEGORICAL_MAPPINGS, CATEGORICAL_DEFAULTS, FLAG_FIELDS, INPUT_FIELDS
+
+# Numeric inputs, scored (and keyed) at the exact value given: any rounding
+# could move a value across a bin edge (bmi 24.96 -> 25.0) and change the result
+NUMERIC_KEY_FIELDS = ['age', 'avg_glucose_level', 'bmi',
+                      'blood_pressure']   # optional, read by the doctor recommendations
+
+# Categorical values are matched exactly, as the models encode them: an
+# unrecognised spelling ('male', 'Smokes') is scored as the field's default
+# category, so it is keyed as that category too
+_DEFAULT_CATEGORIES = {
+    field: next(name for name, code in CATEGORICAL_MAPPINGS[field].items() if code == default)
+    for field, default in CATEGORICAL_DEFAULTS.items()
+}
+
+KEY_FIELDS = INPUT_FIELDS + ['blood_pressure']
+
+
+def normalize_patient(data):
+    """
+    Canonical form of a validated patient record: numbers as floats, flags as
+    ints, categoricals as the category they are scored as.  Returns (key, record)
+    where key is hashable and record holds the same values.  The record is
+    what gets scored, so equal keys always mean equal results.
+    """
+    record = {}
+    for field in NUMERIC_KEY_FIELDS:
+        record[field] = float(data.get(field, 0) or 0) + 0.0  # +0.0 folds -0.0
+    for field in FLAG_FIELDS:
+        record[field] = int(data[field])
+    for field, mapping in CATEGORICAL_MAPPINGS.items():
+        value = data[field]
+        record[field] = value if isinstance(value, str) and value in mapping else _DEFAULT_CATEGORIES[field]
+    return tuple(record[field] for field in KEY_FIELDS), record
+
+
+def directory_fingerprint(path):
+    """(name, size, mtime) of every file in a directory; changes whenever a file is replaced"""
+    try:
+        entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return ()
+    return tuple(
+        (entry.name, stat.st_size, stat.st_mtime_ns)
+        for entry in entries if entry.is_file()
+        for stat in (entry.stat(),)
+    )
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with per-entry TTL.
+    Cached values are shared between requests and must not be mutated.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fingerprint = None
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, fingerprint=None):
+        """
+        Cache value for key.  With a fingerprint (of the models that produced
+        value), the value is dropped if the models changed since then.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if fingerprint is not None and fingerprint != self.fingerprint:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def check_fingerprint(self, fingerprint):
+        """
+        Drop every entry if the model fingerprint changed since the last check.
+        Returns True when it changed (the caller should reload its models).
+        """
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return False
+            if self.fingerprint is not None:
+                self.invalidations += 1
+            self.fingerprint = fingerprint
+            self._entries.clear()
+            return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,519 @@
+"""
+Table-driven food, doctor and Indian-food recommendations
+Each recommender reads a few inputs, puts each one in a bucket (glucose range,
+BMI range, flags, ...) and builds its advice from a rule table.  The tables are
+compiled at import into one lookup per recommender keyed by the bucket tuple,
+so a recommendation is a dict lookup returning a shared read-only payload with
+duplicates removed and items in table order.
+"""
+
+import json
+from itertools import product
+
+import numpy as np
+
+from storage import freeze
+
+
+class Dimension:
+    """
+    One discretized input.  `fields` are (field, default, cast) read from a
+    patient record, combined by `value` (the single field by default);
+    `buckets` are (label, test) pairs tried in order, the last with test None.
+    Tests and `value` only use comparisons and arithmetic, so they work on
+    plain numbers and on NumPy arrays alike.
+    """
+
+    def __init__(self, name, fields, buckets, value=None):
+        self.name = name
+        self.fields = fields
+        self.buckets = buckets
+        self.value = value
+        self.labels = list(dict.fromkeys(label for label, _ in buckets))
+        self._tests = buckets[:-1]
+        self._fallback = buckets[-1][0]
+
+    def bucket(self, record):
+        if self.value is None:
+            field, default, cast = self.fields[0]
+            value = cast(record.get(field, default))
+        else:
+            value = self.value(*[cast(record.get(field, default)) for field, default, cast in self.fields])
+        for label, test in self._tests:
+            if test(value):
+                return label
+        return self._fallback
+
+    def bucket_array(self, columns, n_rows):
+        """Bucket labels for n_rows records given as {field: array-like} columns"""
+        args = []
+        for field, default, cast in self.fields:
+            values = columns.get(field)
+            values = [default] * n_rows if values is None else _as_list(values)
+            if cast is str:
+                args.append(np.array([str(v) for v in values], dtype=str))
+            else:
+                args.append(np.fromiter(map(cast, values), dtype=np.float64, count=n_rows))
+        value = args[0] if self.value is None else self.value(*args)
+        return np.select([test(value) for _, test in self._tests], [label for label, _ in self._tests],
+                         self._fallback).tolist()
+
+
+def _as_list(values):
+    return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+
+class Recommender:
+    """
+    A set of dimensions plus build(buckets) -> payload, compiled into
+    {bucket tuple: read-only payload} for every combination of buckets.
+    """
+
+    def __init__(self, dimensions, build):
+        self.dimensions = dimensions
+        self.table = {}
+        payloads = {}  # equal payloads share one object
+        for key in product(*(dimension.labels for dimension in dimensions)):
+            payload = build(dict(zip((dimension.name for dimension in dimensions), key)))
+            self.table[key] = payloads.setdefault(json.dumps(payload), freeze(payload))
+
+    def lookup(self, record):
+        return self.table[tuple([dimension.bucket(record) for dimension in self.dimensions])]
+
+    def lookup_batch(self, columns, n_rows):
+        labels = [dimension.bucket_array(columns, n_rows) for dimension in self.dimensions]
+        return [self.table[key] for key in zip(*labels)]
+
+
+def apply_rules(rules, buckets, payload):
+    """Add the items of every rule whose (dimension, bucket) matches to payload's lists"""
+    for dimension, label, items in rules:
+        if dimension is not None and buckets[dimension] != label:
+            continue
+        for key, value in items.items():
+            if isinstance(payload[key], list):
+                payload[key].extend(value)
+            else:
+                payload[key] = value
+    for key, value in payload.items():
+        if isinstance(value, list):
+            payload[key] = list(dict.fromkeys(value))  # drop repeats, keep table order
+    return payload
+
+
+def _yes_no(field, test):
+    return Dimension(field, ((field, 0, int),), (('yes', test), ('no', None)))
+
+
+# Food recommendations based on risk factors
+FOOD_DIMENSIONS = [
+    Dimension('risk', (('risk_level', '', str),), (('HIGH', lambda v: v == 'HIGH'), ('other', None))),
+    Dimension('glucose', (('avg_glucose_level', 100, float),), (
+        ('diabetic', lambda v: v > 126),
+        ('elevated', lambda v: v > 100),
+        ('normal', None)
+    )),
+    Dimension('bmi', (('bmi', 25, float),), (
+        ('obese', lambda v: v > 30),
+        ('overweight', lambda v: v > 25),
+        ('underweight', lambda v: v < 18.5),
+        ('normal', None)
+    )),
+    _yes_no('hypertension', lambda v: v != 0),
+    _yes_no('heart_disease', lambda v: v != 0)
+]
+
+FOOD_RULES = [
+    # High Risk - Urgent
+    ('risk', 'HIGH', {
+        'urgent_message': "⚠️ URGENT: Please consult a doctor immediately! Your stroke risk is high."
+    }),
+    # Glucose-based recommendations
+    ('glucose', 'diabetic', {
+        'foods_to_eat': [
+            "🥬 Leafy greens (spinach, kale, broccoli)",
+            "🫘 Legumes (lentils, chickpeas, beans)",
+            "🥜 Nuts (almonds, walnuts)",
+            "🐟 Fatty fish (salmon, mackerel)",
+            "🫐 Berries (blueberries, strawberries)",
+            "🥑 Avocados",
+            "🍳 Eggs"
+        ],
+        'foods_to_avoid': [
+            "🍬 Sugary drinks and sodas",
+            "🍰 Processed desserts and sweets",
+            "🍞 White bread and refined carbs",
+            "🍟 Fried foods",
+            "🥤 Fruit juices with added sugar"
+        ],
+        'general_advice': ["Monitor blood sugar levels regularly. Consider a low-glycemic diet."]
+    }),
+    ('glucose', 'elevated', {
+        'foods_to_eat': [
+            "🥗 Fresh salads with olive oil",
+            "🍠 Sweet potatoes",
+            "🌾 Whole grains (quinoa, brown rice)",
+            "🍎 Apples and citrus fruits"
+        ],
+        'foods_to_avoid': [
+            "🍭 High-sugar snacks",
+            "🥐 Pastries and baked goods"
+        ],
+        'general_advice': ["Your glucose is slightly elevated. Focus on fiber-rich foods."]
+    }),
+    # BMI-based recommendations
+    ('bmi', 'obese', {
+        'foods_to_eat': [
+            "🥒 Low-calorie vegetables (cucumber, celery)",
+            "🍗 Lean protein (chicken breast, turkey)",
+            "🥚 Protein-rich breakfast",
+            "🍵 Green tea"
+        ],
+        'foods_to_avoid': [
+            "🍔 Fast food",
+            "🍕 High-calorie processed foods",
+            "🍿 Buttery snacks",
+            "🥓 Fatty meats"
+        ],
+        'general_advice': ["Weight management is crucial. Consider portion control and regular exercise."]
+    }),
+    ('bmi', 'overweight', {
+        'foods_to_eat': [
+            "🍲 Vegetable soups",
+            "🥙 Lean wraps"
+        ],
+        'general_advice': ["Moderate weight loss can significantly reduce stroke risk."]
+    }),
+    ('bmi', 'underweight', {
+        'foods_to_eat': [
+            "🥜 Nut butters",
+            "🥛 Full-fat dairy",
+            "🍌 Bananas and dates"
+        ],
+        'general_advice': ["Focus on nutrient-dense foods to gain healthy weight."]
+    }),
+    # Hypertension-based recommendations
+    ('hypertension', 'yes', {
+        'foods_to_eat': [
+            "🍌 Potassium-rich foods (bananas, potatoes)",
+            "🧄 Garlic and onions",
+            "🥛 Low-fat dairy",
+            "🫒 Olive oil"
+        ],
+        'foods_to_avoid': [
+            "🧂 High-sodium foods",
+            "🥫 Canned soups and processed foods",
+            "🥓 Processed meats (bacon, sausages)",
+            "🧀 High-sodium cheeses"
+        ],
+        'general_advice': ["Follow a DASH diet. Limit sodium to less than 2,300mg/day."]
+    }),
+    # Heart disease-based recommendations
+    ('heart_disease', 'yes', {
+        'foods_to_eat': [
+            "🐟 Omega-3 rich fish (2-3 times/week)",
+            "🫒 Extra virgin olive oil",
+            "🍷 Red wine (moderate, if approved by doctor)",
+            "🥜 Unsalted nuts"
+        ],
+        'foods_to_avoid': [
+            "🥩 Red meat (limit consumption)",
+            "🧈 Trans fats and saturated fats",
+            "🍳 Excessive egg yolks"
+        ],
+        'general_advice': ["Follow a Mediterranean-style diet. Regular cardiac check-ups are essential."]
+    })
+]
+
+# Added when fewer than MIN_FOODS_TO_EAT foods were recommended
+DEFAULT_FOODS_TO_EAT = [
+    "🥗 Fresh vegetables",
+    "🍎 Fresh fruits",
+    "💧 Plenty of water (8 glasses/day)",
+    "🌾 Whole grains"
+]
+MIN_FOODS_TO_EAT = 5
+
+
+def _build_food(buckets):
+    payload = apply_rules(FOOD_RULES, buckets, {
+        'foods_to_eat': [],
+        'foods_to_avoid': [],
+        'general_advice': [],
+        'urgent_message': None
+    })
+    if len(payload['foods_to_eat']) < MIN_FOODS_TO_EAT:
+        payload['foods_to_eat'].extend(DEFAULT_FOODS_TO_EAT)
+    return payload
+
+
+# Doctor recommendations: the worse of the blood pressure and glucose risks,
+# raised for active or former smokers, selects one of three advice sets
+RISK_ORDER = ['low', 'medium', 'high']
+
+DOCTOR_DIMENSIONS = [
+    # Glucose (mg/dL), WHO clinical thresholds: normal < 100, elevated 100-139, diabetic >= 140
+    Dimension('glucose', (('avg_glucose_level', 100, float),), (
+        ('low', lambda v: v < 100),
+        ('medium', lambda v: v < 140),
+        ('high', None)
+    )),
+    # Blood pressure (mmHg): < 100 low, 120-160 medium, >= 180 high, 100-119 borderline (medium).
+    # Without a reading (0), diagnosed hypertension counts as stage 2 (180), otherwise 90.
+    Dimension('blood_pressure', (('blood_pressure', 0, float), ('hypertension', 0, int)), (
+        ('low', lambda v: v < 100),
+        ('medium', lambda v: (v >= 120) & (v <= 160)),
+        ('high', lambda v: v >= 180),
+        ('medium', None)
+    ), value=lambda bp, hypertension: bp + (bp == 0) * (90 + 90 * (hypertension == 1))),
+    Dimension('smoking', (('smoking_status', '', str),), (
+        ('smokes', lambda v: v == 'smokes'),
+        ('former', lambda v: v == 'formerly smoked'),
+        ('other', None)
+    ))
+]
+
+DOCTOR_ADVICE = {
+    'low': {
+        'risk_category': 'Low Risk',
+        'risk_level': 'LOW',
+        'medical_advice': [
+            "Your glucose and blood pressure levels are within normal range",
+            "Continue maintaining a healthy lifestyle",
+            "Annual health check-ups are recommended"
+        ],
+        'indian_foods_to_eat': [
+            "🍛 Dal (lentils) - High in protein and fiber",
+            "🥬 Palak (spinach) curry",
+            "🥒 Cucumber raita with low-fat curd",
+            "🌾 Brown rice or multi-grain roti",
+            "🥗 Mixed vegetable sabzi",
+            "🍵 Herbal chai with mint/tulsi",
+            "🥜 Roasted chana (chickpeas)",
+            "🫘 Moong dal sprouts salad",
+            "🍅 Tomato and onion salad",
+            "🥥 Coconut water"
+        ],
+        'indian_foods_to_avoid': [
+            "🍰 Excessive sweets (gulab jamun, jalebi, barfi)",
+            "🍟 Deep-fried snacks (samosa, pakora, bhajiya)",
+            "🧂 High-salt pickles and papad",
+            "🥤 Sugary drinks and packaged juices"
+        ],
+        'lifestyle_changes': [
+            "Practice yoga or light exercise for 30 minutes daily",
+            "Maintain regular meal timings",
+            "Stay hydrated with water and herbal teas",
+            "Get 7-8 hours of quality sleep"
+        ]
+    },
+    'medium': {
+        'risk_category': 'Medium Risk',
+        'risk_level': 'MEDIUM',
+        'medical_advice': [
+            "⚠️ Your glucose and/or blood pressure levels indicate medium risk",
+            "Schedule a consultation with your doctor within 2 weeks",
+            "Regular monitoring of glucose and blood pressure is essential",
+            "Consider lifestyle modifications to prevent progression",
+            "Monthly medical check-ups recommended"
+        ],
+        'indian_foods_to_eat': [
+            "🥬 Methi (fenugreek) sabzi - Helps control blood sugar",
+            "🫘 Masoor dal, moong dal, chana dal",
+            "🥒 Karela (bitter gourd) juice or sabzi",
+            "🌾 Oats upma or dalia (broken wheat)",
+            "🥗 Cabbage and carrot sabzi",
+            "🍅 Tomato soup (low salt)",
+            "🫚 Ginger and garlic in cooking",
+            "🥜 Small portions of almonds and walnuts",
+            "🍵 Green tea or tulsi tea",
+            "🥥 Buttermilk (chaas) without salt",
+            "🥕 Beetroot and carrot salad",
+            "🫑 Capsicum (bell pepper) sabzi"
+        ],
+        'indian_foods_to_avoid': [
+            "🍚 White rice and refined flour (maida) products",
+            "🥔 Potato-based dishes (aloo paratha, aloo sabzi)",
+            "🍰 All sweets and desserts (mithai, halwa, kheer)",
+            "🍟 Fried foods (samosa, kachori, poori, bhatura)",
+            "🧂 High-salt foods (pickles, papad, namkeen)",
+            "🥓 Processed meats and sausages",
+            "🧈 Ghee and butter in excess",
+            "🥤 Sugary beverages and packaged juices",
+            "🍞 White bread and biscuits",
+            "🧀 Full-fat paneer and cheese"
+        ],
+        'lifestyle_changes': [
+            "Walking for 45 minutes daily (morning or evening)",
+            "Practice pranayama and meditation for stress reduction",
+            "Monitor blood sugar levels twice a week",
+            "Reduce salt intake to less than 5g per day",
+            "Avoid skipping meals - eat small frequent meals",
+            "Limit screen time and ensure adequate rest",
+            "Consider joining a diabetes/hypertension management program"
+        ]
+    },
+    'high': {
+        'risk_category': 'High Risk',
+        'risk_level': 'HIGH',
+        'medical_advice': [
+            "🚨 URGENT: Your glucose and/or blood pressure levels are critically high",
+            "IMMEDIATE doctor consultation required - within 24-48 hours",
+            "You may need medication to manage glucose and blood pressure",
+            "Daily monitoring of vital parameters is mandatory",
+            "Follow prescribed medication schedule strictly",
+            "Consider hospitalization if symptoms worsen",
+            "Weekly doctor follow-ups essential"
+        ],
+        'indian_foods_to_eat': [
+            "🫘 Only dal-based proteins (masoor, moong - minimal oil)",
+            "🥬 Steamed or boiled vegetables (palak, lauki, turai)",
+            "🥒 Karela juice daily (bitter gourd)",
+            "🫚 Ginger-garlic paste in minimal quantities",
+            "🍵 Herbal teas (green tea, fenugreek tea)",
+            "🥗 Raw salads (cucumber, tomato, radish)",
+            "🌾 Small portions of oats or dalia",
+            "🥥 Coconut water (natural, unsweetened)",
+            "🫘 Sprouts (moong, chana) - steamed",
+            "🥛 Skimmed milk only"
+        ],
+        'indian_foods_to_avoid': [
+            "🚫 COMPLETELY AVOID all sweets and desserts",
+            "🚫 NO fried foods whatsoever (pakora, samosa, poori, vada)",
+            "🚫 NO white rice, potatoes, or maida products",
+            "🚫 NO pickles, papad, or namkeen",
+            "🚫 NO full-fat dairy products",
+            "🚫 NO ghee, butter, or dalda",
+            "🚫 NO sugary drinks, sodas, or packaged juices",
+            "🚫 NO processed or canned foods",
+            "🚫 NO red meat or organ meats",
+            "🚫 NO coconut milk or heavy gravies",
+            "🚫 NO bakery items (bread, biscuits, cakes)",
+            "🚫 Strictly limit salt to 3g per day"
+        ],
+        'lifestyle_changes': [
+            "⚠️ CRITICAL: Strict adherence to medication schedule",
+            "Monitor glucose levels twice daily (fasting and post-meal)",
+            "Check blood pressure twice daily",
+            "Walking after every meal (even 10-15 minutes helps)",
+            "Complete bed rest if advised by doctor",
+            "Avoid all sources of stress - practice deep breathing",
+            "Sleep 8 hours minimum, maintain regular sleep schedule",
+            "Keep emergency contact numbers handy",
+            "Inform family members about your condition",
+            "Consider staying with family/caregivers initially"
+        ]
+    }
+}
+
+
+def _build_doctor(buckets):
+    combined = max(RISK_ORDER.index(buckets['blood_pressure']), RISK_ORDER.index(buckets['glucose']))
+    if buckets['smoking'] == 'smokes':
+        # Active smoking upgrades risk by one level (low→medium, medium→high)
+        combined = min(combined + 1, 2)
+    elif buckets['smoking'] == 'former' and combined == 0:
+        # Former smokers have elevated baseline risk
+        combined = 1
+    return DOCTOR_ADVICE[RISK_ORDER[combined]]
+
+
+# Indian food recommendations based on input health parameters
+INDIAN_FOOD_DIMENSIONS = [
+    Dimension('glucose', (('avg_glucose_level', 0, float),), (
+        ('good', lambda v: v < 100),
+        ('moderate', lambda v: v <= 160),
+        ('high', None)
+    )),
+    Dimension('bmi', (('bmi', 0, float),), (
+        ('obese', lambda v: v > 30),
+        ('overweight', lambda v: v >= 25),
+        ('normal', None)
+    )),
+    _yes_no('hypertension', lambda v: v == 1),
+    _yes_no('heart_disease', lambda v: v == 1),
+    Dimension('senior', (('age', 0, int),), (('yes', lambda v: v > 60), ('no', None)))
+]
+
+INDIAN_FOOD_RULES = [
+    ('glucose', 'good', {'items': [
+        "✅ Your glucose is good! Include: Whole moong, bajra roti, oats upma"
+    ]}),
+    ('glucose', 'moderate', {'items': [
+        "⚠️ Moderate glucose - Prefer: Sugar-free dal preparations, methi leaves, bitter gourd sabzi",
+        "❌ Reduce: White rice, sweet dishes, refined flour items"
+    ]}),
+    ('glucose', 'high', {'items': [
+        "🚨 High glucose - Focus on: Karela juice, methi water, chana dal, avoid all sweets",
+        "❌ Strictly avoid: Rice dishes, roti made from maida, jaggery-based foods"
+    ]}),
+    ('bmi', 'obese', {'items': [
+        "⚖️ Weight management: Choose steamed idli, vegetable upma, avoid fried foods",
+        "❌ Skip: All fried items (samosa, pakora, bhajiya), heavy curries with cream"
+    ]}),
+    ('bmi', 'overweight', {'items': [
+        "⚖️ Light meals: Khichdi, dal-rice, vegetable soups"
+    ]}),
+    ('hypertension', 'yes', {'items': [
+        "🩺 For BP control: Low-salt dal, jeera water, coconut water",
+        "❌ Avoid: Pickles, papad, salted buttermilk, commercial masalas"
+    ]}),
+    ('heart_disease', 'yes', {'items': [
+        "❤️ Heart-healthy: Garlic chutney, flaxseed chutney, oats dosa",
+        "❌ Avoid: Ghee, butter, coconut oil cooking, full-fat dairy"
+    ]}),
+    ('senior', 'yes', {'items': [
+        "👴 For seniors: Soft khichdi, dal water, vegetable soups, avoid hard-to-digest foods"
+    ]}),
+    # General healthy Indian foods suitable for stroke prevention, for everyone
+    (None, None, {'items': [
+        "🥗 Moong dal (yellow lentils) - high in protein, low in fat",
+        "🍚 Brown rice or hand-pounded rice instead of white rice",
+        "🥬 Palak (spinach) sabzi with minimal oil",
+        "🥒 Cucumber raita with low-fat yogurt",
+        "🫘 Chana dal or masoor dal preparations",
+        "🌾 Ragi (finger millet) porridge or roti"
+    ]}),
+    # General tips
+    (None, None, {'items': [
+        "💡 Cooking tips: Use minimal oil, prefer steaming/boiling, add turmeric & ginger",
+        "🥤 Beverages: Buttermilk (low salt), herbal tea, jeera water, avoid sugary drinks"
+    ]})
+]
+
+
+def _build_indian_food(buckets):
+    return apply_rules(INDIAN_FOOD_RULES, buckets, {'items': []})['items']
+
+
+FOOD = Recommender(FOOD_DIMENSIONS, _build_food)
+DOCTOR = Recommender(DOCTOR_DIMENSIONS, _build_doctor)
+INDIAN_FOOD = Recommender(INDIAN_FOOD_DIMENSIONS, _build_indian_food)
+
+
+def get_food_recommendations(data, risk_level):
+    return FOOD.lookup({**data, 'risk_level': risk_level})
+
+
+def get_doctor_recommendations(data):
+    """Doctor recommendations from blood pressure, glucose and smoking status"""
+    return DOCTOR.lookup(data)
+
+
+def get_indian_food_recommendations(data):
+    """Indian food recommendations based on input health parameters"""
+    return INDIAN_FOOD.lookup(data)
+
+
+def recommend_batch(columns, risk_levels):
+    """
+    Recommendations for many patients at once: `columns` maps input fields to
+    equal-length arrays (missing fields take the per-field default) and
+    `risk_levels` holds each patient's ensemble risk level.
+    Returns (food, doctor, indian_food) lists with one shared payload per patient.
+    """
+    n_rows = len(risk_levels)
+    food_columns = dict(columns, risk_level=risk_levels)
+    return (FOOD.lookup_batch(food_columns, n_rows),
+            DOCTOR.lookup_batch(columns, n_rows),
+            INDIAN_FOOD.lookup_batch(columns, n_rows))
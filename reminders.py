@@ -0,0 +1,496 @@
+"""
+Event-driven medication reminders and alerts
+Keeps a min-heap with the next deadline of every untaken dose and sleeps until
+the earliest one, so a wake-up only touches the doses that are actually due
+instead of re-scanning every user, medication and slot each minute.  The same
+timeline drives the reminder emails (ReminderEngine) and the overdue alerts
+pushed to open medication pages (AlertFeed).
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+# Reminder rules, in minutes after a dose's scheduled time
+IMMEDIATE_WINDOW = 15    # the first reminder goes out within this window
+ESCALATION_AFTER = 120   # the urgent reminder goes out from this point on
+MINUTES_PER_DAY = 24 * 60
+
+IMMEDIATE = 'immediate'
+ESCALATION = 'escalation'
+
+# A reminder that could not be sent is tried again after this long
+RETRY_SECONDS = 60
+
+
+def slot_minutes(slot_time):
+    """Minute of the day of an "HH:MM" schedule time (ValueError if malformed)"""
+    hour, minute = map(int, slot_time.split(':'))
+    return hour * 60 + minute
+
+
+def next_alert(slot, now):
+    """
+    (due datetime, stage) of the next reminder a dose needs, or None.
+
+    Same rules as the old once-a-minute scan, which compared minutes of the day:
+    the immediate reminder while 0-15 minutes late and none has been sent, the
+    urgent one from 120 minutes late while fewer than two have.  A dose whose
+    escalation would fall past midnight gets its immediate reminder again the
+    next day until reset-daily clears it, exactly as the scan did.
+    """
+    if slot.get('taken', False) or not slot.get('time'):
+        return None
+    alert_count = slot.get('alert_count') or 0
+    if alert_count >= 2:
+        return None
+    scheduled = slot_minutes(slot['time'])
+    minute = now.hour * 60 + now.minute
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if alert_count == 0:
+        if minute < scheduled:
+            return midnight + timedelta(minutes=scheduled), IMMEDIATE
+        if minute <= scheduled + IMMEDIATE_WINDOW:
+            return now, IMMEDIATE
+    if scheduled + ESCALATION_AFTER < MINUTES_PER_DAY:
+        if minute < scheduled + ESCALATION_AFTER:
+            return midnight + timedelta(minutes=scheduled + ESCALATION_AFTER), ESCALATION
+        return now, ESCALATION
+    if alert_count == 0:
+        return midnight + timedelta(days=1, minutes=scheduled), IMMEDIATE
+    return None
+
+
+# Overdue alert severities shown in the app, from this many minutes late
+SEVERITIES = ((1, 'warning'), (30, 'urgent'), (120, 'critical'))
+
+
+def alert_severity(minutes_overdue):
+    severity = None
+    for offset, name in SEVERITIES:
+        if minutes_overdue >= offset:
+            severity = name
+    return severity
+
+
+def medication_alerts(user_meds, now):
+    """Overdue alerts of one user's untaken doses, as /api/medications/alerts returns them"""
+    alerts = []
+    minute = now.hour * 60 + now.minute
+    for med in user_meds:
+        medication_name = med.get('tablet_name', 'Medication')
+        for slot in med.get('schedule', []):
+            if slot.get('taken', False) or not slot.get('time'):
+                continue
+            try:
+                time_diff = minute - slot_minutes(slot['time'])
+            except ValueError:
+                continue
+            severity = alert_severity(time_diff)
+            if severity is None:
+                continue
+            slot_name = slot.get('slot', 'unknown')
+            alerts.append({
+                'medication': medication_name,
+                'slot': slot_name,
+                'scheduled_time': slot['time'],
+                'minutes_overdue': time_diff,
+                'severity': severity,
+                'message': f"{medication_name} ({slot_name}) is {time_diff} minutes overdue!"
+            })
+    return alerts
+
+
+def next_severity_change(slot, now):
+    """
+    (datetime, severity) of the next time a dose's alert changes: it appears,
+    escalates, or (at midnight, when the minute-of-day comparison wraps) goes away
+    """
+    if slot.get('taken', False) or not slot.get('time'):
+        return None
+    scheduled = slot_minutes(slot['time'])
+    minute = now.hour * 60 + now.minute
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for offset, severity in SEVERITIES:
+        if minute < scheduled + offset < MINUTES_PER_DAY:
+            return midnight + timedelta(minutes=scheduled + offset), severity
+    return midnight + timedelta(days=1), None
+
+
+def _find_slot(user_meds, med_id, slot_name):
+    for med in user_meds:
+        if med.get('id') == med_id:
+            for slot in med.get('schedule', []):
+                if slot.get('slot') == slot_name:
+                    return med, slot
+            break
+    return None, None
+
+
+class DoseTimeline:
+    """
+    Min-heap of (deadline, dose) over every untaken dose of the users it tracks.
+
+    `read_medications()` returns the current read-only {username: [medication]}
+    snapshot; it must return the same object while nothing changed (the storage
+    backends cache it), which keeps an idle sync to an identity check.  Users
+    whose medications differ from the last snapshot have their doses
+    rescheduled; heap entries that no longer match a dose's current deadline
+    are dropped when they surface.  Subclasses say when a dose is next due
+    (_next_event) and what happens then (run_due).
+    """
+
+    thread_name = 'dose-timeline'
+
+    def __init__(self, read_medications, sync_seconds=60):
+        self.read_medications = read_medications
+        self.sync_seconds = sync_seconds  # picks up edits made by other processes
+        self._heap = []       # (due, sequence, username, med_id, slot_name)
+        self._due = {}        # (username, med_id, slot_name) -> (due, stage) of its live heap entry
+        self._user_keys = {}  # username -> keys of that user's doses
+        self._snapshot = {}
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._changed = False
+        self._stopped = False
+        self._thread = None
+
+    def _next_event(self, slot, now):
+        raise NotImplementedError
+
+    def _tracked(self, snapshot):
+        """Usernames to keep scheduled"""
+        return set(snapshot) | set(self._snapshot)
+
+    def _schedule(self, key, slot, now):
+        try:
+            alert = self._next_event(slot, now)
+        except ValueError:
+            print(f"      ⚠️ Invalid time format for medication: {slot.get('time')}")
+            alert = None
+        if alert is None:
+            self._due.pop(key, None)
+            return
+        self._due[key] = alert
+        heapq.heappush(self._heap, (alert[0], next(self._sequence)) + key)
+
+    def _unschedule_user(self, username):
+        for key in self._user_keys.pop(username, ()):
+            self._due.pop(key, None)
+
+    def _schedule_user(self, username, user_meds, now):
+        self._unschedule_user(username)
+        keys = set()
+        for med in user_meds:
+            for slot in med.get('schedule', []):
+                key = (username, med.get('id'), slot.get('slot', 'unknown'))
+                if key not in keys:  # mark-taken and alerts only ever touch the first slot of a name
+                    keys.add(key)
+                    self._schedule(key, slot, now)
+        if keys:
+            self._user_keys[username] = keys
+
+    def sync(self, now=None):
+        """Reschedule the doses of every user whose medications changed since the last sync"""
+        snapshot = self.read_medications()
+        if snapshot is self._snapshot:
+            return 0
+        now = now or datetime.now()
+        changed = [username for username in self._tracked(snapshot)
+                   if snapshot.get(username) != self._snapshot.get(username)]
+        for username in changed:
+            self._schedule_user(username, snapshot.get(username, ()), now)
+        self._snapshot = snapshot
+        return len(changed)
+
+    def next_deadline(self):
+        """Earliest live deadline, or None when nothing is pending"""
+        while self._heap:
+            due, _, *key = self._heap[0]
+            alert = self._due.get(tuple(key))
+            if alert is not None and alert[0] == due:
+                return due
+            heapq.heappop(self._heap)  # superseded by a reschedule
+        return None
+
+    def _pop_due(self, now):
+        due_keys = []
+        while True:
+            due = self.next_deadline()
+            if due is None or due > now:
+                return due_keys
+            _, _, *key = heapq.heappop(self._heap)
+            due_keys.append(tuple(key))
+            del self._due[tuple(key)]
+
+    def run_due(self, now=None):
+        raise NotImplementedError
+
+    def schedule_changed(self):
+        """Wake the thread so a schedule edit made by this process is picked up immediately"""
+        with self._wakeup:
+            self._changed = True
+            self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"❌ Error in {self.thread_name}: {e}")
+                import traceback
+                traceback.print_exc()
+            with self._run_lock:
+                due = self.next_deadline()
+            with self._wakeup:
+                timeout = self.sync_seconds
+                if due is not None:
+                    timeout = min(timeout, max((due - datetime.now()).total_seconds(), 0))
+                if not self._changed and not self._stopped:
+                    self._wakeup.wait(timeout)
+                self._changed = False
+                if self._stopped:
+                    return
+
+    def start(self):
+        """Start (or, after stop(), restart) the background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._wakeup:
+            self._stopped = False
+            self._changed = False
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class ReminderEngine(DoseTimeline):
+    """
+    Sends each dose's reminder emails when they fall due.
+
+    `send_alerts([(username, med, slot, stage)], now)` sends the reminders
+    due in one pass and returns a success flag for each.  The pass then hands
+    every alert that went out to
+    `record_alerts([(username, med_id, slot_name, last_alert_sent, alert_count)])`
+    at once, so a pass costs one write however many reminders went out.
+    """
+
+    thread_name = 'medication-reminders'
+
+    def __init__(self, read_medications, send_alerts, record_alerts, sync_seconds=60):
+        super().__init__(read_medications, sync_seconds)
+        self.send_alerts = send_alerts
+        self.record_alerts = record_alerts
+        self._stats = {'runs': 0, 'alerts_sent': 0, 'writes': 0, 'writes_avoided': 0,
+                       'last_run_ms': 0.0, 'total_run_ms': 0.0}
+
+    def _next_event(self, slot, now):
+        return next_alert(slot, now)
+
+    def run_due(self, now=None):
+        """
+        Sync, then send every reminder whose deadline has passed and record them
+        all with one record_alerts() call; returns how many were sent
+        """
+        with self._run_lock:
+            started = time.perf_counter()
+            now = now or datetime.now()
+            self.sync(now)
+            due_keys = self._pop_due(now)
+            if not due_keys:
+                return 0
+            print(f"\n⏰ [SCHEDULER] {len(due_keys)} reminder(s) due at {now.strftime('%H:%M:%S')}")
+            sent_at = now.isoformat()
+            ready = []  # (key, med, slot, stage) of the doses that still need their reminder
+            for key in due_keys:
+                username, med_id, slot_name = key
+                med, slot = _find_slot(self._snapshot.get(username, ()), med_id, slot_name)
+                if slot is None:
+                    continue
+                alert = next_alert(slot, now)
+                if alert is None:
+                    continue
+                if alert[0] > now:
+                    self._schedule(key, slot, now)
+                    continue
+                ready.append((key, med, slot, alert[1]))
+
+            sent = self.send_alerts([(key[0], med, slot, stage) for key, med, slot, stage in ready], now) if ready else []
+            changes = []  # (username, med_id, slot_name, last_alert_sent, alert_count)
+            for (key, med, slot, stage), ok in zip(ready, sent):
+                if ok:
+                    alert_count = 1 if stage == IMMEDIATE else 2
+                    changes.append(key + (sent_at, alert_count))
+                    self._schedule(key, dict(slot, alert_count=alert_count, last_alert_sent=sent_at), now)
+                else:
+                    self._due[key] = (now + timedelta(seconds=RETRY_SECONDS), stage)
+                    heapq.heappush(self._heap, (self._due[key][0], next(self._sequence)) + key)
+            if changes:
+                self.record_alerts(changes)
+
+            run_ms = (time.perf_counter() - started) * 1000
+            self._stats['runs'] += 1
+            self._stats['alerts_sent'] += len(changes)
+            self._stats['writes'] += 1 if changes else 0
+            self._stats['writes_avoided'] += max(len(changes) - 1, 0)
+            self._stats['last_run_ms'] = round(run_ms, 3)
+            self._stats['total_run_ms'] = round(self._stats['total_run_ms'] + run_ms, 3)
+            print(f"   ✓ {len(changes)} reminder(s) sent in {run_ms:.1f} ms, "
+                  f"{1 if changes else 0} write ({max(len(changes) - 1, 0)} avoided)")
+            return len(changes)
+
+    def stats(self):
+        """Counters for passes that had reminders due (writes_avoided: one per alert beyond the first)"""
+        with self._run_lock:
+            return dict(self._stats, pending=len(self._due))
+
+
+class AlertSubscription:
+    """
+    One open alert stream.  Holds only the newest alert list: a reader that
+    falls behind skips the lists it missed, so a connection's memory stays
+    bounded however many changes happen while it is slow.
+    """
+
+    def __init__(self, username):
+        self.username = username
+        self._ready = threading.Condition()
+        self._alerts = None
+        self._fresh = False
+        self.closed = False
+
+    def push(self, alerts):
+        with self._ready:
+            self._alerts = alerts
+            self._fresh = True
+            self._ready.notify()
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+
+    def get(self, timeout):
+        """The newest alert list not yet read, or None after `timeout` seconds without one"""
+        with self._ready:
+            if not self._fresh and not self.closed:
+                self._ready.wait(timeout)
+            if not self._fresh:
+                return None
+            self._fresh = False
+            return self._alerts
+
+
+class AlertFeed(DoseTimeline):
+    """
+    Pushes each subscribed user's overdue alerts (see medication_alerts) when
+    they change: a dose becomes overdue, its severity escalates at 30 and 120
+    minutes, it is taken, or the user's medications are edited.
+
+    Only users with an open stream are scheduled, one heap entry per dose at
+    its next severity change, so the cost follows the number of changes rather
+    than how many pages are open or how often they would have polled.
+    """
+
+    thread_name = 'medication-alerts'
+
+    def __init__(self, read_medications, sync_seconds=5, max_subscribers=100):
+        super().__init__(read_medications, sync_seconds)
+        self.max_subscribers = max_subscribers
+        self._subscribers = {}   # username -> set of AlertSubscription
+        self._published = {}     # username -> last alert list pushed
+        self._dirty = set()      # users rescheduled since their alerts were last compared
+        self._stats = {'pushes': 0, 'runs': 0}
+
+    def _next_event(self, slot, now):
+        return next_severity_change(slot, now)
+
+    def _tracked(self, snapshot):
+        return set(self._subscribers)
+
+    def _schedule_user(self, username, user_meds, now):
+        super()._schedule_user(username, user_meds, now)
+        self._dirty.add(username)
+
+    def _publish(self, username, now):
+        alerts = medication_alerts(self._snapshot.get(username, ()), now)
+        changes = [(a['medication'], a['slot'], a['scheduled_time'], a['severity']) for a in alerts]
+        published = self._published.get(username)
+        if published is not None and changes == published[0]:
+            return
+        self._published[username] = (changes, alerts)
+        for subscription in self._subscribers.get(username, ()):
+            subscription.push(alerts)
+        self._stats['pushes'] += 1
+
+    def run_due(self, now=None):
+        """Sync, then push the alerts of every subscribed user whose alerts changed"""
+        with self._run_lock:
+            now = now or datetime.now()
+            self.sync(now)
+            for username, _, _ in self._pop_due(now):
+                if username in self._subscribers and username not in self._dirty:
+                    self._schedule_user(username, self._snapshot.get(username, ()), now)
+            dirty, self._dirty = self._dirty, set()
+            for username in dirty:
+                if username in self._subscribers:
+                    self._publish(username, now)
+            self._stats['runs'] += 1
+            return len(dirty)
+
+    def subscribe(self, username, now=None):
+        """
+        Open a stream for a user, primed with their current alerts;
+        None when max_subscribers streams are already open
+        """
+        subscription = AlertSubscription(username)
+        with self._run_lock:
+            if sum(map(len, self._subscribers.values())) >= self.max_subscribers:
+                return None
+            now = now or datetime.now()
+            self.sync(now)
+            first = username not in self._subscribers
+            self._subscribers.setdefault(username, set()).add(subscription)
+            if first:
+                self._schedule_user(username, self._snapshot.get(username, ()), now)
+                self._published.pop(username, None)
+                self._publish(username, now)
+                self._dirty.discard(username)
+            else:
+                subscription.push(self._published[username][1])
+        self.schedule_changed()  # the thread may need to wake earlier for this user's doses
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._run_lock:
+            subscriptions = self._subscribers.get(subscription.username, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.username, None)
+                self._published.pop(subscription.username, None)
+                self._dirty.discard(subscription.username)
+                self._unschedule_user(subscription.username)
+
+    def stop(self):
+        super().stop()
+        with self._run_lock:
+            for subscriptions in self._subscribers.values():
+                for subscription in subscriptions:
+                    subscription.close()
+
+    def stats(self):
+        with self._run_lock:
+            return dict(self._stats, streams=sum(map(len, self._subscribers.values())),
+                        users=len(self._subscribers), pending=len(self._due))
@@ -0,0 +1,182 @@
+"""
+Content-addressed cache for generated PDF reports
+A report is keyed on a hash of everything it is drawn from plus the version of
+the code that draws it, so a key never needs invalidating: a changed entry or
+a changed template simply hashes to a new key.  Recent reports are kept in
+memory; all of them are kept as files (shared by every worker process) and the
+least recently used files are removed once the directory outgrows its budget.
+Each file has an empty <key>.<user hash>.owner marker per user allowed to
+download it, so a worker that did not queue a report can still check access.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+_KEY = re.compile(r'[0-9a-f]{64}')
+
+
+def is_content_key(value):
+    """True for a well-formed key (safe to use as a file name)"""
+    return isinstance(value, str) and _KEY.fullmatch(value) is not None
+
+
+def content_key(version, *parts):
+    """Hex digest of the report inputs (JSON-serialisable) under one template version"""
+    payload = json.dumps([version, *parts], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """
+    Thread-safe two-tier cache of PDF bytes: an in-process LRU bounded by
+    memory_max_bytes, over a directory of <key>.pdf files bounded by
+    disk_max_bytes.  A file's mtime is its last use; eviction removes the
+    oldest files until the directory is back under 90% of its budget.
+    """
+
+    def __init__(self, directory, disk_max_bytes=200 * 1024 * 1024, memory_max_bytes=32 * 1024 * 1024):
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._disk_bytes = self._scan_bytes()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pdf')
+
+    def _owner_path(self, key, owner):
+        digest = hashlib.sha256(str(owner).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.{digest}.owner")
+
+    def _scan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pdf') and entry.is_file():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another process meanwhile
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _scan_bytes(self):
+        return sum(size for _, size, _ in self._scan())
+
+    def _remember(self, key, data):
+        """Add to the memory tier (caller holds the lock)"""
+        if len(data) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get(self, key):
+        """
+        (bytes, None) from memory, (None, path) of the cached file, or
+        (None, None) on a miss.  A path may vanish before it is read if
+        another process evicts it: treat FileNotFoundError as a miss.
+        """
+        if not is_content_key(key):
+            raise ValueError(f"Not a report cache key: {key!r}")
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data, None
+        path = self._path(key)
+        try:
+            os.utime(path)  # mark as recently used for the LRU eviction
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None, None
+        with self._lock:
+            self.disk_hits += 1
+        return None, path
+
+    def put(self, key, data):
+        """Store a built report in both tiers"""
+        if not is_content_key(key):
+            raise ValueError(f"Not a report cache key: {key!r}")
+        with self._lock:
+            self._remember(key, data)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))  # readers never see a partial file
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        with self._lock:
+            self._disk_bytes += len(data)
+            if self._disk_bytes <= self.disk_max_bytes:
+                return
+        self._evict()
+
+    def add_owner(self, key, owner):
+        """Record that `owner` may download the report under `key`"""
+        if not is_content_key(key):
+            raise ValueError(f"Not a report cache key: {key!r}")
+        with open(self._owner_path(key, owner), 'a'):
+            pass
+
+    def is_owner(self, key, owner):
+        """True if add_owner(key, owner) was called (by any process) since the report was last evicted"""
+        return is_content_key(key) and os.path.exists(self._owner_path(key, owner))
+
+    def _evict(self):
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            for marker in glob.glob(glob.escape(path[:-len('.pdf')]) + '.*.owner'):
+                try:
+                    os.unlink(marker)
+                except FileNotFoundError:
+                    pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+            self.evictions += removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions
+            }
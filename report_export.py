@@ -0,0 +1,75 @@
+"""
+Streaming ZIP archives for bulk report exports
+zipfile writes the archive into a small write-only buffer that is drained
+after every member, so a response can send each report as soon as it is
+rendered and never holds more than one of them (plus the central directory,
+a few dozen bytes per member) in memory.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9@._-]+')
+
+
+class _Chunks:
+    """Write-only file object for zipfile (unseekable, so it writes data descriptors)"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def safe_name(value):
+    """A user name or timestamp made safe for a path inside the archive"""
+    return _UNSAFE.sub('_', str(value)).strip('._') or 'unknown'
+
+
+def member_name(username, entry):
+    """Archive path of one history entry's report: <user>/<timestamp>_<id>.pdf"""
+    stamp = safe_name(entry.get('timestamp', '')[:19].replace(':', '-'))
+    return f"{safe_name(username)}/{stamp}_{safe_name(entry.get('id', ''))}.pdf"
+
+
+def _date_time(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).timetuple()[:6]
+    except (TypeError, ValueError):
+        return datetime.now().timetuple()[:6]
+
+
+def stream_zip(reports):
+    """
+    Bytes chunks of a ZIP archive.  `reports` yields (name, timestamp,
+    pdf_bytes, error) in any order; failed reports are left out of the
+    archive and every report is listed in a closing index.csv.  PDFs are
+    already compressed, so they are stored rather than deflated again.
+    """
+    sink = _Chunks()
+    index = io.StringIO()
+    writer = csv.writer(index)
+    writer.writerow(['file', 'timestamp', 'status'])
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, timestamp, pdf_bytes, error in reports:
+            if error is None:
+                info = zipfile.ZipInfo(name, date_time=_date_time(timestamp))
+                archive.writestr(info, pdf_bytes)
+                yield sink.drain()
+            writer.writerow([name, timestamp, 'ok' if error is None else f'failed: {error}'])
+        archive.writestr(zipfile.ZipInfo('index.csv', date_time=datetime.now().timetuple()[:6]),
+                         index.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+    yield sink.drain()
@@ -0,0 +1,216 @@
+"""
+Background PDF rendering
+Reports are drawn in a small process pool (FPDF is pure Python and holds the
+GIL for the whole render), so a web thread only queues a job and returns.
+Finished PDFs go into the report cache under the job's content key, which is
+also the job id: any worker process can serve the download once it is done.
+Admission control caps the jobs in flight, in total and per user, so a burst
+of downloads is turned away with a retry hint instead of tying up the server.
+"""
+
+import multiprocessing
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from reports import render_report_pdf
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ReportJob:
+    """One render: who asked for it, its content key (the job id) and how it went"""
+
+    def __init__(self, job_id, owner, filename):
+        self.id = job_id
+        self.owners = {owner}
+        self.filename = filename
+        self.created_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self.future = None
+        self.finished = threading.Event()
+
+    @property
+    def status(self):
+        if self.finished.is_set():
+            return FAILED if self.error else DONE
+        if self.future is not None and self.future.running():
+            return RUNNING
+        return QUEUED
+
+    def to_dict(self):
+        return {'job_id': self.id, 'status': self.status, 'error': self.error, 'filename': self.filename,
+                'created_at': self.created_at, 'finished_at': self.finished_at}
+
+
+class ReportJobs:
+    """
+    Render queue over a process pool.
+
+    submit() returns (job, None), or (None, reason) when admission control
+    turns the request away: max_pending jobs already queued or running, or
+    max_per_user of them for this user.  Identical requests share one job
+    while it runs, and a report that is already cached completes at once
+    without queueing.
+    Finished jobs are remembered for keep_seconds.
+    """
+
+    def __init__(self, cache, workers=2, max_pending=8, max_per_user=2, keep_seconds=600):
+        self.cache = cache
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self.keep_seconds = keep_seconds
+        self._jobs = {}   # job id -> ReportJob
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stats = {'submitted': 0, 'cached': 0, 'shared': 0, 'rejected': 0, 'done': 0, 'failed': 0,
+                       'total_render_ms': 0.0, 'bulk_rendered': 0, 'bulk_cached': 0, 'bulk_failed': 0}
+
+    def _new_executor(self):
+        # fork keeps the workers light (the app is not re-imported) and is done
+        # from start(), before the app's background threads exist
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        return ThreadPoolExecutor(self.workers, thread_name_prefix='report')
+
+    def start(self):
+        """Start the pool and its worker processes (call before starting other threads)"""
+        self._executor = self._new_executor()
+        for future in [self._executor.submit(int) for _ in range(self.workers)]:
+            future.result()
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _prune(self, now):
+        """Forget finished jobs older than keep_seconds (caller holds the lock)"""
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.keep_seconds]:
+            del self._jobs[job_id]
+
+    def submit(self, owner, job_id, filename, *args, **kwargs):
+        """Queue render_report_pdf(*args, **kwargs) as job `job_id` (its content key)"""
+        with self._lock:
+            now = time.time()
+            self._prune(now)
+            job = self._jobs.get(job_id)
+            if job is not None and not job.finished.is_set():
+                job.owners.add(owner)
+                self._stats['shared'] += 1
+                return job, None
+            job = ReportJob(job_id, owner, filename)
+            if self.cache.get(job_id) != (None, None):
+                job.finished_at = now
+                job.finished.set()
+                self._jobs[job_id] = job
+                self._stats['cached'] += 1
+                return job, None
+            active = [job for job in self._jobs.values() if not job.finished.is_set()]
+            if len(active) >= self.max_pending:
+                self._stats['rejected'] += 1
+                return None, f"The report queue is full ({self.max_pending} reports in progress)"
+            if sum(owner in job.owners for job in active) >= self.max_per_user:
+                self._stats['rejected'] += 1
+                return None, f"You already have {self.max_per_user} reports in progress"
+            self._jobs[job_id] = job
+            self._stats['submitted'] += 1
+        started = time.perf_counter()
+        job.future = self._render(args, kwargs)
+        job.future.add_done_callback(lambda future: self._finished(job, future, started))
+        return job, None
+
+    def _render(self, args, kwargs):
+        try:
+            return self._executor.submit(render_report_pdf, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory): replace the pool and try once more
+            self._executor = self._new_executor()
+            return self._executor.submit(render_report_pdf, *args, **kwargs)
+
+    def _finished(self, job, future, started):
+        try:
+            self.cache.put(job.id, future.result())
+        except (Exception, CancelledError) as e:
+            job.error = f"{type(e).__name__}: {e}"
+            print(f"❌ Report {job.id[:12]} failed: {job.error}")
+            if not isinstance(e, BrokenProcessPool):
+                traceback.print_exc()
+        with self._lock:
+            job.finished_at = time.time()
+            self._stats['failed' if job.error else 'done'] += 1
+            self._stats['total_render_ms'] = round(
+                self._stats['total_render_ms'] + (time.perf_counter() - started) * 1000, 3)
+        job.finished.set()
+
+    def _cached_bytes(self, key):
+        data, path = self.cache.get(key)
+        if path is not None:
+            try:
+                with open(path, 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None  # evicted meanwhile: render it again
+        return data
+
+    def render_each(self, items, window=None):
+        """
+        Bulk rendering for exports: `items` yields (tag, key, args, kwargs) and
+        this yields (tag, pdf_bytes, error) in the order the reports finish.
+        Cached reports are read from the cache; at most `window` renders
+        (default: one per worker) are in the pool at a time, so memory stays
+        bounded and interactive jobs queue behind one round of them at most.
+        Admission control does not apply: callers limit concurrent exports.
+        """
+        window = window or self.workers
+        items = iter(items)
+        pending = {}   # future -> (tag, key)
+        try:
+            while True:
+                for tag, key, args, kwargs in items:
+                    data = self._cached_bytes(key)
+                    if data is not None:
+                        with self._lock:
+                            self._stats['bulk_cached'] += 1
+                        yield tag, data, None
+                        continue
+                    pending[self._render(args, kwargs)] = (tag, key)
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tag, key = pending.pop(future)
+                    try:
+                        data = future.result()
+                    except (Exception, CancelledError) as e:
+                        with self._lock:
+                            self._stats['bulk_failed'] += 1
+                        yield tag, None, f"{type(e).__name__}: {e}"
+                        continue
+                    self.cache.put(key, data)
+                    with self._lock:
+                        self._stats['bulk_rendered'] += 1
+                    yield tag, data, None
+        finally:
+            for future in pending:  # the download was abandoned
+                future.cancel()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            active = [job for job in self._jobs.values() if not job.finished.is_set()]
+            return dict(self._stats, workers=self.workers, max_pending=self.max_pending,
+                        max_per_user=self.max_per_user, in_progress=len(active),
+                        running=sum(job.status == RUNNING for job in active))
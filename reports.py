@@ -0,0 +1,351 @@
+"""
+PDF reports
+The stroke risk report (and the doctor-only variant) drawn with FPDF.  Cached
+reports are keyed on a hash of this module and sanitizer.py (see
+REPORT_TEMPLATE_VERSION in app.py), so any change to either invalidates them.
+"""
+
+from datetime import datetime
+
+from fpdf import FPDF
+
+from sanitizer import remove_emojis
+
+
+def generate_report_pdf(input_data, results, food_recommendations=None, doctor_recommendations=None, skip_predictions=False,
+                        generated_at=None):
+    """Generate a professional PDF report for stroke risk prediction results.
+    Set skip_predictions=True when generating doctor-only reports (no ML model output).
+    generated_at is the date printed in the header (default: now).
+    """
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=25)
+
+    # ==================== HEADER ====================
+    pdf.set_font('Times', 'B', 24)
+    pdf.set_text_color(25, 25, 112)  # Midnight Blue
+    title = 'DOCTOR RECOMMENDATIONS REPORT' if skip_predictions else 'STROKE RISK PREDICTION REPORT'
+    pdf.cell(0, 15, title, ln=True, align='C')
+    
+    pdf.set_font('Times', 'I', 11)
+    pdf.set_text_color(80, 80, 80)
+    pdf.cell(0, 7, 'Generated on: ' + (generated_at or datetime.now()).strftime('%B %d, %Y at %I:%M %p'), ln=True, align='C')
+    pdf.set_font('Times', 'B', 10)
+    pdf.cell(0, 6, 'StrokeGuard AI Medical Analysis System', ln=True, align='C')
+    pdf.ln(6)
+
+    # Header separator line
+    pdf.set_draw_color(25, 25, 112)
+    pdf.set_line_width(1.0)
+    pdf.line(20, pdf.get_y(), 190, pdf.get_y())
+    pdf.ln(10)
+
+    # ==================== PATIENT INFORMATION ====================
+    pdf.set_font('Times', 'B', 16)
+    pdf.set_text_color(25, 25, 112)
+    pdf.cell(0, 10, 'PATIENT INFORMATION', ln=True)
+    pdf.set_draw_color(70, 130, 180)
+    pdf.set_line_width(0.5)
+    pdf.line(20, pdf.get_y(), 120, pdf.get_y())
+    pdf.ln(6)
+
+    # Patient data in a clean table format
+    pdf.set_font('Times', '', 11)
+    pdf.set_text_color(40, 40, 40)
+    
+    patient_fields = [
+        ('Age', str(input_data.get('age', 'N/A')) + ' years'),
+        ('Gender', str(input_data.get('gender', 'N/A'))),
+        ('Marital Status', str(input_data.get('ever_married', 'N/A'))),
+        ('Residence', str(input_data.get('residence_type', 'N/A'))),
+        ('Work Type', str(input_data.get('work_type', 'N/A')).replace('_', ' ').title()),
+        ('Smoking Status', str(input_data.get('smoking_status', 'N/A')).title()),
+    ]
+
+    for label, value in patient_fields:
+        pdf.set_font('Times', 'B', 11)
+        pdf.cell(70, 8, '    ' + label + ':', 0, 0)
+        pdf.set_font('Times', '', 11)
+        pdf.cell(0, 8, value, ln=True)
+    
+    pdf.ln(4)
+
+    # ==================== CLINICAL PARAMETERS ====================
+    pdf.set_font('Times', 'B', 16)
+    pdf.set_text_color(25, 25, 112)
+    pdf.cell(0, 10, 'CLINICAL PARAMETERS', ln=True)
+    pdf.set_draw_color(70, 130, 180)
+    pdf.line(20, pdf.get_y(), 120, pdf.get_y())
+    pdf.ln(6)
+
+    pdf.set_font('Times', '', 11)
+    pdf.set_text_color(40, 40, 40)
+    
+    clinical_fields = [
+        ('Hypertension', 'Yes' if str(input_data.get('hypertension', '0')) == '1' else 'No'),
+        ('Heart Disease', 'Yes' if str(input_data.get('heart_disease', '0')) == '1' else 'No'),
+        ('Average Glucose Level', str(input_data.get('avg_glucose_level', 'N/A')) + ' mg/dL'),
+        ('Body Mass Index (BMI)', str(input_data.get('bmi', 'N/A'))),
+    ]
+
+    for label, value in clinical_fields:
+        pdf.set_font('Times', 'B', 11)
+        pdf.cell(70, 8, '    ' + label + ':', 0, 0)
+        pdf.set_font('Times', '', 11)
+        pdf.cell(0, 8, value, ln=True)
+    
+    pdf.ln(8)
+
+    # ========== PREDICTION RESULTS (ML models — omitted for doctor-only reports) ==========
+    if not skip_predictions:
+        pdf.set_font('Times', 'B', 16)
+        pdf.set_text_color(25, 25, 112)
+        pdf.cell(0, 10, 'PREDICTION RESULTS', ln=True)
+        pdf.set_draw_color(70, 130, 180)
+        pdf.line(20, pdf.get_y(), 120, pdf.get_y())
+        pdf.ln(6)
+
+        model_a = results.get('model_A', {})
+        model_b = results.get('model_B', {})
+        ensemble = results.get('ensemble', {})
+
+        # Model A Results
+        pdf.set_font('Times', 'B', 13)
+        pdf.set_text_color(40, 40, 40)
+        pdf.cell(0, 8, 'Model A (Original Dataset)', ln=True)
+        pdf.set_font('Times', '', 11)
+        pdf.cell(70, 7, '        Stroke Probability:', 0, 0)
+        pdf.set_font('Times', 'B', 11)
+        pdf.cell(0, 7, str(model_a.get('probability', 'N/A')) + '%', ln=True)
+        pdf.set_font('Times', '', 11)
+        pdf.cell(70, 7, '        Risk Classification:', 0, 0)
+        pdf.set_font('Times', 'B', 11)
+        pdf.cell(0, 7, str(model_a.get('risk_level', 'N/A')), ln=True)
+        pdf.ln(4)
+
+        # Model B Results
+        pdf.set_font('Times', 'B', 13)
+        pdf.set_text_color(40, 40, 40)
+        pdf.cell(0, 8, 'Model B (Synthetic-Enhanced Dataset)', ln=True)
+        pdf.set_font('Times', '', 11)
+        pdf.cell(70, 7, '        Stroke Probability:', 0, 0)
+        pdf.set_font('Times', 'B', 11)
+        pdf.cell(0, 7, str(model_b.get('probability', 'N/A')) + '%', ln=True)
+        pdf.set_font('Times', '', 11)
+        pdf.cell(70, 7, '        Risk Classification:', 0, 0)
+        pdf.set_font('Times', 'B', 11)
+        pdf.cell(0, 7, str(model_b.get('risk_level', 'N/A')), ln=True)
+        pdf.ln(6)
+
+        # Ensemble (Combined) Results - HIGHLIGHTED
+        pdf.set_fill_color(230, 240, 250)
+        pdf.set_draw_color(70, 130, 180)
+        pdf.set_line_width(0.3)
+        pdf.rect(18, pdf.get_y(), 174, 28, 'D')
+        
+        pdf.set_font('Times', 'B', 14)
+        pdf.set_text_color(25, 25, 112)
+        pdf.cell(0, 10, 'COMBINED ENSEMBLE PREDICTION', ln=True)
+        
+        pdf.set_font('Times', '', 11)
+        pdf.set_text_color(40, 40, 40)
+        pdf.cell(70, 7, '        Overall Probability:', 0, 0)
+        pdf.set_font('Times', 'B', 12)
+        pdf.cell(0, 7, str(ensemble.get('probability', 'N/A')) + '%', ln=True)
+        
+        pdf.set_font('Times', '', 11)
+        pdf.cell(70, 7, '        Final Risk Level:', 0, 0)
+        
+        risk_level = str(ensemble.get('risk_level', 'N/A'))
+        pdf.set_font('Times', 'B', 13)
+        if risk_level == 'HIGH':
+            pdf.set_text_color(178, 34, 34)  # Firebrick red
+        elif risk_level == 'MEDIUM':
+            pdf.set_text_color(218, 165, 32)  # Goldenrod
+        else:
+            pdf.set_text_color(34, 139, 34)  # Forest green
+        pdf.cell(0, 7, risk_level, ln=True)
+        pdf.set_text_color(40, 40, 40)
+        pdf.ln(10)
+
+    # ==================== DIETARY RECOMMENDATIONS ====================
+    if food_recommendations:
+        pdf.set_font('Times', 'B', 16)
+        pdf.set_text_color(25, 25, 112)
+        pdf.cell(0, 10, 'DIETARY RECOMMENDATIONS', ln=True)
+        pdf.set_draw_color(70, 130, 180)
+        pdf.line(20, pdf.get_y(), 120, pdf.get_y())
+        pdf.ln(6)
+
+        # Urgent message if any
+        urgent_msg = food_recommendations.get('urgent_message', '')
+        if urgent_msg:
+            urgent_clean = remove_emojis(urgent_msg)
+            pdf.set_fill_color(255, 245, 245)
+            pdf.set_font('Times', 'B', 11)
+            pdf.set_text_color(178, 34, 34)
+            pdf.multi_cell(0, 7, 'ALERT: ' + urgent_clean, 0, 'L', True)
+            pdf.set_text_color(40, 40, 40)
+            pdf.ln(4)
+
+        # Recommended Foods
+        foods_to_eat = food_recommendations.get('foods_to_eat', [])
+        if foods_to_eat:
+            pdf.set_font('Times', 'B', 13)
+            pdf.set_text_color(34, 139, 34)
+            pdf.cell(0, 9, 'Foods to Include in Your Diet:', ln=True)
+            pdf.set_font('Times', '', 11)
+            pdf.set_text_color(40, 40, 40)
+            
+            for food in foods_to_eat[:12]:  # Limit to 12 items
+                clean_food = remove_emojis(str(food))
+                if clean_food:  # Only add if there's text after removing emojis
+                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
+            pdf.ln(4)
+
+        # Foods to Avoid
+        foods_to_avoid = food_recommendations.get('foods_to_avoid', [])
+        if foods_to_avoid:
+            pdf.set_font('Times', 'B', 13)
+            pdf.set_text_color(178, 34, 34)
+            pdf.cell(0, 9, 'Foods to Limit or Avoid:', ln=True)
+            pdf.set_font('Times', '', 11)
+            pdf.set_text_color(40, 40, 40)
+            
+            for food in foods_to_avoid[:10]:  # Limit to 10 items
+                clean_food = remove_emojis(str(food))
+                if clean_food:
+                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
+            pdf.ln(4)
+
+        # General Health Advice
+        advice_list = food_recommendations.get('general_advice', [])
+        if advice_list:
+            pdf.set_font('Times', 'B', 13)
+            pdf.set_text_color(25, 25, 112)
+            pdf.cell(0, 9, 'General Health Advice:', ln=True)
+            pdf.set_font('Times', '', 11)
+            pdf.set_text_color(40, 40, 40)
+            
+            for advice in advice_list:
+                clean_advice = remove_emojis(str(advice))
+                if clean_advice:
+                    pdf.multi_cell(0, 6, '      * ' + clean_advice)
+            pdf.ln(2)
+
+    # ==================== DOCTOR RECOMMENDATIONS ====================
+    if doctor_recommendations:
+        pdf.add_page()  # Add new page for doctor recommendations
+        
+        pdf.set_font('Times', 'B', 16)
+        pdf.set_text_color(25, 25, 112)
+        pdf.cell(0, 10, 'DOCTOR RECOMMENDATIONS', ln=True)
+        pdf.set_draw_color(70, 130, 180)
+        pdf.line(20, pdf.get_y(), 130, pdf.get_y())
+        pdf.ln(6)
+
+        # Risk Category
+        pdf.set_font('Times', 'B', 14)
+        risk_category = doctor_recommendations.get('risk_category', 'N/A')
+        risk_level_doc = doctor_recommendations.get('risk_level', 'LOW')
+        
+        if risk_level_doc == 'HIGH':
+            pdf.set_text_color(178, 34, 34)
+        elif risk_level_doc == 'MEDIUM':
+            pdf.set_text_color(218, 165, 32)
+        else:
+            pdf.set_text_color(34, 139, 34)
+        
+        pdf.cell(0, 10, 'Risk Assessment: ' + risk_category, ln=True)
+        pdf.set_text_color(40, 40, 40)
+        pdf.ln(4)
+
+        # Medical Advice
+        medical_advice = doctor_recommendations.get('medical_advice', [])
+        if medical_advice:
+            pdf.set_font('Times', 'B', 13)
+            pdf.set_text_color(25, 25, 112)
+            pdf.cell(0, 9, 'Medical Advice:', ln=True)
+            pdf.set_font('Times', '', 11)
+            pdf.set_text_color(40, 40, 40)
+            
+            for advice in medical_advice[:10]:
+                clean_advice = remove_emojis(str(advice))
+                if clean_advice:
+                    pdf.multi_cell(0, 6, '      * ' + clean_advice)
+            pdf.ln(4)
+
+        # Indian Foods to Include
+        indian_foods_eat = doctor_recommendations.get('indian_foods_to_eat', [])
+        if indian_foods_eat:
+            pdf.set_font('Times', 'B', 13)
+            pdf.set_text_color(34, 139, 34)
+            pdf.cell(0, 9, 'Indian Foods to Include:', ln=True)
+            pdf.set_font('Times', '', 11)
+            pdf.set_text_color(40, 40, 40)
+            
+            for food in indian_foods_eat[:12]:
+                clean_food = remove_emojis(str(food))
+                if clean_food:
+                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
+            pdf.ln(4)
+
+        # Indian Foods to Avoid
+        indian_foods_avoid = doctor_recommendations.get('indian_foods_to_avoid', [])
+        if indian_foods_avoid:
+            pdf.set_font('Times', 'B', 13)
+            pdf.set_text_color(178, 34, 34)
+            pdf.cell(0, 9, 'Indian Foods to Avoid:', ln=True)
+            pdf.set_font('Times', '', 11)
+            pdf.set_text_color(40, 40, 40)
+            
+            for food in indian_foods_avoid[:12]:
+                clean_food = remove_emojis(str(food))
+                if clean_food:
+                    pdf.cell(0, 6, '      * ' + clean_food, ln=True)
+            pdf.ln(4)
+
+        # Lifestyle Changes
+        lifestyle = doctor_recommendations.get('lifestyle_changes', [])
+        if lifestyle:
+            pdf.set_font('Times', 'B', 13)
+            pdf.set_text_color(25, 25, 112)
+            pdf.cell(0, 9, 'Recommended Lifestyle Changes:', ln=True)
+            pdf.set_font('Times', '', 11)
+            pdf.set_text_color(40, 40, 40)
+            
+            for change in lifestyle[:10]:
+                clean_change = remove_emojis(str(change))
+                if clean_change:
+                    pdf.multi_cell(0, 6, '      * ' + clean_change)
+            pdf.ln(2)
+
+    # ==================== FOOTER ====================
+    pdf.ln(8)
+    pdf.set_draw_color(25, 25, 112)
+    pdf.set_line_width(0.8)
+    pdf.line(20, pdf.get_y(), 190, pdf.get_y())
+    pdf.ln(5)
+    
+    pdf.set_font('Times', 'BI', 10)
+    pdf.set_text_color(100, 100, 100)
+    pdf.multi_cell(0, 5, 'DISCLAIMER: This report is generated by an AI-based prediction system and is intended for informational purposes only. It should NOT be used as a substitute for professional medical advice, diagnosis, or treatment. Always seek the advice of your physician or other qualified health provider with any questions you may have regarding a medical condition.', 0, 'C')
+    
+    pdf.ln(2)
+    pdf.set_font('Times', 'I', 9)
+    pdf.cell(0, 5, 'StrokeGuard AI (c) 2024 - Advanced Medical Analytics', ln=True, align='C')
+
+    return pdf
+
+
+def render_report_pdf(input_data, results, food_recommendations=None, doctor_recommendations=None,
+                      skip_predictions=False, generated_at=None):
+    """generate_report_pdf() as PDF bytes (picklable entry point for the report worker pool)"""
+    pdf = generate_report_pdf(input_data, results, food_recommendations, doctor_recommendations,
+                              skip_predictions=skip_predictions, generated_at=generated_at)
+    pdf_output = pdf.output(dest='S')
+    # fpdf 1.7 returns a latin-1 str, newer versions bytes
+    if isinstance(pdf_output, str):
+        return pdf_output.encode('latin-1')
+    return bytes(pdf_output)
@@ -0,0 +1,42 @@
+"""
+Standalone scheduler process
+Runs the medication reminders, the periodic jobs and the email outbox without
+serving HTTP, so the web workers can leave them alone:
+
+    RUN_SCHEDULER=0 WEB_THREADS=8 gunicorn -w 4 -k gthread --threads 8 app:app
+    python run_scheduler.py
+
+Medication pages hold a request thread per open alert stream, so give the
+web workers threads (and tell the app how many with WEB_THREADS): each one
+keeps half of them for streams and the rest for requests.  With sync workers
+(WEB_THREADS=1, the default) no streams are opened and the pages poll.
+
+It takes part in the same lease election as the app (see leader.py), so a
+second copy can be kept running as a standby that takes over if the first dies.
+"""
+
+import os
+import signal
+import threading
+
+os.environ['RUN_SCHEDULER'] = '1'
+
+import services  # storage, outbox and reminders, without the web app's models, caches and report pool
+
+
+def main():
+    services.start()  # starts the outbox and joins the scheduler election
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    print("\n⏰ Standalone scheduler running (Ctrl+C to stop)")
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    print("\n⏰ Standalone scheduler stopping")
+    # atexit hands the lease over and stops the reminder engine and the outbox
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""
+Text clean-up for the PDF reports
+FPDF's core fonts only cover Latin-1 and the reports have always been plain
+ASCII: emojis and every other non-ASCII character are dropped and whitespace
+runs collapse to single spaces.  Nearly every string comes from the fixed
+recommendation tables, so results are memoized.
+"""
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def remove_emojis(text):
+    """Remove emojis and non-latin characters from text for PDF compatibility"""
+    if not text.isascii():
+        # Every emoji range is outside ASCII, so one encode pass removes them too
+        text = text.encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(text.split())
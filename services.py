@@ -0,0 +1,275 @@
+"""
+Storage, email outbox, medication reminders and the scheduler lease
+Shared by the web app (app.py) and the standalone scheduler (run_scheduler.py),
+so the scheduler gets the background jobs without the web app's models,
+caches, report pool and alert streams.  Importing this module starts nothing:
+call start() once the process is ready for background threads.
+"""
+
+import atexit
+import os
+from datetime import datetime
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from dotenv import load_dotenv
+
+from email_templates import (LOGIN_ALERT, MEDICATION_REMINDER, OVERDUE_REMINDER, DIGEST, OVERDUE_DIGEST,
+                             DIGEST_ITEM, OVERDUE_DIGEST_ITEM, wrap_in_layout)
+from leader import LeaderLease
+from outbox import Outbox
+from reminders import IMMEDIATE, ReminderEngine, slot_minutes
+from storage import get_storage
+
+# Load environment variables
+load_dotenv()
+
+# Email configuration from environment variables
+EMAIL_CONFIG = {
+    'sender': os.getenv('EMAIL_SENDER', '').strip(),
+    'password': os.getenv('EMAIL_PASSWORD', '').strip(),
+    'smtp_server': os.getenv('SMTP_SERVER', 'smtp.gmail.com').strip(),
+    'smtp_port': int(os.getenv('SMTP_PORT', '587')),
+    # SMTP_STARTTLS=0 (and no password) talks to a local debugging server such as aiosmtpd
+    'starttls': os.getenv('SMTP_STARTTLS', '1').strip() != '0'
+}
+
+print("\nEmail Config loaded:")
+print(f"  Sender: {'✓ Present' if EMAIL_CONFIG['sender'] else '✗ Missing'}")
+print(f"  SMTP Server: {EMAIL_CONFIG['smtp_server']}:{EMAIL_CONFIG['smtp_port']}")
+
+# Data storage: 'json' (data/*.json files), 'jsonl' (append-only results log)
+# or 'sqlite' (see `python storage.py migrate`)
+DATA_PATH = 'data'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').strip().lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(DATA_PATH, 'stroke_app.db'))
+
+storage = get_storage(STORAGE_BACKEND, DATA_PATH, SQLITE_PATH)
+print(f"\nStorage backend: {STORAGE_BACKEND}")
+
+# Outgoing email is queued on disk and sent by background workers over pooled SMTP connections
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.join(DATA_PATH, 'outbox.db'))
+outbox = Outbox(OUTBOX_PATH, EMAIL_CONFIG, workers=int(os.getenv('OUTBOX_WORKERS', '2')),
+                max_attempts=int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8')))
+
+# Reminders due together go out as one digest email unless a user chooses 'individual'
+REMINDER_MODES = ('digest', 'individual')
+REMINDER_DEFAULT_MODE = os.getenv('REMINDER_DEFAULT_MODE', 'digest').strip()
+if REMINDER_DEFAULT_MODE not in REMINDER_MODES:
+    REMINDER_DEFAULT_MODE = 'digest'
+
+# Email notification functions
+def email_configured():
+    if not EMAIL_CONFIG['sender'] or (not EMAIL_CONFIG['password'] and EMAIL_CONFIG['starttls']):
+        print("⚠️ Email not configured. Skipping email notification.")
+        print(f"   Sender: {EMAIL_CONFIG['sender']}")
+        print(f"   Password: {'***' if EMAIL_CONFIG['password'] else 'Not set'}")
+        return False
+    return True
+
+def queue_emails(messages):
+    """Queue [(recipient, subject, text_body, html_body)] for the outbox workers in one write"""
+    try:
+        if not email_configured():
+            return False
+        for (recipient, subject, _, _), message_id in zip(messages, outbox.enqueue_many(messages)):
+            print(f"📧 Queued email #{message_id} to {recipient}: {subject}")
+        return True
+    
+    except Exception as e:
+        print(f"❌ Failed to queue email to {', '.join(message[0] for message in messages)}: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def send_email(recipient_email, subject, body):
+    """Queue an email notification with a free-form HTML body"""
+    return queue_emails([(recipient_email, subject, body, wrap_in_layout(body))])
+
+def send_login_notification(user_email, user_name):
+    """Send email when user logs in"""
+    return queue_emails([(user_email,) + LOGIN_ALERT.render(
+        user_name=user_name,
+        login_time=datetime.now().strftime('%B %d, %Y at %I:%M %p'),
+        user_email=user_email
+    )])
+
+def send_medication_reminder(user_email, user_name, medication_name, time_slot):
+    """Send medication reminder email"""
+    return queue_emails([(user_email,) + MEDICATION_REMINDER.render(
+        user_name=user_name,
+        medication_name=medication_name,
+        slot_label=time_slot.capitalize(),
+        current_time=datetime.now().strftime('%I:%M %p')
+    )])
+
+def record_medication_alerts(alerts):
+    """
+    Persist the alerts of one reminder pass in a single write.
+    [(username, med_id, slot_name, last_alert_sent, alert_count)] are applied to the
+    file as re-read under the lock, so doses marked taken meanwhile stay taken.
+    """
+    with storage.transaction('medications') as medications:
+        for username, med_id, slot_name, sent_at, alert_count in alerts:
+            for med in medications.get(username, []):
+                if med.get('id') == med_id:
+                    for slot in med.get('schedule', []):
+                        if slot.get('slot') == slot_name:
+                            slot['last_alert_sent'] = sent_at
+                            slot['alert_count'] = alert_count
+                            break
+                    break
+
+def reminder_mode(username, users=None):
+    """'digest' or 'individual': how a user's reminders are delivered when several are due at once"""
+    if users is None:
+        users = storage.read_users()
+    return users.get(username, {}).get('reminder_mode', REMINDER_DEFAULT_MODE)
+
+def send_medication_alerts(alerts, now):
+    """
+    Queue the reminders of one pass, [(username, med, slot, stage)], rendering
+    each template once for all its recipients; returns which ones were queued.
+    A user in digest mode with more than one reminder due gets them all in a
+    single email, which succeeds or fails for all of them together.
+    """
+    if not scheduler_lease.held():
+        # The lease may already belong to another process: leave these to it
+        print(f"   ⚠️ Scheduler lease lost, not sending {len(alerts)} reminder(s)")
+        return [False] * len(alerts)
+    
+    users = storage.read_users()
+    queued = []
+    by_user = {}  # username -> [(position, stage, fields)]
+    current_time = now.strftime('%I:%M %p')
+    for username, med, slot, stage in alerts:
+        queued.append(False)
+        if username not in users:
+            print(f"   ⚠️ User {username} not found in users.json")
+            continue
+        
+        user = users[username]
+        user_email = user.get('email')
+        user_name = user.get('name', username)
+        
+        if not user_email:
+            print(f"   ⚠️ No email for user {username}")
+            continue
+        
+        medication_name = med.get('tablet_name', 'Medication')
+        slot_time = slot.get('time', '')
+        slot_name = slot.get('slot', 'unknown')
+        time_diff = (now.hour * 60 + now.minute) - slot_minutes(slot_time)
+        print(f"      💊 {medication_name} ({slot_name}) for {user_name} - Scheduled: {slot_time}, Time diff: {time_diff} min")
+        
+        fields = {'user_name': user_name, 'medication_name': medication_name, 'slot_label': slot_name.capitalize()}
+        if stage == IMMEDIATE:
+            # Immediate alert when overdue (0-15 minutes after scheduled time)
+            fields['current_time'] = current_time
+        else:
+            # 2-hour overdue alert (120+ minutes late)
+            fields.update(slot_time=slot_time, overdue_hours=time_diff // 60, overdue_minutes=time_diff % 60)
+        by_user.setdefault(username, []).append((len(queued) - 1, stage, fields))
+    
+    batches = {MEDICATION_REMINDER: [], OVERDUE_REMINDER: []}  # template -> [(positions, email, fields)]
+    digests = []  # (positions, email, template, fields)
+    for username, entries in by_user.items():
+        user_email = users[username]['email']
+        if len(entries) > 1 and reminder_mode(username, users) == 'digest':
+            overdue = any(stage != IMMEDIATE for _, stage, _ in entries)
+            print(f"         📧 [DIGEST] Sending {len(entries)} reminders to {user_email} in one email")
+            items = ''.join((DIGEST_ITEM if stage == IMMEDIATE else OVERDUE_DIGEST_ITEM).render_body(fields)
+                            for _, stage, fields in entries)
+            digests.append(([position for position, _, _ in entries], user_email,
+                            OVERDUE_DIGEST if overdue else DIGEST,
+                            {'user_name': entries[0][2]['user_name'], 'count': len(entries),
+                             'current_time': current_time, 'items': items}))
+            continue
+        for position, stage, fields in entries:
+            if stage == IMMEDIATE:
+                print(f"         📧 [IMMEDIATE] Sending to {user_email}")
+                batches[MEDICATION_REMINDER].append(([position], user_email, fields))
+            else:
+                print(f"         📧 [2 HOURS OVERDUE] Sending urgent reminder to {user_email}")
+                batches[OVERDUE_REMINDER].append(([position], user_email, fields))
+    
+    positions, messages = [], []
+    for template, rows in batches.items():
+        rendered = template.render_batch([fields for _, _, fields in rows])
+        for (message_positions, user_email, _), message in zip(rows, rendered):
+            positions.extend(message_positions)
+            messages.append((user_email,) + message)
+    for message_positions, user_email, template, fields in digests:
+        positions.extend(message_positions)
+        messages.append((user_email,) + template.render(**fields))
+    if messages and queue_emails(messages):
+        for position in positions:
+            queued[position] = True
+    return queued
+
+def check_medication_reminders():
+    """Send every medication reminder that is due now; returns how many were sent"""
+    try:
+        return reminder_engine.run_due()
+    except Exception as e:
+        print(f"❌ Error checking medication reminders: {e}")
+        import traceback
+        traceback.print_exc()
+        return 0
+
+# Medication reminders: a heap of dose deadlines, checked only when one is due
+# (edits from other processes are picked up every REMINDER_SYNC_SECONDS)
+reminder_engine = ReminderEngine(storage.read_medications, send_medication_alerts, record_medication_alerts,
+                                 sync_seconds=int(os.getenv('REMINDER_SYNC_SECONDS', '60')))
+
+scheduler = BackgroundScheduler()
+
+# The append-only results log drops deleted users' lines in the background
+if hasattr(storage, 'compact'):
+    scheduler.add_job(
+        func=storage.compact,
+        trigger=IntervalTrigger(minutes=int(os.getenv('RESULTS_COMPACTION_MINUTES', '60'))),
+        id='results_log_compaction_job',
+        name='Compact results log',
+        replace_existing=True
+    )
+
+def start_background_jobs():
+    reminder_engine.start()
+    scheduler.resume()
+    print("\n⏰ Medication reminder scheduler started!")
+    print("   Waking up at each medication's next reminder time...")
+
+def stop_background_jobs():
+    scheduler.pause()
+    reminder_engine.stop()
+    print("\n⏰ Medication reminder scheduler stopped")
+
+# Only one process runs the reminders and periodic jobs: the holder of a lease
+# in SCHEDULER_LEASE_PATH, renewed every SCHEDULER_HEARTBEAT_SECONDS.  If it dies,
+# another process takes over once SCHEDULER_LEASE_SECONDS pass without a renewal.
+# RUN_SCHEDULER=0 keeps a process out of the election, e.g. web workers when
+# run_scheduler.py runs the jobs on its own.
+SCHEDULER_LEASE_PATH = os.getenv('SCHEDULER_LEASE_PATH', os.path.join(DATA_PATH, 'scheduler.db'))
+scheduler_lease = LeaderLease(SCHEDULER_LEASE_PATH, 'scheduler', start_background_jobs, stop_background_jobs,
+                              lease_seconds=int(os.getenv('SCHEDULER_LEASE_SECONDS', '30')),
+                              heartbeat_seconds=int(os.getenv('SCHEDULER_HEARTBEAT_SECONDS', '10')))
+
+
+def start():
+    """
+    Start the outbox workers and the (paused) job scheduler, and join the
+    scheduler election unless RUN_SCHEDULER=0
+    """
+    outbox.start()
+    atexit.register(outbox.stop)
+
+    # Jobs stay paused until this process holds the scheduler lease
+    scheduler.start(paused=True)
+    atexit.register(lambda: scheduler.shutdown())
+
+    if os.getenv('RUN_SCHEDULER', '1').strip() != '0':
+        scheduler_lease.start()
+        atexit.register(scheduler_lease.stop)
+    else:
+        print("\n⏰ Scheduler disabled in this process (RUN_SCHEDULER=0)")
@@ -0,0 +1,46 @@
+// PDF report downloads: queue the report on /api/reports, wait for it, then download it
+
+// Polls status_url rather than holding an events stream open, so waiting costs
+// the server one short request per second instead of a request thread
+async function waitForReport(job) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(job.status_url);
+        const status = await response.json();
+        if (!response.ok) throw new Error(status.error || 'Server error: ' + response.status);
+        if (status.status === 'done') return;
+        if (status.status === 'failed') throw new Error(status.error || 'The report could not be generated');
+    }
+}
+
+async function downloadReport(request, button) {
+    const originalText = button ? button.innerHTML : null;
+    if (button) {
+        button.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Generating PDF...';
+        button.disabled = true;
+    }
+    try {
+        const response = await fetch('/api/reports', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(request)
+        });
+        const job = await response.json();
+        if (!response.ok || !job.success) throw new Error(job.error || 'Server error: ' + response.status);
+        if (job.status !== 'done') await waitForReport(job);
+
+        const a = document.createElement('a');
+        a.href = job.download_url;
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+    } catch (err) {
+        console.error('PDF download error:', err);
+        alert('Failed to download PDF: ' + err.message);
+    } finally {
+        if (button) {
+            button.innerHTML = originalText;
+            button.disabled = false;
+        }
+    }
+}
@@ -0,0 +1,1120 @@
+"""
+Storage backends for users, prediction results and medication schedules
+JSONStorage keeps the original data/*.json files; JSONLResultsStorage moves
+results into an append-only log; SQLiteStorage keeps the same data in indexed
+tables so appending a prediction is a single INSERT.
+Every backend also keeps admin counters per user (predictions per risk level
+and a pointer to the latest one), updated with each write, and stores each
+distinct recommendation payload once, referenced from results by content hash.
+Usage: python storage.py migrate [--data data] [--db data/stroke_app.db]
+       python storage.py compact [--data data]
+       python storage.py rebuild-stats [--backend json] [--data data] [--db data/stroke_app.db]
+       python storage.py dedupe [--backend json] [--data data] [--db data/stroke_app.db]
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+
+class FrozenDict(dict):
+    """Read-only dict used for cached data (still a dict for json/jsonify and templates)"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Cached storage data is read-only; use load_*() or transaction() to modify it")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def freeze(value):
+    """Read-only deep copy of parsed JSON: dicts become FrozenDicts, lists become tuples"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Mutable deep copy of frozen (or plain) JSON data"""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def result_id(entry):
+    """
+    Stable id of a stored prediction.  Entries written before ids existed
+    use the digits of their timestamp, which never change either.
+    """
+    return entry.get('id') or re.sub(r'\D', '', entry.get('timestamp', ''))
+
+
+def with_result_id(entry):
+    """The entry itself if it has an id, else a copy (of the same type) that includes it"""
+    if 'id' in entry:
+        return entry
+    return type(entry)(entry, id=result_id(entry))
+
+
+def history_key(entry):
+    """Order of a result in a user's history: by timestamp, equal timestamps by id"""
+    return entry.get('timestamp', ''), result_id(entry)
+
+
+def history_cursor(key):
+    """`before` cursor that resumes a history right after (older than) the entry with this key"""
+    return '|'.join(key)
+
+
+def parse_history_cursor(before):
+    """
+    history_key() of a cursor.  A bare timestamp (cursors from before ids were
+    part of it) sorts ahead of every entry with that timestamp.
+    """
+    timestamp, _, entry_id = before.partition('|')
+    return timestamp, entry_id
+
+
+def history_page(keys, before, limit):
+    """
+    Slice bounds of a newest-first history page over ascending history keys:
+    entries older than the `before` cursor (all when None), at most `limit`
+    of them.  Returns (start, end, next_before).
+    """
+    end = bisect_left(keys, parse_history_cursor(before)) if before else len(keys)
+    start = max(0, end - limit) if limit else 0
+    return start, end, (history_cursor(keys[start]) if start > 0 else None)
+
+
+# Admin counter for each ensemble risk level
+RISK_COUNTERS = {'HIGH': 'high_risk', 'MEDIUM': 'medium_risk', 'LOW': 'low_risk'}
+
+
+def new_counters():
+    return {'total_predictions': 0, 'high_risk': 0, 'medium_risk': 0, 'low_risk': 0, 'latest_prediction': None}
+
+
+def latest_pointer(entry):
+    """What the counters remember about a user's latest prediction"""
+    ensemble = entry.get('results', {}).get('ensemble', {})
+    return {
+        'id': result_id(entry),
+        'timestamp': entry.get('timestamp', ''),
+        'risk_level': ensemble.get('risk_level'),
+        'probability': ensemble.get('probability')
+    }
+
+
+def count_result(counters, entry):
+    """Add one prediction to a set of counters"""
+    counters['total_predictions'] += 1
+    risk_counter = RISK_COUNTERS.get(entry.get('results', {}).get('ensemble', {}).get('risk_level'))
+    if risk_counter:
+        counters[risk_counter] += 1
+    latest = counters['latest_prediction']
+    if latest is None or entry.get('timestamp', '') >= latest['timestamp']:
+        counters['latest_prediction'] = latest_pointer(entry)
+
+
+def compute_stats(results):
+    """{'users': {username: counters}, 'totals': counters} computed from scratch"""
+    stats = {'users': {}, 'totals': new_counters()}
+    for username, entries in results.items():
+        for entry in entries:
+            add_result_to_stats(stats, username, entry)
+    return stats
+
+
+def add_result_to_stats(stats, username, entry):
+    count_result(stats['users'].setdefault(username, new_counters()), entry)
+    count_result(stats['totals'], entry)
+
+
+def remove_user_from_stats(stats, username):
+    """Subtract a deleted user's counters from the totals"""
+    counters = stats['users'].pop(username, None)
+    if counters is None:
+        return
+    totals = stats['totals']
+    for name in ('total_predictions', *RISK_COUNTERS.values()):
+        totals[name] -= counters[name]
+    if totals['latest_prediction'] == counters['latest_prediction']:
+        # The latest prediction overall was theirs: fall back to the newest remaining user's
+        pointers = [c['latest_prediction'] for c in stats['users'].values() if c['latest_prediction']]
+        totals['latest_prediction'] = max(pointers, key=lambda p: p['timestamp'], default=None)
+
+
+# Result fields holding recommendation payloads: a handful of rule-chosen lists that
+# repeat across predictions, so each distinct one is stored once in a shared table
+RECOMMENDATION_FIELDS = ('food_recommendations', 'doctor_recommendations', 'indian_food_recommendations')
+
+
+def payload_ref(payload):
+    """Content hash identifying a recommendation payload"""
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()[:16]
+
+
+def _is_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and '$ref' in value
+
+
+def compact_entry(entry, payloads):
+    """
+    Stored form of a result: recommendation payloads replaced by {'$ref': hash}.
+    The payloads are collected in `payloads` ({hash: payload}) for the shared table.
+    """
+    compact = None
+    for field in RECOMMENDATION_FIELDS:
+        value = entry.get(field)
+        if value is None or _is_ref(value):
+            continue
+        ref = payload_ref(value)
+        payloads.setdefault(ref, value)
+        if compact is None:
+            compact = dict(entry)
+        compact[field] = {'$ref': ref}
+    return entry if compact is None else compact
+
+
+def expand_entry(entry, lookup, mutable=False):
+    """
+    A stored result with its payload references resolved by lookup(hash).
+    Keys keep their order, so the result serializes exactly like the original.
+    Payloads are shared read-only objects unless `mutable` asks for copies.
+    """
+    fields = [field for field in RECOMMENDATION_FIELDS if _is_ref(entry.get(field))]
+    if not fields:
+        return entry
+    expanded = dict(entry)
+    for field in fields:
+        payload = lookup(entry[field]['$ref'])
+        expanded[field] = thaw(payload) if mutable else payload
+    return expanded if mutable else type(entry)(expanded)
+
+
+def remove_user_medications(medications, username):
+    """Drop a user's medications; True if they had any"""
+    return medications.pop(username, None) is not None
+
+
+class JSONStorage:
+    """
+    Whole-file JSON storage (one file per collection), safe across worker processes.
+
+    Writes go to a temp file that replaces the original with os.replace, under an
+    exclusive fcntl lock, so readers never see a half-written file.  Parsed files
+    are cached per process as frozen (read-only) copies, revalidated with os.fstat
+    and refreshed in place by this process's own writes.  read_* return the cached
+    copy, load_* a fresh mutable copy, and transaction() does a locked
+    read-modify-write.  Admin counters live in stats.json, which is rebuilt from
+    the results if it is missing; the results lock is always taken before its lock.
+    Recommendation payloads live in recommendations.json ({hash: payload}), which
+    only grows and is written before any result that references it.
+    """
+
+    def __init__(self, data_path):
+        self.data_path = data_path
+        self.users_file = os.path.join(data_path, 'users.json')
+        self.results_file = os.path.join(data_path, 'results.json')
+        self.medications_file = os.path.join(data_path, 'medications.json')
+        self.stats_file = os.path.join(data_path, 'stats.json')
+        self.recommendations_file = os.path.join(data_path, 'recommendations.json')
+        self._files = {
+            'users': self.users_file,
+            'results': self.results_file,
+            'medications': self.medications_file,
+            'recommendations': self.recommendations_file
+        }
+        self._cache = {}  # path -> ((inode, size, mtime), parsed data)
+        self._history = (None, {})  # (cached results object, {username: timeline})
+        self._expanded = (None, None)  # (cached results.json, same with payloads resolved)
+        self._payloads = {}  # hash -> read-only payload (content-addressed, never changes)
+
+        os.makedirs(data_path, exist_ok=True)
+        # Initialize users file as empty (all auth is Firebase-only)
+        for path in (self.users_file, self.results_file, self.medications_file, self.recommendations_file):
+            if not os.path.exists(path):
+                with self._file_lock(path):
+                    if not os.path.exists(path):
+                        self._write(path, {})
+
+    @contextmanager
+    def _file_lock(self, path, exclusive=True):
+        """Advisory lock on a sidecar file (the data file itself is replaced on every save)"""
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self, path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _signature(stat):
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _read(self, path):
+        """Parsed file contents, re-parsed only when the file changed (shared, read-only)"""
+        with open(path, 'r') as f:
+            signature = self._signature(os.fstat(f.fileno()))
+            cached = self._cache.get(path)
+            if cached and cached[0] == signature:
+                return cached[1]
+            data = freeze(json.load(f))
+        self._cache[path] = (signature, data)
+        return data
+
+    def _write(self, path, data):
+        """Write to a temp file in the same directory, then atomically replace the original"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps(data, indent=4))  # one write instead of one per token
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            signature = self._signature(os.stat(tmp_path))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # Write-through: the next read of this file reuses what was just written
+        self._cache[path] = (signature, freeze(data))
+
+    def _save(self, path, data):
+        with self._file_lock(path):
+            self._write(path, data)
+
+    @contextmanager
+    def transaction(self, collection):
+        """
+        Locked read-modify-write of one collection ('users', 'results' or 'medications'):
+            with storage.transaction('users') as users:
+                users[name]['role'] = 'admin'
+        The changes are saved when the block exits without an exception.
+        Results are seen as stored, with recommendation payloads as {'$ref': hash}.
+        """
+        if collection not in self._files:
+            raise ValueError(f"Unknown collection: {collection!r}")
+        path = self._files[collection]
+        with self._file_lock(path):
+            data = self._load(path)
+            yield data
+            self._write(path, data)
+
+    def load_users(self):
+        return self._load(self.users_file)
+
+    def read_users(self):
+        return self._read(self.users_file)
+
+    def save_users(self, users):
+        self._save(self.users_file, users)
+
+    def load_results(self):
+        return {username: [expand_entry(entry, self._payload, mutable=True) for entry in entries]
+                for username, entries in self._load(self.results_file).items()}
+
+    def read_results(self):
+        stored = self._read(self.results_file)
+        cached_stored, results = self._expanded
+        if cached_stored is not stored:
+            results = FrozenDict((username, tuple(expand_entry(entry, self._payload) for entry in entries))
+                                 for username, entries in stored.items())
+            self._expanded = (stored, results)
+        return results
+
+    def load_user_results(self, username):
+        """A user's results (read-only), oldest first"""
+        return self._timeline(username)[1]
+
+    def _timeline(self, username):
+        """
+        (history keys, entries, {id: entry}) of one user in history order, built
+        once per version of results.json and reused by every history request.
+        """
+        results = self.read_results()
+        cached_results, timelines = self._history
+        if cached_results is not results:
+            timelines = {}
+            self._history = (results, timelines)
+        if username not in timelines:
+            # Stored in timestamp order already; sorting (a near no-op pass) covers older files
+            entries = tuple(sorted(map(with_result_id, results.get(username, ())), key=history_key))
+            timelines[username] = (
+                [history_key(entry) for entry in entries],
+                entries,
+                {entry['id']: entry for entry in entries}
+            )
+        return timelines[username]
+
+    def user_history(self, username, before=None, limit=None):
+        """Newest-first page of a user's results past the `before` cursor; returns (entries, next_before)"""
+        keys, entries, _ = self._timeline(username)
+        start, end, next_before = history_page(keys, before, limit)
+        return list(reversed(entries[start:end])), next_before
+
+    def get_user_result(self, username, entry_id):
+        """One of a user's results by its stable id, or None"""
+        return self._timeline(username)[2].get(entry_id)
+
+    def save_results(self, results):
+        payloads = {}
+        stored = {username: [compact_entry(entry, payloads) for entry in entries]
+                  for username, entries in results.items()}
+        with self._file_lock(self.results_file), self._file_lock(self.stats_file):
+            self._intern_payloads(payloads)
+            self._write(self.results_file, stored)
+            self._write(self.stats_file, compute_stats(stored))
+
+    def load_medications(self):
+        return self._load(self.medications_file)
+
+    def read_medications(self):
+        return self._read(self.medications_file)
+
+    def save_medications(self, medications):
+        self._save(self.medications_file, medications)
+
+    def append_result(self, username, entry):
+        """Add one prediction to a user's history, keeping it in timestamp order"""
+        payloads = {}
+        entry = compact_entry(entry, payloads)
+        self._intern_payloads(payloads)
+        with self.transaction('results') as results:
+            user_results = results.setdefault(username, [])
+            timestamp = entry.get('timestamp', '')
+            if user_results and user_results[-1].get('timestamp', '') > timestamp:
+                # Another worker wrote a newer entry first
+                position = bisect_right([e.get('timestamp', '') for e in user_results], timestamp)
+                user_results.insert(position, entry)
+            else:
+                user_results.append(entry)
+            with self._stats_update() as stats:
+                add_result_to_stats(stats, username, entry)
+
+    def delete_user_data(self, username):
+        """Remove a user's results and medications; returns (had_results, had_medications)"""
+        with self.transaction('results') as results:
+            had_results = results.pop(username, None) is not None
+            with self._stats_update() as stats:
+                remove_user_from_stats(stats, username)
+        with self.transaction('medications') as medications:
+            had_medications = remove_user_medications(medications, username)
+        return had_results, had_medications
+
+    # Shared recommendation payloads
+    def _payload(self, ref):
+        payload = self._payloads.get(ref)
+        if payload is None:
+            # Added by another process since this one last read the table
+            self._payloads.update(self._read(self.recommendations_file))
+            payload = self._payloads.get(ref)
+            if payload is None:
+                raise ValueError(f"Stored result refers to recommendation payload {ref}, "
+                                 f"which is missing from {self.recommendations_file}")
+        return payload
+
+    def _intern_payloads(self, payloads):
+        """Add {hash: payload} entries missing from the shared table"""
+        missing = {ref: payload for ref, payload in payloads.items() if ref not in self._payloads}
+        if not missing:
+            return
+        with self.transaction('recommendations') as table:
+            for ref, payload in missing.items():
+                table.setdefault(ref, payload)
+        self._payloads.update(self._read(self.recommendations_file))
+
+    def dedupe_recommendations(self):
+        """Move the payloads of results stored before deduplication into the shared table"""
+        payloads = {}
+        changed = 0
+        with self._file_lock(self.results_file):
+            stored = self._load(self.results_file)
+            for username, entries in stored.items():
+                stored[username] = [compact_entry(entry, payloads) for entry in entries]
+                changed += sum(a is not b for a, b in zip(entries, stored[username]))
+            if changed:
+                self._intern_payloads(payloads)
+                self._write(self.results_file, stored)
+        return changed
+
+    # Admin counters
+    @contextmanager
+    def _stats_update(self):
+        """Locked read-modify-write of stats.json (computed from the stored results if missing)"""
+        with self._file_lock(self.stats_file):
+            if os.path.exists(self.stats_file):
+                stats = self._load(self.stats_file)
+            else:
+                stats = compute_stats(self.load_results())
+            yield stats
+            self._write(self.stats_file, stats)
+
+    def read_stats(self):
+        """Admin counters (read-only): {'users': {username: counters}, 'totals': counters}"""
+        if not os.path.exists(self.stats_file):
+            return self.rebuild_stats()
+        return self._read(self.stats_file)
+
+    def rebuild_stats(self):
+        """Recompute the admin counters from every stored result"""
+        with self._file_lock(self.results_file), self._file_lock(self.stats_file):
+            stats = compute_stats(self.load_results())
+            self._write(self.stats_file, stats)
+        return self._read(self.stats_file)
+
+
+class JSONLResultsStorage(JSONStorage):
+    """
+    JSON storage whose prediction results live in an append-only JSON Lines log
+    (data/results.jsonl) instead of results.json.
+
+    The first line is a {"generation": ...} header that changes on every rewrite.
+    Each other line is {"user": ..., "entry": {...}}, or a {"user": ..., "deleted": true}
+    tombstone written when an account is deleted.  An in-memory index keeps each
+    user's live lines (history keys and byte offsets in history order, plus result
+    ids), so a user's history is read with a few seeks.  compact() rewrites the log
+    without deleted users' lines.
+    Reads share the log's fcntl lock; appends and rewrites take it exclusively.
+    Writers that touch the counters take the stats.json lock first.
+    """
+
+    def __init__(self, data_path):
+        super().__init__(data_path)
+        self.log_file = os.path.join(data_path, 'results.jsonl')
+        self._lock = threading.RLock()
+        self._index = {}          # username -> ([history keys], [line offsets]) in history order
+        self._ids = {}            # username -> {result id: line offset}
+        self._indexed_size = 0    # bytes of the log covered by the index
+        self._generation = None   # header of the log the index was built from
+        self.dead_lines = 0       # lines compaction would drop
+        # Results are not in a JSON file on this backend
+        del self._files['results']
+
+        with self._file_lock(self.log_file):
+            if not os.path.exists(self.log_file):
+                # First start on this backend: import the existing results.json
+                self._rewrite_log(JSONStorage.load_results(self))
+            self._rebuild_index()
+
+    # Index maintenance
+    def _rebuild_index(self):
+        """Scan the whole log line by line (without holding it in memory)"""
+        with self._lock:
+            self._index = {}
+            self._ids = {}
+            self._indexed_size = 0
+            self.dead_lines = 0
+            self._generation = self._read_generation()
+            self._scan_from(0)
+
+    def _scan_from(self, offset):
+        """Index complete lines from offset to the end of the log"""
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # torn write from a crash (or one still in flight)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"⚠️ Skipping unreadable line at byte {offset} of {self.log_file}")
+                    self.dead_lines += 1
+                else:
+                    self._index_line(record, offset)
+                offset += len(line)
+        self._indexed_size = offset
+
+    def _read_generation(self):
+        with open(self.log_file, 'rb') as f:
+            header = f.readline()
+        return json.loads(header)['generation'] if header.startswith(b'{"generation"') else None
+
+    def _index_line(self, record, offset):
+        if 'generation' in record:
+            return
+        username = record['user']
+        if record.get('deleted'):
+            self.dead_lines += len(self._index.pop(username, ((), ()))[1]) + 1
+            self._ids.pop(username, None)
+            return
+
+        entry = record['entry']
+        keys, offsets = self._index.setdefault(username, ([], []))
+        key = history_key(entry)
+        position = len(keys)
+        if keys and keys[-1] > key:
+            position = bisect_right(keys, key)
+        keys.insert(position, key)
+        offsets.insert(position, offset)
+        self._ids.setdefault(username, {})[result_id(entry)] = offset
+
+    def _sync_index(self):
+        """Pick up lines appended (or a compaction done) by another process"""
+        size = os.path.getsize(self.log_file)
+        if size < self._indexed_size or self._read_generation() != self._generation:
+            self._rebuild_index()
+        elif size > self._indexed_size:
+            self._scan_from(self._indexed_size)
+
+    def _append_line(self, record):
+        line = (json.dumps(record) + '\n').encode()
+        with self._lock, self._file_lock(self.log_file):
+            self._sync_index()
+            with open(self.log_file, 'a+b') as f:
+                offset = f.tell()
+                if offset and os.pread(f.fileno(), 1, offset - 1) != b'\n':
+                    # Terminate a torn last line so it stays separate from ours
+                    f.write(b'\n')
+                    offset += 1
+                    self.dead_lines += 1
+                f.write(line)
+            self._index_line(record, offset)
+            self._indexed_size = offset + len(line)
+
+    def _rewrite_log(self, results):
+        """Atomically replace the log with the given {username: [entries]}"""
+        payloads = {}
+        stored = {username: [compact_entry(entry, payloads) for entry in entries]
+                  for username, entries in results.items()}
+        self._intern_payloads(payloads)
+        tmp_path = self.log_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps({'generation': uuid.uuid4().hex}) + '\n')
+            for username, entries in stored.items():
+                for entry in entries:
+                    f.write(json.dumps({'user': username, 'entry': entry}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_file)
+
+    def _read_lines(self, offsets):
+        with open(self.log_file, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                yield json.loads(f.readline())
+
+    # Results API
+    def load_results(self):
+        with self._lock, self._file_lock(self.log_file, exclusive=False):
+            return self._load_live_results()
+
+    def _load_live_results(self, expand=True):
+        """One streaming pass over the log, keeping only indexed lines (as stored unless `expand`)"""
+        self._sync_index()
+        live = {offset for _, offsets in self._index.values() for offset in offsets}
+        entries = {}
+        with open(self.log_file, 'rb') as f:
+            offset = 0
+            for line in f:
+                if offset in live:
+                    entry = json.loads(line)['entry']
+                    entries[offset] = expand_entry(entry, self._payload, mutable=True) if expand else entry
+                offset += len(line)
+        return {username: [entries[offset] for offset in offsets]
+                for username, (_, offsets) in self._index.items()}
+
+    read_results = load_results
+
+    def load_user_results(self, username):
+        with self._lock, self._file_lock(self.log_file, exclusive=False):
+            self._sync_index()
+            return [expand_entry(record['entry'], self._payload)
+                    for record in self._read_lines(self._index.get(username, ((), ()))[1])]
+
+    def user_history(self, username, before=None, limit=None):
+        """Newest-first page of a user's results past the `before` cursor; returns (entries, next_before)"""
+        with self._lock, self._file_lock(self.log_file, exclusive=False):
+            self._sync_index()
+            keys, offsets = self._index.get(username, ((), ()))
+            start, end, next_before = history_page(keys, before, limit)
+            page = [with_result_id(expand_entry(record['entry'], self._payload))
+                    for record in self._read_lines(offsets[start:end])]
+        return page[::-1], next_before
+
+    def get_user_result(self, username, entry_id):
+        """One of a user's results by its stable id, or None"""
+        with self._lock, self._file_lock(self.log_file, exclusive=False):
+            self._sync_index()
+            offset = self._ids.get(username, {}).get(entry_id)
+            if offset is None:
+                return None
+            return with_result_id(expand_entry(next(self._read_lines([offset]))['entry'], self._payload))
+
+    def save_results(self, results):
+        with self._file_lock(self.stats_file), self._lock, self._file_lock(self.log_file):
+            self._rewrite_log(results)
+            self._rebuild_index()
+            self._write(self.stats_file, compute_stats(results))
+
+    def append_result(self, username, entry):
+        """Add one prediction to a user's history (one appended line)"""
+        payloads = {}
+        entry = compact_entry(entry, payloads)
+        self._intern_payloads(payloads)
+        with self._stats_update() as stats:
+            self._append_line({'user': username, 'entry': entry})
+            add_result_to_stats(stats, username, entry)
+
+    def delete_user_data(self, username):
+        """Tombstone a user's results in the log and remove their medications"""
+        with self._stats_update() as stats, self._lock:
+            self._sync_index()
+            had_results = username in self._index
+            if had_results:
+                self._append_line({'user': username, 'deleted': True})
+            remove_user_from_stats(stats, username)
+
+        with self.transaction('medications') as medications:
+            had_medications = remove_user_medications(medications, username)
+        return had_results, had_medications
+
+    def compact(self, min_dead_lines=1):
+        """
+        Rewrite the log keeping only live lines (drops deleted users' rows and tombstones).
+        Returns the number of lines dropped.
+        """
+        with self._lock, self._file_lock(self.log_file):
+            self._sync_index()
+            if self.dead_lines < min_dead_lines:
+                return 0
+            dropped = self.dead_lines
+            self._rewrite_log(self._load_live_results(expand=False))
+            self._rebuild_index()
+        print(f"🧹 Compacted {self.log_file}: dropped {dropped} lines")
+        return dropped
+
+    def dedupe_recommendations(self):
+        with self._lock, self._file_lock(self.log_file):
+            stored = self._load_live_results(expand=False)
+            changed = sum(compact_entry(entry, {}) is not entry for entries in stored.values() for entry in entries)
+            if changed:
+                self._rewrite_log(stored)
+                self._rebuild_index()
+        return changed
+
+    def rebuild_stats(self):
+        with self._file_lock(self.stats_file):
+            stats = compute_stats(self.load_results())
+            self._write(self.stats_file, stats)
+        return self._read(self.stats_file)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    timestamp TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL,
+    result_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_user_time ON results (username, timestamp);
+
+CREATE TABLE IF NOT EXISTS medications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    med_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_medications_user ON medications (username);
+
+CREATE TABLE IF NOT EXISTS medication_slots (
+    medication INTEGER NOT NULL REFERENCES medications (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    slot TEXT,
+    time TEXT,
+    taken INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    PRIMARY KEY (medication, position)
+);
+CREATE INDEX IF NOT EXISTS idx_medication_slots_due ON medication_slots (taken, time);
+
+CREATE TABLE IF NOT EXISTS result_stats (
+    username TEXT PRIMARY KEY,
+    total_predictions INTEGER NOT NULL DEFAULT 0,
+    high_risk INTEGER NOT NULL DEFAULT 0,
+    medium_risk INTEGER NOT NULL DEFAULT 0,
+    low_risk INTEGER NOT NULL DEFAULT 0,
+    latest_timestamp TEXT,
+    latest_prediction TEXT
+);
+
+CREATE TABLE IF NOT EXISTS recommendations (
+    ref TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+
+class SQLiteStorage:
+    """
+    SQLite storage with one row per user, result and medication slot.
+    Records are kept as JSON text next to the indexed columns, so loads
+    return exactly the dicts that were saved.  Admin counters are one
+    result_stats row per user, upserted in the same transaction as each result,
+    and recommendation payloads are rows of a shared table keyed by content hash.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._payloads = {}  # hash -> read-only payload
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            self._add_result_ids(conn)
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if not conn.execute('SELECT 1 FROM result_stats LIMIT 1').fetchone():
+                # Database from before the counters existed (a no-op when it has no results)
+                self._write_stats(conn, compute_stats(self.load_results()))
+
+    def _add_result_ids(self, conn):
+        """Give rows from databases created before stable result ids their id column"""
+        if 'result_id' not in {row[1] for row in conn.execute('PRAGMA table_info(results)')}:
+            conn.execute('ALTER TABLE results ADD COLUMN result_id TEXT')
+        rows = conn.execute('SELECT id, data FROM results WHERE result_id IS NULL').fetchall()
+        conn.executemany('UPDATE results SET result_id = ? WHERE id = ?',
+                         [(result_id(json.loads(data)), row_id) for row_id, data in rows])
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_results_user_id ON results (username, result_id)')
+
+    def _connection(self):
+        """One connection per thread (sqlite3 connections can't be shared across threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self, collection):
+        """Locked read-modify-write of one collection (same contract as JSONStorage.transaction)"""
+        loaders = {'users': self.load_users, 'results': self.load_results, 'medications': self.load_medications}
+        savers = {'users': self.save_users, 'results': self.save_results, 'medications': self.save_medications}
+        if collection not in loaders:
+            raise ValueError(f"Unknown collection: {collection!r}")
+        conn = self._connection()
+        # Take the database write lock before reading so concurrent updates can't interleave
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            data = loaders[collection]()
+            yield data
+        except BaseException:
+            conn.rollback()
+            raise
+        savers[collection](data)  # commits
+
+    # Users (including internal keys such as _deleted_uids)
+    def load_users(self):
+        rows = self._connection().execute('SELECT username, data FROM users ORDER BY rowid')
+        return {username: json.loads(data) for username, data in rows}
+
+    read_users = load_users
+
+    def save_users(self, users):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM users')
+            conn.executemany('INSERT INTO users (username, data) VALUES (?, ?)',
+                             [(username, json.dumps(data)) for username, data in users.items()])
+
+    # Prediction results
+    def load_results(self):
+        results = {}
+        rows = self._connection().execute('SELECT username, data FROM results ORDER BY timestamp, id')
+        for username, data in rows:
+            results.setdefault(username, []).append(expand_entry(json.loads(data), self._payload, mutable=True))
+        return results
+
+    read_results = load_results
+
+    def load_user_results(self, username):
+        rows = self._connection().execute(
+            'SELECT data FROM results WHERE username = ? ORDER BY timestamp, id', (username,))
+        return [expand_entry(json.loads(data), self._payload) for (data,) in rows]
+
+    def user_history(self, username, before=None, limit=None):
+        """Newest-first page of a user's results past the `before` cursor; returns (entries, next_before)"""
+        query = 'SELECT data FROM results WHERE username = ?'
+        params = [username]
+        if before:
+            timestamp, entry_id = parse_history_cursor(before)
+            query += ' AND (timestamp < ? OR (timestamp = ? AND result_id < ?))'
+            params += [timestamp, timestamp, entry_id]
+        # One extra row tells whether an older page exists
+        query += ' ORDER BY timestamp DESC, result_id DESC, id DESC LIMIT ?'
+        params.append(limit + 1 if limit else -1)
+        page = [with_result_id(expand_entry(json.loads(data), self._payload))
+                for (data,) in self._connection().execute(query, params)]
+        if limit and len(page) > limit:
+            page = page[:limit]
+            return page, history_cursor(history_key(page[-1]))
+        return page, None
+
+    def get_user_result(self, username, entry_id):
+        """One of a user's results by its stable id, or None"""
+        row = self._connection().execute(
+            'SELECT data FROM results WHERE username = ? AND result_id = ?', (username, entry_id)).fetchone()
+        return with_result_id(expand_entry(json.loads(row[0]), self._payload)) if row else None
+
+    @staticmethod
+    def _result_row(username, entry):
+        return username, entry.get('timestamp', ''), json.dumps(entry), result_id(entry)
+
+    def save_results(self, results):
+        payloads = {}
+        rows = [self._result_row(username, compact_entry(entry, payloads))
+                for username, entries in results.items() for entry in entries]
+        with self._connection() as conn:
+            self._insert_payloads(conn, payloads)
+            conn.execute('DELETE FROM results')
+            conn.executemany('INSERT INTO results (username, timestamp, data, result_id) VALUES (?, ?, ?, ?)', rows)
+            self._write_stats(conn, compute_stats(results))
+
+    def append_result(self, username, entry):
+        """Add one prediction to a user's history (an INSERT plus a counter upsert)"""
+        counters = new_counters()
+        count_result(counters, entry)
+        latest = counters['latest_prediction']
+        payloads = {}
+        entry = compact_entry(entry, payloads)
+        with self._connection() as conn:
+            self._insert_payloads(conn, payloads)
+            conn.execute('INSERT INTO results (username, timestamp, data, result_id) VALUES (?, ?, ?, ?)',
+                         self._result_row(username, entry))
+            conn.execute(
+                'INSERT INTO result_stats (username, total_predictions, high_risk, medium_risk, low_risk, '
+                'latest_timestamp, latest_prediction) VALUES (?, 1, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (username) DO UPDATE SET '
+                'total_predictions = total_predictions + 1, '
+                'high_risk = high_risk + excluded.high_risk, '
+                'medium_risk = medium_risk + excluded.medium_risk, '
+                'low_risk = low_risk + excluded.low_risk, '
+                'latest_prediction = CASE WHEN excluded.latest_timestamp >= latest_timestamp '
+                'THEN excluded.latest_prediction ELSE latest_prediction END, '
+                'latest_timestamp = max(latest_timestamp, excluded.latest_timestamp)',
+                (username, counters['high_risk'], counters['medium_risk'], counters['low_risk'],
+                 latest['timestamp'], json.dumps(latest)))
+
+    # Shared recommendation payloads
+    def _payload(self, ref):
+        payload = self._payloads.get(ref)
+        if payload is None:
+            row = self._connection().execute('SELECT data FROM recommendations WHERE ref = ?', (ref,)).fetchone()
+            if row is None:
+                raise ValueError(f"Stored result refers to recommendation payload {ref}, "
+                                 f"which is missing from the recommendations table")
+            payload = self._payloads[ref] = freeze(json.loads(row[0]))
+        return payload
+
+    def _insert_payloads(self, conn, payloads):
+        conn.executemany('INSERT OR IGNORE INTO recommendations (ref, data) VALUES (?, ?)',
+                         [(ref, json.dumps(payload)) for ref, payload in payloads.items() if ref not in self._payloads])
+
+    def dedupe_recommendations(self):
+        """Move the payloads of results stored before deduplication into the shared table"""
+        payloads = {}
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            updates = []
+            for row_id, data in conn.execute('SELECT id, data FROM results').fetchall():
+                entry = json.loads(data)
+                compact = compact_entry(entry, payloads)
+                if compact is not entry:
+                    updates.append((json.dumps(compact), row_id))
+            self._insert_payloads(conn, payloads)
+            conn.executemany('UPDATE results SET data = ? WHERE id = ?', updates)
+        return len(updates)
+
+    # Admin counters (the totals are summed over the per-user rows)
+    def read_stats(self):
+        stats = {'users': {}, 'totals': new_counters()}
+        totals = stats['totals']
+        rows = self._connection().execute(
+            'SELECT username, total_predictions, high_risk, medium_risk, low_risk, latest_prediction '
+            'FROM result_stats ORDER BY username')
+        for username, total, high, medium, low, latest in rows:
+            counters = {'total_predictions': total, 'high_risk': high, 'medium_risk': medium, 'low_risk': low,
+                        'latest_prediction': json.loads(latest) if latest else None}
+            stats['users'][username] = counters
+            for name in ('total_predictions', *RISK_COUNTERS.values()):
+                totals[name] += counters[name]
+            if latest and (totals['latest_prediction'] is None
+                           or counters['latest_prediction']['timestamp'] >= totals['latest_prediction']['timestamp']):
+                totals['latest_prediction'] = counters['latest_prediction']
+        return stats
+
+    def rebuild_stats(self):
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._write_stats(conn, compute_stats(self.load_results()))
+        return self.read_stats()
+
+    @staticmethod
+    def _write_stats(conn, stats):
+        conn.execute('DELETE FROM result_stats')
+        conn.executemany(
+            'INSERT INTO result_stats (username, total_predictions, high_risk, medium_risk, low_risk, '
+            'latest_timestamp, latest_prediction) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(username, c['total_predictions'], c['high_risk'], c['medium_risk'], c['low_risk'],
+              c['latest_prediction']['timestamp'], json.dumps(c['latest_prediction']))
+             for username, c in stats['users'].items()])
+
+    # Medications (schedules are stored one row per slot)
+    def load_medications(self):
+        conn = self._connection()
+        slots = {}
+        for medication, data in conn.execute(
+                'SELECT medication, data FROM medication_slots ORDER BY medication, position'):
+            slots.setdefault(medication, []).append(json.loads(data))
+
+        medications = {}
+        for row_id, username, data in conn.execute('SELECT id, username, data FROM medications ORDER BY id'):
+            med = json.loads(data)
+            med['schedule'] = slots.get(row_id, [])
+            medications.setdefault(username, []).append(med)
+        return medications
+
+    def read_medications(self):
+        """
+        Read-only medications, re-loaded only when another connection committed
+        since this thread's last read (PRAGMA data_version); this connection's own
+        writes drop the cached copy.
+        """
+        version = self._connection().execute('PRAGMA data_version').fetchone()[0]
+        cached = getattr(self._local, 'medications', None)
+        if cached and cached[0] == version:
+            return cached[1]
+        medications = freeze(self.load_medications())
+        self._local.medications = (version, medications)
+        return medications
+
+    def save_medications(self, medications):
+        self._local.medications = None
+        with self._connection() as conn:
+            conn.execute('DELETE FROM medications')
+            for username, user_meds in medications.items():
+                for med in user_meds:
+                    self._insert_medication(conn, username, med)
+
+    def _insert_medication(self, conn, username, med):
+        schedule = med.get('schedule', [])
+        # Slots live in their own rows; the placeholder keeps the key's position in the dict
+        fields = dict(med, schedule=[])
+        row_id = conn.execute('INSERT INTO medications (username, med_id, data) VALUES (?, ?, ?)',
+                              (username, med.get('id'), json.dumps(fields))).lastrowid
+        conn.executemany(
+            'INSERT INTO medication_slots (medication, position, slot, time, taken, data) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(row_id, position, slot.get('slot'), slot.get('time'), int(bool(slot.get('taken'))), json.dumps(slot))
+             for position, slot in enumerate(schedule)])
+
+    def delete_user_data(self, username):
+        """Remove a user's results and medications; returns (had_results, had_medications)"""
+        self._local.medications = None
+        with self._connection() as conn:
+            had_results = conn.execute('DELETE FROM results WHERE username = ?', (username,)).rowcount > 0
+            conn.execute('DELETE FROM result_stats WHERE username = ?', (username,))
+            had_medications = conn.execute('DELETE FROM medications WHERE username = ?', (username,)).rowcount > 0
+        return had_results, had_medications
+
+
+def get_storage(backend, data_path, db_path=None):
+    """Storage instance for STORAGE_BACKEND ('json', 'jsonl' or 'sqlite')"""
+    if backend == 'json':
+        return JSONStorage(data_path)
+    if backend == 'jsonl':
+        return JSONLResultsStorage(data_path)
+    if backend == 'sqlite':
+        return SQLiteStorage(db_path or os.path.join(data_path, 'stroke_app.db'))
+    raise ValueError(f"Unknown storage backend: {backend!r} (expected 'json', 'jsonl' or 'sqlite')")
+
+
+def migrate_json_to_sqlite(data_path, db_path):
+    """
+    One-shot copy of the JSON files into a SQLite database.
+    Existing rows in the database are replaced; the JSON files are left untouched.
+    """
+    source = JSONStorage(data_path)
+    target = SQLiteStorage(db_path)
+
+    users = source.load_users()
+    results = source.load_results()
+    medications = source.load_medications()
+    target.save_users(users)
+    target.save_results(results)
+    target.save_medications(medications)
+
+    # Read everything back; users without medications are not kept as empty lists
+    assert target.load_users() == users, "users differ after migration"
+    by_time = {u: sorted(r, key=lambda entry: entry.get('timestamp', '')) for u, r in results.items() if r}
+    assert target.load_results() == by_time, "results differ after migration"
+    assert target.load_medications() == {u: m for u, m in medications.items() if m}, \
+        "medications differ after migration"
+
+    n_medications = sum(map(len, medications.values()))
+    print(f"✅ Migrated {len(users)} users, {sum(map(len, results.values()))} results and "
+          f"{n_medications} medications into {db_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Storage maintenance')
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help='Copy data/*.json into a SQLite database')
+    migrate.add_argument('--data', default='data', help='Directory with the JSON files')
+    migrate.add_argument('--db', default=os.path.join('data', 'stroke_app.db'), help='SQLite database path')
+    compact = commands.add_parser('compact', help='Drop deleted users from data/results.jsonl')
+    compact.add_argument('--data', default='data', help='Directory with the results log')
+    rebuild = commands.add_parser('rebuild-stats', help='Recompute the admin counters from the stored results')
+    rebuild.add_argument('--backend', default='json', choices=['json', 'jsonl', 'sqlite'], help='Storage backend')
+    rebuild.add_argument('--data', default='data', help='Data directory')
+    rebuild.add_argument('--db', default=None, help='SQLite database path (sqlite backend)')
+    dedupe = commands.add_parser('dedupe', help='Store recommendation payloads of older results once, by hash')
+    dedupe.add_argument('--backend', default='json', choices=['json', 'jsonl', 'sqlite'], help='Storage backend')
+    dedupe.add_argument('--data', default='data', help='Data directory')
+    dedupe.add_argument('--db', default=None, help='SQLite database path (sqlite backend)')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate_json_to_sqlite(args.data, args.db)
+    elif args.command == 'compact':
+        JSONLResultsStorage(args.data).compact()
+    elif args.command == 'dedupe':
+        changed = get_storage(args.backend, args.data, args.db).dedupe_recommendations()
+        print(f"✅ Moved recommendation payloads of {changed} results into the shared table")
+    elif args.command == 'rebuild-stats':
+        totals = get_storage(args.backend, args.data, args.db).rebuild_stats()['totals']
+        print(f"✅ Rebuilt admin counters: {totals['total_predictions']} predictions, "
+              f"{totals['high_risk']} high risk")
@@ -0,0 +1,243 @@
+"""
+Compiled evaluator for the GradientBoosting stroke models
+Flattens the fitted trees into contiguous NumPy arrays and scores every tree
+for every row in one vectorized traversal, matching sklearn's predict_proba bit for bit
+"""
+
+import joblib
+import numpy as np
+from scipy.special import expit
+from sklearn.ensemble import GradientBoostingClassifier
+
+# Rows traversed together; larger batches are processed in chunks of this size
+ROW_CHUNK = 256
+
+# From this batch size on, sklearn's compiled Cython traversal beats the NumPy one
+# (when the source model is available, large batches are handed to it)
+NATIVE_MIN_ROWS = 512
+
+
+def _flatten_tree(tree, depth):
+    """
+    Re-lay a fitted sklearn tree as a perfect binary tree of the given depth.
+
+    Internal nodes use heap order (children of node i are 2i+1 and 2i+2), so the
+    traversal needs no child lookups.  Leaves shallower than `depth` are padded
+    with pass-through splits (threshold +inf) that lead to copies of the leaf value.
+    Returns (feature, threshold, leaf_value) with 2**depth - 1 splits and 2**depth leaves.
+    """
+    n_internal = 2 ** depth - 1
+    feature = np.zeros(n_internal, dtype=np.intp)
+    threshold = np.full(n_internal, np.inf)
+    leaf_value = np.empty(2 ** depth)
+
+    stack = [(0, 0, 0)]  # (sklearn node, heap position, level)
+    while stack:
+        node, pos, level = stack.pop()
+        left = tree.children_left[node]
+        if left == -1:
+            # Leaf: every heap leaf below this position gets its value
+            span = 2 ** (depth - level)
+            first = (pos + 1) * span - 1 - n_internal
+            leaf_value[first:first + span] = tree.value[node, 0, 0]
+            continue
+        feature[pos] = tree.feature[node]
+        threshold[pos] = tree.threshold[node]
+        stack.append((left, 2 * pos + 1, level + 1))
+        stack.append((tree.children_right[node], 2 * pos + 2, level + 1))
+
+    return feature, threshold, leaf_value
+
+
+class CompiledTreeEnsemble:
+    """
+    A binary GradientBoostingClassifier flattened into contiguous arrays:
+    feature index and threshold per split, value per leaf, one row per tree.
+    """
+
+    def __init__(self, feature, threshold, leaf_value, init_raw, n_features, source_model=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.leaf_value = np.ascontiguousarray(leaf_value, dtype=np.float64)
+        self.init_raw = float(init_raw)
+        self.n_features = n_features
+        self.source_model = source_model
+        self.n_trees, n_internal = self.feature.shape
+        self.depth = int(np.log2(n_internal + 1))
+        # Offsets of each tree's first split / first leaf in the flat arrays
+        self._split_offset = (np.arange(self.n_trees) * n_internal)[None, :]
+        self._leaf_offset = (np.arange(self.n_trees) * (n_internal + 1))[None, :]
+
+    @classmethod
+    def from_sklearn(cls, model, depth=None):
+        """
+        Compile a fitted binary GradientBoostingClassifier (log_loss).
+        `depth` pads every tree to at least that depth (used to fuse ensembles).
+        """
+        if not isinstance(model, GradientBoostingClassifier):
+            raise TypeError(f"Expected a GradientBoostingClassifier, got {type(model).__name__}")
+        if model.n_trees_per_iteration_ != 1 or model.loss != 'log_loss':
+            raise ValueError("Only binary GradientBoostingClassifier models with log_loss are supported")
+
+        trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+        depth = max(max(tree.max_depth for tree in trees), depth or 1)
+        flat = [_flatten_tree(tree, depth) for tree in trees]
+
+        # sklearn adds learning_rate * leaf value per stage; pre-scaling gives the same product
+        leaf_value = np.stack([f[2] for f in flat]) * model.learning_rate
+
+        # The init estimator (class prior) contributes the same raw score to every row
+        init_raw = model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0, 0]
+
+        return cls(
+            feature=np.stack([f[0] for f in flat]),
+            threshold=np.stack([f[1] for f in flat]),
+            leaf_value=leaf_value,
+            init_raw=init_raw,
+            n_features=model.n_features_in_,
+            source_model=model
+        )
+
+    def validate(self, X):
+        """
+        Check and convert input once: 2-D, the expected width, finite in float32.
+        Trees compare float32 feature values (as sklearn does) against float64 thresholds.
+        """
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected an array of shape (n_samples, {self.n_features}), got {X.shape}")
+        X = X.astype(np.float32).astype(np.float64)
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN or infinity")
+        return X
+
+    def leaf_values(self, X):
+        """Leaf contribution of every tree for every row of validated X, shape (n_samples, n_trees)"""
+        if X.shape[0] > ROW_CHUNK:
+            # Keep the per-level working set cache-sized for large batches
+            return np.vstack([self.leaf_values(X[start:start + ROW_CHUNK])
+                              for start in range(0, X.shape[0], ROW_CHUNK)])
+
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+        row_offset = (np.arange(n_rows) * self.n_features)[:, None]
+        feature = self.feature.ravel()
+        threshold = self.threshold.ravel()
+
+        node = np.zeros((n_rows, self.n_trees), dtype=np.intp)
+        for _ in range(self.depth):
+            split = node + self._split_offset
+            go_right = flat_X[row_offset + feature[split]] > threshold[split]
+            node *= 2
+            node += 1
+            node += go_right
+
+        return self.leaf_value.ravel()[node - (2 ** self.depth - 1) + self._leaf_offset]
+
+    def raw_from_leaves(self, leaves):
+        """Sum stage contributions in stage order, exactly like sklearn's predict_stages"""
+        stages = np.empty((leaves.shape[0], leaves.shape[1] + 1))
+        stages[:, 0] = self.init_raw
+        stages[:, 1:] = leaves
+        return np.cumsum(stages, axis=1)[:, -1]
+
+    def raw_predict(self, X):
+        """Raw (log-odds) scores, same as the sklearn model's decision_function"""
+        X = self.validate(X)
+        if self.source_model is not None and X.shape[0] >= NATIVE_MIN_ROWS:
+            return self.source_model._raw_predict(X.astype(np.float32))[:, 0]
+        return self.raw_from_leaves(self.leaf_values(X))
+
+    def predict_proba(self, X):
+        """Class probabilities, shape (n_samples, 2), identical to the sklearn model's"""
+        return _two_class(expit(self.raw_predict(X)))
+
+
+def _two_class(positive):
+    """Stack positive-class probabilities into sklearn's (n_samples, 2) layout"""
+    proba = np.empty((positive.shape[0], 2))
+    proba[:, 1] = positive
+    proba[:, 0] = 1 - positive
+    return proba
+
+
+class FusedEnsemble:
+    """
+    Several compiled models scored together.
+
+    All member trees are stacked into one CompiledTreeEnsemble, so the input is
+    validated and converted once and every tree of every member is evaluated in
+    a single traversal.  Each member's stages are then summed separately (keeping
+    its probabilities identical to its own predict_proba) and the ensemble
+    probability is the weighted mean of the members.
+    """
+
+    def __init__(self, members, weights=None):
+        if not members:
+            raise ValueError("A fused ensemble needs at least one member")
+        n_features = {compiled.n_features for compiled in members.values()}
+        if len(n_features) != 1:
+            raise ValueError("All ensemble members must use the same features")
+        depth = {compiled.depth for compiled in members.values()}
+        if len(depth) != 1:
+            raise ValueError("All ensemble members must be compiled to the same depth")
+
+        self.members = dict(members)
+        self.names = list(self.members)
+        weights = weights or {}
+        self.weights = {name: float(weights.get(name, 1.0)) for name in self.names}
+        if min(self.weights.values()) < 0 or sum(self.weights.values()) <= 0:
+            raise ValueError(f"Ensemble weights must be non-negative with a positive sum, got {self.weights}")
+        self.total_weight = sum(self.weights.values())
+
+        compiled = list(self.members.values())
+        self.stacked = CompiledTreeEnsemble(
+            feature=np.vstack([c.feature for c in compiled]),
+            threshold=np.vstack([c.threshold for c in compiled]),
+            leaf_value=np.vstack([c.leaf_value for c in compiled]),
+            init_raw=0.0,
+            n_features=n_features.pop()
+        )
+        # Column range of each member's trees in the stacked leaf matrix
+        bounds = np.cumsum([0] + [c.n_trees for c in compiled])
+        self.slices = {name: slice(bounds[i], bounds[i + 1]) for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_sklearn(cls, models, weights=None):
+        """Compile a {name: GradientBoostingClassifier} mapping to one shared depth"""
+        depth = max(estimator.tree_.max_depth for model in models.values()
+                    for estimator in model.estimators_[:, 0])
+        return cls({name: CompiledTreeEnsemble.from_sklearn(model, depth=depth)
+                    for name, model in models.items()}, weights)
+
+    def raw_predict(self, X):
+        """Raw scores per member, {name: array of shape (n_samples,)}"""
+        X = self.stacked.validate(X)
+        if X.shape[0] >= NATIVE_MIN_ROWS and all(c.source_model is not None for c in self.members.values()):
+            X32 = X.astype(np.float32)
+            return {name: c.source_model._raw_predict(X32)[:, 0] for name, c in self.members.items()}
+
+        leaves = self.stacked.leaf_values(X)
+        return {name: c.raw_from_leaves(leaves[:, self.slices[name]]) for name, c in self.members.items()}
+
+    def predict(self, X):
+        """
+        Positive-class probability of every member plus the weighted 'ensemble'
+        mean, {name: array of shape (n_samples,)}
+        """
+        probs = {name: expit(raw) for name, raw in self.raw_predict(X).items()}
+        weighted = sum(self.weights[name] * probs[name] for name in self.names)
+        probs['ensemble'] = weighted / self.total_weight
+        return probs
+
+
+def load_compiled_model(path):
+    """Load a pickled GradientBoostingClassifier and compile it; returns (model, compiled)"""
+    model = joblib.load(path)
+    return model, CompiledTreeEnsemble.from_sklearn(model)
+
+
+def load_fused_ensemble(paths, weights=None):
+    """Load {name: pickle path} models and fuse them; returns ({name: model}, FusedEnsemble)"""
+    models = {name: joblib.load(path) for name, path in paths.items()}
+    return models, FusedEnsemble.from_sklearn(models, weights)